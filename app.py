@@ -1,9 +1,20 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-import json
+import math
 import os
-from datetime import datetime, timedelta
-import re
+import time
+import zlib
+
+import metrics
+import serving
+from arabic import normalize_arabic
+from incident_cache import IncidentCache
+from incident_store import IncidentStore
+from location_index import LazyLocations, load_locations
+from regions import load_regions
+from search_index import SearchIndex
+from spatial_index import GridIndex, parse_bbox, parse_point, valid_point
+from tiles import TileSet
 
 app = Flask(__name__)
 CORS(app)
@@ -11,8 +22,30 @@ CORS(app)
 # -----------------------------
 # CONFIG
 # -----------------------------
-INCIDENTS_FILE = "matched_incidents.json"
-GEOJSON_FOLDER = r"C:\Users\user\OneDrive - Lebanese University\Documents\GitHub\Incident_Project\geojson_output"
+INCIDENTS_FILE = "matched_incidents.json"  # legacy array, read before the store segments
+INCIDENTS_DIR = "incidents"
+GEOJSON_FOLDER = os.environ.get("GEOJSON_FOLDER", r"C:\Users\user\OneDrive - Lebanese University\Documents\GitHub\Incident_Project\geojson_output")
+LOCATION_INDEX_FILE = "location_index.bin"
+# "1": when the index needs a rebuild, start serving from the priority layers
+# (places, natural, water) and swap in the rest once they are parsed
+LOCATIONS_LAZY = os.environ.get("LOCATIONS_LAZY", "0") == "1"
+INCIDENTS_HOURS_WINDOW = 0.5
+SSE_POLL_INTERVAL = 0.5   # seconds between store checks per stream
+SSE_HEARTBEAT = 15        # seconds of silence before a keep-alive comment
+SSE_RETRY_MS = 3000
+SEARCH_LIMIT = 10          # default /search_location results
+SEARCH_MAX_LIMIT = 50
+NEAR_RADIUS_KM = 5.0        # default radius for ?near=
+PLACES_NEAREST_K = 5
+PLACES_MAX_K = 50
+TILE_CACHE_BYTES = 32 * 1024 * 1024
+TILE_MAX_AGE = 3600         # seconds browsers may reuse a tile
+STATS_MAX_TOP = 100         # /stats by_location entries
+PROFILE_ALLOWED = {"127.0.0.1", "::1"}   # clients that may switch the profiler on and off
+# "0": Flask's own JSON encoder (ASCII-escaped) instead of serving.dumps
+FAST_JSON = os.environ.get("FAST_JSON", "1") == "1"
+# Encoded /incidents bodies and compressed responses, keyed by ETag; 0 turns the cache off
+RESPONSE_CACHE_BYTES = int(os.environ.get("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
 
 ALLOWED_INCIDENTS = {
     "fire", "protest", "vehicle_accident", "shooting",
@@ -28,83 +61,59 @@ INCIDENT_COLORS = {
 }
 
 # -----------------------------
-# Arabic normalization
+# Load GeoJSON locations
 # -----------------------------
-RE_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u06D6-\u06ED]+")
-
-def normalize_arabic(text: str) -> str:
-    if not text:
-        return ""
-    text = RE_DIACRITICS.sub("", text)
-    text = text.replace('\u0640', '')
-    text = re.sub(r"[إأآا]", "ا", text)
-    text = re.sub(r"[ؤ]", "و", text)
-    text = re.sub(r"[ئ]", "ي", text)
-    text = text.replace('ة', 'ه')
-    text = re.sub(r"[يى]", "ي", text)
-    return re.sub(r"\s+", " ", text).strip()
+def load_all_locations(folder_path):
+    lazy = None
+    try:
+        if LOCATIONS_LAZY:
+            lazy = LazyLocations(folder_path, LOCATION_INDEX_FILE, on_complete=use_locations)
+            locations = lazy.locations
+        else:
+            locations = load_locations(folder_path, LOCATION_INDEX_FILE)
+    except Exception as e:
+        print(f"Error loading locations: {e}")
+        locations = {}
+    use_locations(locations)
+    # Started only now, so the full map cannot be overwritten by the partial one
+    if lazy is not None:
+        lazy.start()
 
-# -----------------------------
-# Load GeoJSON locations robustly
-# -----------------------------
-def flatten_coords(coords):
-    """Recursively flatten nested coordinate lists into a list of [lon, lat] pairs."""
-    if not coords:
-        return []
-    if isinstance(coords[0], (int, float)) and len(coords) == 2:
-        return [coords]
-    flattened = []
-    for c in coords:
-        flattened.extend(flatten_coords(c))
-    return flattened
-
-def extract_centroid(coords):
-    """Compute approximate centroid of polygon/multipolygon."""
-    points = flatten_coords(coords)
-    if not points:
-        return None
-    lon = sum(p[0] for p in points) / len(points)
-    lat = sum(p[1] for p in points) / len(points)
-    return [lon, lat]
+def build_place_index(locations):
+    names = list(locations)
+    index = GridIndex()
+    for i, loc_norm in enumerate(names):
+        coords = locations[loc_norm]["coordinates"]
+        if coords:
+            lon, lat = coords
+            index.insert(i, lat, lon)
+    return names, index
 
+GAZETTEER_LOCATIONS = metrics.gauge("gazetteer_locations", "Names in the location map in use")
 
-def load_all_locations(folder_path):
-    locations = {}
-    for file in os.listdir(folder_path):
-        if not file.lower().endswith(".json"):
-            continue
-        file_path = os.path.join(folder_path, file)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            features = []
-            if isinstance(data, dict):
-                features = data.get("features", [])
-            elif isinstance(data, list):
-                features = data
-            else:
-                continue  # skip unknown format
-            
-            for feat in features:
-                if isinstance(feat, dict):
-                    props = feat.get("properties", feat)
-                    geom = feat.get("geometry", {}) if "geometry" in feat else feat
-                    name = props.get("name")
-                    coords = None
-                    if isinstance(geom, dict) and "coordinates" in geom:
-                        coords = extract_centroid(geom["coordinates"])
-                    if name and coords:
-                        locations[normalize_arabic(name)] = {
-                            "original": name,
-                            "coordinates": coords
-                        }
-        except Exception as e:
-            print(f"Error loading {file}: {e}")
+def use_locations(locations):
+    """Swap in a new location map and the indexes built on it."""
+    global ALL_LOCATIONS, SEARCH_INDEX, PLACES
+    search_index = SearchIndex(locations)
+    places = build_place_index(locations)
+    # The map goes first: the indexes only hand out names that must be in it
+    ALL_LOCATIONS = locations
+    SEARCH_INDEX = search_index
+    PLACES = places   # (names, GridIndex), swapped together
+    GAZETTEER_LOCATIONS.set(len(locations))
     print(f"Loaded {len(locations)} Arabic locations from folder.")
-    return locations
 
-ALL_LOCATIONS = load_all_locations(GEOJSON_FOLDER)
+load_all_locations(GEOJSON_FOLDER)   # sets ALL_LOCATIONS, SEARCH_INDEX, PLACES
+# Admin polygons (ADM0-ADM4) for tagging incidents with their regions; empty without admin layers
+REGIONS = load_regions(GEOJSON_FOLDER)
+# Layer geometry is only loaded on the first tile request
+TILES = TileSet(GEOJSON_FOLDER, cache_bytes=TILE_CACHE_BYTES)
+INCIDENT_STORE = IncidentStore(INCIDENTS_DIR, legacy_path=INCIDENTS_FILE)
+
+metrics.counter("tile_cache_lookups_total", "Rendered tile cache lookups by result", ["result"],
+                callback=lambda: {("hit",): TILES.stats()["hits"], ("miss",): TILES.stats()["misses"]})
+metrics.gauge("tile_cache_bytes", "Bytes of rendered tiles kept in memory",
+              callback=lambda: {(): TILES.stats()["bytes"]})
 
 # -----------------------------
 # Incident type helpers
@@ -112,42 +121,100 @@ ALL_LOCATIONS = load_all_locations(GEOJSON_FOLDER)
 def normalize_incident_type(incident_type: str) -> str:
     return incident_type if incident_type in ALLOWED_INCIDENTS else "other"
 
+def prepare_incident(inc):
+    # Normalize type
+    inc_type = normalize_incident_type(inc.get("incident_type", "other"))
+    inc["incident_type"] = inc_type
+    # Add color
+    inc["color"] = INCIDENT_COLORS.get(inc_type, "white")
+    # Fix coordinates for Leaflet
+    coords = inc.get("coordinates")
+    if coords and isinstance(coords, list) and len(coords) == 2:
+        lon, lat = coords
+        inc["coordinates"] = [lat, lon]
+        # Records stored before region tagging (or before the admin layers were added)
+        if REGIONS and not inc.get("regions"):
+            inc["regions"] = REGIONS.lookup(lat, lon)
+    else:
+        inc["coordinates"] = []
+    return inc
+
+def incident_point(inc):
+    # prepare_incident has already put the coordinates in [lat, lon] order
+    return inc["coordinates"] or None
+
+# Records are normalized once, when they first reach the cache
+INCIDENT_CACHE = IncidentCache(INCIDENT_STORE, prepare_incident, locate=incident_point,
+                               cluster_hours=INCIDENTS_HOURS_WINDOW)
+metrics.gauge("incident_cache_records", "Records held by the incident cache",
+              callback=lambda: {(): len(INCIDENT_CACHE.records)})
+
+# -----------------------------
+# Metrics
+# -----------------------------
+HTTP_SECONDS = metrics.histogram("http_request_seconds", "Time to build a response, per endpoint", ["endpoint"])
+HTTP_RESPONSE_BYTES = metrics.histogram("http_response_bytes", "Response body size, per endpoint",
+                                        ["endpoint"], buckets=metrics.SIZE_BUCKETS)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streams (SSE) stay open for minutes; their duration says nothing about latency
+    start = g.pop("request_start", None)
+    if start is not None and not response.is_streamed:
+        endpoint = request.endpoint or "unknown"
+        HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        HTTP_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+    return response
+
+# -----------------------------
+# Response encoding
+# -----------------------------
+if FAST_JSON:
+    app.json = serving.JSONProvider(app)
+RESPONSE_CACHE = serving.BodyCache(RESPONSE_CACHE_BYTES) if RESPONSE_CACHE_BYTES > 0 else None
+
+def json_body(obj):
+    return serving.dumps(obj) if FAST_JSON else app.json.dumps(obj).encode("utf-8")
+
+# Registered after record_request, so it runs first and the size histogram sees the bytes sent
+@app.after_request
+def compress(response):
+    key = g.pop("body_key", None) or request.endpoint
+    return serving.compress_response(response, request.accept_encodings, RESPONSE_CACHE, key)
+
+if RESPONSE_CACHE is not None:
+    metrics.counter("response_cache_lookups_total", "Encoded body cache lookups by result", ["result"],
+                    callback=lambda: {("hit",): RESPONSE_CACHE.hits, ("miss",): RESPONSE_CACHE.misses})
+    metrics.gauge("response_cache_bytes", "Bytes of encoded bodies kept in memory",
+                  callback=lambda: {(): RESPONSE_CACHE.bytes})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/debug/profile", methods=["GET"])
+def debug_profile():
+    """?action=start[&interval=S]|stop|status switches the sampling profiler; no action returns its stacks."""
+    if request.remote_addr not in PROFILE_ALLOWED:
+        return jsonify({"error": "profiler is only available from localhost"}), 403
+    action = request.args.get("action")
+    if action is None:
+        return Response(metrics.PROFILER.report(request.args.get("limit", type=int)), mimetype="text/plain")
+    try:
+        return jsonify(metrics.profiler_control(action, request.args.get("interval")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 def load_incidents(hours_window: float = None):
-    incidents = []
-    if os.path.exists(INCIDENTS_FILE):
-        try:
-            with open(INCIDENTS_FILE, "r", encoding="utf-8") as f:
-                incidents = json.load(f)
-            now = datetime.utcnow()
-            filtered_incidents = []
-            for inc in incidents:
-                # Normalize type
-                inc_type = normalize_incident_type(inc.get("incident_type", "other"))
-                inc["incident_type"] = inc_type
-                # Add color
-                inc["color"] = INCIDENT_COLORS.get(inc_type, "white")
-                # Fix coordinates for Leaflet
-                coords = inc.get("coordinates")
-                if coords and isinstance(coords, list) and len(coords) == 2:
-                    lon, lat = coords
-                    inc["coordinates"] = [lat, lon]
-                else:
-                    inc["coordinates"] = []
-                # Filter by time
-                if hours_window is not None:
-                    date_str = inc.get("date")
-                    try:
-                        inc_time = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
-                        if now - inc_time <= timedelta(hours=hours_window):
-                            filtered_incidents.append(inc)
-                    except Exception:
-                        filtered_incidents.append(inc)
-                else:
-                    filtered_incidents.append(inc)
-            return filtered_incidents
-        except Exception as e:
-            print(f"Error loading incidents: {e}")
-    return incidents
+    try:
+        return INCIDENT_CACHE.window(hours_window)[0]
+    except Exception as e:
+        print(f"Error loading incidents: {e}")
+        return []
 
 # -----------------------------
 # Search location by text
@@ -158,33 +225,213 @@ def search_location():
     if not query:
         return jsonify({"found": False})
     
-    norm_query = normalize_arabic(query)
-    best_match = None
-    for loc_norm, loc_data in ALL_LOCATIONS.items():
-        if norm_query in loc_norm:
-            best_match = loc_data
-            break
-    if best_match:
-        return jsonify({
-            "found": True,
-            "name": best_match["original"],
-            "coordinates": best_match["coordinates"]
-        })
-    return jsonify({"found": False})
+    limit = min(max(request.args.get("limit", SEARCH_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+    results = [
+        {"name": ALL_LOCATIONS[loc_norm]["original"], "coordinates": ALL_LOCATIONS[loc_norm]["coordinates"]}
+        for loc_norm, _, _ in SEARCH_INDEX.search(normalize_arabic(query), limit)
+    ]
+    if not results:
+        return jsonify({"found": False, "results": []})
+    # The best match stays at the top level for existing callers
+    return jsonify({"found": True, **results[0], "results": results})
 
 # -----------------------------
 # Get incidents
 # -----------------------------
+def area_args(args):
+    """bbox=min_lon,min_lat,max_lon,max_lat or near=lat,lon&radius=KM, and region=PCODE|NAME
+    -> snapshot() kwargs.
+
+    Raises ValueError for a malformed area.
+    """
+    area = {}
+    if args.get("region", "").strip():
+        area["region"] = args["region"]
+    if "bbox" in args:
+        area["bbox"] = parse_bbox(args["bbox"])
+        if area["bbox"] is None:
+            raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    elif "near" in args:
+        area["near"] = parse_point(args["near"])
+        area["radius_km"] = args.get("radius", NEAR_RADIUS_KM, type=float)
+        if area["near"] is None or not (0 < area["radius_km"] < math.inf):
+            raise ValueError("near must be lat,lon and radius a positive number of km")
+    return area
+
 @app.route("/incidents", methods=["GET"])
 def get_incidents():
-    return jsonify({"incidents": load_incidents(hours_window=0.5)})
+    since = request.args.get("since", type=int)
+    if since is not None and since < 0:
+        return jsonify({"error": "since must be a cursor >= 0"}), 400
+    try:
+        area = area_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if since is not None:
+            return jsonify(incident_delta(since, **area))
+        incidents, etag, cursor = INCIDENT_CACHE.snapshot(hours_window=INCIDENTS_HOURS_WINDOW, **area)
+    except Exception as e:
+        print(f"Error loading incidents: {e}")
+        return jsonify({"incidents": []})
+    # Unchanged polls get a 304 without re-serializing anything
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        # Same query and ETag (store version and window start), same body: encode it once.
+        # The ETag only has a checksum of the area, so the area itself is part of the key
+        g.body_key = ("incidents", INCIDENTS_HOURS_WINDOW, area.get("bbox"), area.get("near"),
+                      area.get("radius_km"), area.get("region"), etag)
+        build = lambda: json_body({"incidents": incidents, "cursor": cursor})
+        body = RESPONSE_CACHE.fetch(g.body_key, build) if RESPONSE_CACHE is not None else build()
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.last_modified = INCIDENT_CACHE.last_modified
+    return response
+
+def incident_delta(since, refresh=True, **area):
+    incidents, cursor = INCIDENT_CACHE.since(since, hours_window=INCIDENTS_HOURS_WINDOW, refresh=refresh, **area)
+    if incidents is None:
+        return {"incidents": [], "cursor": cursor, "reset": True}
+    return {"incidents": incidents, "cursor": cursor}
+
+@app.route("/incidents/clusters", methods=["GET"])
+def incident_clusters():
+    zoom = request.args.get("zoom", type=int)
+    if zoom is None:
+        return jsonify({"error": "zoom is required"}), 400
+    bbox = None
+    if "bbox" in request.args:
+        bbox = parse_bbox(request.args["bbox"])
+        if bbox is None:
+            return jsonify({"error": "bbox must be min_lon,min_lat,max_lon,max_lat"}), 400
+    try:
+        zoom, clusters, cursor = INCIDENT_CACHE.map_clusters(zoom, bbox)
+    except Exception as e:
+        print(f"Error clustering incidents: {e}")
+        return jsonify({"zoom": zoom, "clusters": []})
+    return jsonify({"zoom": zoom, "clusters": clusters, "cursor": cursor})
+
+@app.route("/incidents/stream", methods=["GET"])
+def stream_incidents():
+    # EventSource sends Last-Event-ID when it reconnects, so resume from there
+    cursor = request.headers.get("Last-Event-ID", type=int)
+    if cursor is None:
+        cursor = request.args.get("since", type=int)
+    if cursor is not None and cursor < 0:
+        return jsonify({"error": "Last-Event-ID / since must be a cursor >= 0"}), 400
+    try:
+        area = area_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if cursor is None:
+        cursor = INCIDENT_CACHE.since(0)[1]
+
+    def events():
+        nonlocal cursor
+        idle = 0.0
+        yield f"retry: {int(SSE_RETRY_MS)}\n\n"
+        while True:
+            INCIDENT_CACHE.refresh()
+            delta = incident_delta(cursor, refresh=False, **area)
+            if delta["incidents"] or delta.get("reset"):
+                cursor = delta["cursor"]
+                yield f"id: {cursor}\nevent: incidents\ndata: {json_body(delta).decode('utf-8')}\n\n"
+                idle = 0.0
+            elif delta["cursor"] != cursor:
+                # New records, all outside the window: just move the cursor
+                cursor = delta["cursor"]
+            elif idle >= SSE_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(SSE_POLL_INTERVAL)
+            idle += SSE_POLL_INTERVAL
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+# -----------------------------
+# Statistics
+# -----------------------------
+@app.route("/stats", methods=["GET"])
+def incident_stats():
+    """Counts per hour or day, by type, location and casualty category, from the rollups.
+
+    ?interval=hour|day, ?since=EPOCH&until=EPOCH or ?hours=N back from now,
+    ?type=INCIDENT_TYPE, ?top=N locations.
+    """
+    since = request.args.get("since", type=int)
+    until = request.args.get("until", type=int)
+    hours = request.args.get("hours", type=float)
+    if hours is not None:
+        # nan, inf and anything that overflows once in seconds would fail in int() below
+        if hours <= 0 or not math.isfinite(hours * 3600):
+            return jsonify({"error": "hours must be a positive number"}), 400
+        since = int(time.time() - hours * 3600)
+    incident_type = request.args.get("type")
+    if incident_type is not None:
+        incident_type = normalize_incident_type(incident_type)
+    top = min(max(request.args.get("top", 10, type=int), 1), STATS_MAX_TOP)
+    try:
+        stats = INCIDENT_CACHE.stats(request.args.get("interval", "day"), since, until, incident_type, top)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stats)
+
+# -----------------------------
+# Nearest places
+# -----------------------------
+@app.route("/places/nearest", methods=["GET"])
+def places_nearest():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+    if not valid_point(lat, lon):
+        return jsonify({"error": "lat must be in [-90, 90] and lon in [-180, 180]"}), 400
+    k = min(max(request.args.get("k", PLACES_NEAREST_K, type=int), 1), PLACES_MAX_K)
+    radius = request.args.get("radius", type=float)
+    if radius is not None and not (0 < radius < math.inf):
+        return jsonify({"error": "radius must be a positive number of km"}), 400
+    place_names, place_index = PLACES
+    places = []
+    for dist, i in place_index.nearest(lat, lon, k, max_km=radius):
+        loc_data = ALL_LOCATIONS[place_names[i]]
+        places.append({
+            "name": loc_data["original"],
+            "coordinates": loc_data["coordinates"],
+            "distance_km": round(dist, 3),
+        })
+    return jsonify({"places": places})
+
+# -----------------------------
+# Layer tiles
+# -----------------------------
+@app.route("/tiles/<int:z>/<int:x>/<int:y>.geojson", methods=["GET"])
+def layer_tile(z, x, y):
+    layers = request.args.get("layers")
+    body = TILES.tile(z, x, y, layers.split(",") if layers else None)
+    if body is None:
+        return jsonify({"error": "tile out of range"}), 404
+    etag = "%08x" % zlib.crc32(body)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/geo+json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_MAX_AGE
+    return response
 
 @app.route("/")
 def index():
-    return "Incident Monitor Backend Running. Use /incidents or /search_location?q=TEXT"
+    return "Incident Monitor Backend Running. Use /incidents, /incidents?since=CURSOR, /incidents/stream, /incidents/clusters?zoom=Z&bbox=W,S,E,N, /search_location?q=TEXT&limit=N, /incidents?bbox=W,S,E,N, /incidents?near=LAT,LON&radius=KM, /incidents?region=PCODE|NAME, /places/nearest?lat=LAT&lon=LON&k=N, /tiles/Z/X/Y.geojson?layers=A,B, /stats?interval=hour|day&hours=N&type=T or /metrics"
 
 # -----------------------------
 # Run
 # -----------------------------
+# Development server; serve.py is the production one
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
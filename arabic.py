@@ -0,0 +1,67 @@
+import re
+from functools import lru_cache
+
+import metrics
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+MEMO_MAX_LEN = 64        # strings up to this length are memoized (names, keywords, queries)
+MEMO_SIZE = 1 << 15
+
+# -----------------------------
+# Arabic normalization
+# -----------------------------
+RE_PUNCTUATION = re.compile(r"[^\w\s\u0600-\u06FF]")
+RE_ARABIC = re.compile(r'[\u0600-\u06FF]')
+
+DIACRITIC_RANGES = ((0x0610, 0x061A), (0x064B, 0x065F), (0x06D6, 0x06ED))
+
+# One pass for every character-level rule: diacritics and tatweel are
+# dropped, letter variants folded
+_TABLE = {cp: None for start, end in DIACRITIC_RANGES for cp in range(start, end + 1)}
+_TABLE.update(str.maketrans({
+    "\u0640": None,   # tatweel
+    "إ": "ا", "أ": "ا", "آ": "ا",
+    "ؤ": "و",
+    "ئ": "ي", "ى": "ي",
+    "ة": "ه",
+}))
+
+def _normalize(text):
+    # str.split() and the old re.sub(r"\s+", " ") agree on what whitespace is
+    return " ".join(text.translate(_TABLE).split())
+
+def _normalize_name(text):
+    # Punctuation becomes a space before the whitespace is collapsed
+    return " ".join(RE_PUNCTUATION.sub(" ", text.translate(_TABLE)).split())
+
+_normalize_memo = lru_cache(maxsize=MEMO_SIZE)(_normalize)
+_normalize_name_memo = lru_cache(maxsize=MEMO_SIZE)(_normalize_name)
+
+def normalize_arabic(text: str, strip_punctuation: bool = False) -> str:
+    """Drop diacritics and tatweel, fold letter variants, collapse whitespace.
+
+    strip_punctuation also turns anything that is not a word character,
+    whitespace or Arabic into a space (the shapefile converter's rule).
+    Short strings are memoized; long ones (whole messages) rarely repeat.
+    """
+    if not text:
+        return ""
+    if len(text) <= MEMO_MAX_LEN:
+        return _normalize_name_memo(text) if strip_punctuation else _normalize_memo(text)
+    return _normalize_name(text) if strip_punctuation else _normalize(text)
+
+def is_arabic(text: str) -> bool:
+    return bool(text) and RE_ARABIC.search(text) is not None
+
+def memo_info():
+    return {"plain": _normalize_memo.cache_info()._asdict(),
+            "strip_punctuation": _normalize_name_memo.cache_info()._asdict()}
+
+def _memo_lookups():
+    return {(memo, result): info[field] for memo, info in memo_info().items()
+            for result, field in (("hit", "hits"), ("miss", "misses"))}
+
+metrics.counter("normalize_memo_lookups_total", "normalize_arabic memo lookups",
+                ["memo", "result"], callback=_memo_lookups)
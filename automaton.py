@@ -0,0 +1,79 @@
+from collections import deque
+
+
+# -----------------------------
+# Aho-Corasick automaton
+# -----------------------------
+class AhoCorasick:
+    """Multi-pattern matcher over any sequence of hashable symbols.
+
+    Patterns can be strings (character-level matching) or lists/tuples of
+    tokens (word-level matching). Every occurrence of every pattern is
+    reported in a single pass over the input, overlapping ones included.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._values = []
+        self._lengths = []
+        self._built = False
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, pattern, value=None) -> int:
+        if not pattern:
+            raise ValueError("empty pattern")
+        if self._built:
+            raise RuntimeError("automaton already built")
+        node = 0
+        for sym in pattern:
+            nxt = self._goto[node].get(sym)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][sym] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        pid = len(self._values)
+        self._values.append(value)
+        self._lengths.append(len(pattern))
+        self._out[node].append(pid)
+        return pid
+
+    def build(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for sym, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and sym not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(sym, 0)
+                fail[child] = f
+                # Outputs of the longest proper suffix are outputs here too
+                if out[f]:
+                    out[child] = out[child] + out[f]
+        self._built = True
+        return self
+
+    def iter_matches(self, sequence):
+        """Yield (start, end, value) for every pattern occurrence."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        values, lengths = self._values, self._lengths
+        node = 0
+        for i, sym in enumerate(sequence):
+            while node and sym not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(sym, 0)
+            if out[node]:
+                end = i + 1
+                for pid in out[node]:
+                    yield end - lengths[pid], end, values[pid]
@@ -0,0 +1,178 @@
+"""Replay channel history through the scraper pipeline.
+
+A source yields each channel's messages oldest first, starting after the
+channel's checkpoint. Messages are processed with bounded concurrency and
+the checkpoint is advanced once a whole page is done, so an interrupted
+run resumes where it stopped without skipping anything.
+
+Sources:
+  TelegramSource  client.iter_messages over the channels we are a member of
+  FileSource      a JSONL file of {"channel", "id", "text", "date"} lines,
+                  for offline runs and benchmarks
+
+Usage (through the scraper):
+    python scraper.py --backfill [--from-file messages.jsonl] [--channels a,b]
+                                 [--page-size 500] [--concurrency 8] [--reset]
+"""
+import asyncio
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+CHECKPOINT_FILE = "backfill_checkpoints.json"
+PAGE_SIZE = 500          # messages processed between checkpoints
+CONCURRENCY = 8          # messages in the pipeline at once
+TELEGRAM_WAIT = 1.0      # seconds between history requests, to stay clear of flood waits
+
+# One channel message, independent of where it came from
+Message = namedtuple("Message", "channel id text date")
+
+
+# -----------------------------
+# Checkpoints
+# -----------------------------
+class Checkpoints:
+    """Last fully processed message id per channel, kept in a small JSON file."""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.ids = json.load(f)
+        except (OSError, ValueError):
+            self.ids = {}
+
+    def get(self, channel):
+        return self.ids.get(channel, 0)
+
+    def set(self, channel, msg_id):
+        self.ids[channel] = msg_id
+        self.save()
+
+    def reset(self, channels=None):
+        for channel in list(self.ids if channels is None else channels):
+            self.ids.pop(channel, None)
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+# -----------------------------
+# Sources
+# -----------------------------
+class FileSource:
+    """Messages from a JSONL file, one {"channel", "id", "text", "date"} object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._by_channel = None
+
+    def _load(self):
+        if self._by_channel is None:
+            by_channel = {}
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    msg = Message(str(item["channel"]), int(item["id"]), item.get("text") or "",
+                                  datetime.fromisoformat(item["date"]))
+                    by_channel.setdefault(msg.channel, []).append(msg)
+            for messages in by_channel.values():
+                messages.sort(key=lambda m: m.id)
+            self._by_channel = by_channel
+        return self._by_channel
+
+    async def channels(self):
+        return sorted(self._load())
+
+    async def history(self, channel, min_id=0):
+        for msg in self._load().get(channel, []):
+            if msg.id > min_id:
+                yield msg
+
+def write_messages(path, messages):
+    """Write Message records in the FileSource format."""
+    with open(path, "w", encoding="utf-8") as f:
+        for msg in messages:
+            f.write(json.dumps({"channel": msg.channel, "id": msg.id, "text": msg.text,
+                                "date": msg.date.isoformat()}, ensure_ascii=False) + "\n")
+
+
+class TelegramSource:
+    """History of the given channel entities through a connected TelegramClient."""
+
+    def __init__(self, client, entities, wait_time=TELEGRAM_WAIT):
+        self.client = client
+        self.wait_time = wait_time
+        self.entities = {channel_name(e): e for e in entities}
+
+    async def channels(self):
+        return list(self.entities)
+
+    async def history(self, channel, min_id=0):
+        # The API serves at most 100 messages per request; iter_messages pages
+        # through them, pausing wait_time between requests
+        async for m in self.client.iter_messages(self.entities[channel], min_id=min_id,
+                                                 reverse=True, wait_time=self.wait_time):
+            yield Message(channel, m.id, m.raw_text or "", m.date)
+
+def channel_name(entity):
+    """The name live events are stored under: the username, else the marked peer id."""
+    from telethon.utils import get_peer_id
+    return getattr(entity, "username", None) or str(get_peer_id(entity))
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+async def run_backfill(source, process, checkpoints, channels=None, page_size=PAGE_SIZE,
+                       concurrency=CONCURRENCY, flush=None):
+    """Feed every channel's history after its checkpoint to `process(message)`.
+
+    `flush()`, if given, is awaited before each checkpoint, so a checkpoint
+    never gets ahead of records still waiting to be written.
+    Returns {channel: messages processed}.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(msg):
+        try:
+            await process(msg)
+        except Exception as e:
+            print(f"Error processing message {msg.channel}:{msg.id}: {e}")
+        finally:
+            slots.release()
+
+    done = {}
+    for channel in channels or await source.channels():
+        start = checkpoints.get(channel)
+        count, tasks = 0, []
+        async for msg in source.history(channel, start):
+            # Waiting for a free slot also stops the source from reading ahead
+            await slots.acquire()
+            tasks.append(asyncio.create_task(run(msg)))
+            if len(tasks) >= page_size:
+                await asyncio.gather(*tasks)
+                if flush:
+                    await flush()
+                checkpoints.set(channel, msg.id)
+                count += len(tasks)
+                tasks = []
+        if tasks:
+            await asyncio.gather(*tasks)
+            if flush:
+                await flush()
+            checkpoints.set(channel, msg.id)
+            count += len(tasks)
+        done[channel] = count
+        print(f"[BACKFILL] {channel}: {count} messages after id {start}")
+    return done
@@ -0,0 +1,171 @@
+"""Parity check and throughput benchmark for arabic.normalize_arabic.
+
+The shared normalizer is compared with the three copies it replaced: the
+identical app.py / scraper.py function and convert_shp_to_json.py's
+variant, which also turns punctuation into spaces. Parity is checked on
+every BMP code point on its own, on gazetteer names, keywords and message
+texts, and on random strings mixing Arabic, diacritics, punctuation and
+whitespace. Throughput is reported in characters per second for the old
+regex chain, the translate table without the memo, and the memoized call.
+
+Usage:
+    python bench_arabic.py [--geojson geojson_output] [--incidents matched_incidents.json]
+                           [--fuzz 20000] [--repeat 5] [--seed 1]
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import arabic
+from location_index import iter_features, list_sources
+
+
+# -----------------------------
+# Reference implementations (pre-arabic.py)
+# -----------------------------
+RE_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u06D6-\u06ED]+")
+
+def legacy_normalize(text):
+    # app.py and scraper.py
+    if not text:
+        return ""
+    text = RE_DIACRITICS.sub("", text)
+    text = text.replace('\u0640', '')
+    text = re.sub(r"[إأآا]", "ا", text)
+    text = re.sub(r"[ؤ]", "و", text)
+    text = re.sub(r"[ئ]", "ي", text)
+    text = text.replace('ة', 'ه')
+    text = re.sub(r"[يى]", "ي", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def legacy_normalize_convert(text):
+    # convert_shp_to_json.py
+    if not text:
+        return ""
+    text = RE_DIACRITICS.sub("", text)
+    text = text.replace('\u0640', '')
+    text = re.sub(r"[إأآا]", "ا", text)
+    text = re.sub(r"[ؤ]", "و", text)
+    text = re.sub(r"[ئ]", "ي", text)
+    text = text.replace('ة', 'ه')
+    text = re.sub(r"[يى]", "ي", text)
+    text = re.sub(r"[^\w\s\u0600-\u06FF]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+def legacy_is_arabic(text):
+    if not text:
+        return False
+    return bool(re.search(r'[\u0600-\u06FF]', text))
+
+
+# -----------------------------
+# Corpus
+# -----------------------------
+def message_texts(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            incidents = json.load(f)
+    except (OSError, ValueError):
+        return []
+    texts = []
+    for inc in incidents:
+        details = inc.get("details") or {}
+        if isinstance(details, str):
+            try:
+                details = ast.literal_eval(details)
+            except (ValueError, SyntaxError):
+                details = {}
+        texts.append(details.get("summary") or "")
+        texts.append(inc.get("location") or "")
+    return texts
+
+def keywords(geojson):
+    os.environ["GEOJSON_FOLDER"] = geojson
+    import scraper
+    out = []
+    for table in (scraper.IK.incident_keywords, scraper.IK.casualty_keywords):
+        for kws in table.values():
+            out.extend(kws)
+    return out
+
+def fuzz_strings(n, seed):
+    rng = random.Random(seed)
+    letters = [chr(c) for c in range(0x0621, 0x064B)] + list("إأآؤئىة\u0640")
+    diacritics = [chr(c) for start, end in arabic.DIACRITIC_RANGES for c in range(start, end + 1)]
+    other = list(" \t\n\u00a0\u2009\u3000.,;:!?-_()«»،؛؟\"'/0123456789abcXYZé٠١٢")
+    pools = (letters, letters, diacritics, other)
+    return ["".join(rng.choice(rng.choice(pools)) for _ in range(rng.randint(0, 80))) for _ in range(n)]
+
+
+# -----------------------------
+# Parity
+# -----------------------------
+def check(texts):
+    mismatches = 0
+    pairs = (
+        ("normalize_arabic", legacy_normalize, lambda t: arabic.normalize_arabic(t)),
+        ("strip_punctuation", legacy_normalize_convert, lambda t: arabic.normalize_arabic(t, strip_punctuation=True)),
+        ("is_arabic", legacy_is_arabic, arabic.is_arabic),
+    )
+    for label, old, new in pairs:
+        for t in texts:
+            if old(t) != new(t):
+                mismatches += 1
+                if mismatches <= 10:
+                    print(f"MISMATCH {label}: {t[:40]!r} -> {old(t)[:40]!r} vs {new(t)[:40]!r}")
+    return mismatches
+
+
+def chars_per_sec(fn, texts, repeat):
+    chars = sum(len(t) for t in texts)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for t in texts:
+            fn(t)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return chars / best if best else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--incidents", default="matched_incidents.json")
+    parser.add_argument("--fuzz", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    names = []
+    if os.path.isdir(args.geojson):
+        for fname in list_sources(args.geojson):
+            names.extend(name for name, _ in iter_features(os.path.join(args.geojson, fname)))
+    kws = keywords(args.geojson)
+    messages = [t for t in message_texts(args.incidents) if t]
+    code_points = [chr(c) for c in range(0x10000) if not 0xD800 <= c <= 0xDFFF]
+    fuzz = fuzz_strings(args.fuzz, args.seed)
+
+    mismatches = check(code_points + names + kws + messages + fuzz + ["", None])
+    print(f"parity: {len(code_points)} code points, {len(names)} names, {len(kws)} keywords, "
+          f"{len(messages)} messages, {len(fuzz)} fuzz strings -> {mismatches} mismatches")
+
+    print(f"\n{'corpus':10} {'chars':>9} {'regex chain':>13} {'translate':>13} {'memoized':>13}   (Mchars/s)")
+    for label, texts in (("names", names), ("keywords", kws), ("messages", messages), ("fuzz", fuzz)):
+        if not texts:
+            continue
+        old = chars_per_sec(legacy_normalize, texts, args.repeat)
+        table = chars_per_sec(arabic._normalize, texts, args.repeat)
+        memo = chars_per_sec(arabic.normalize_arabic, texts, args.repeat)
+        print(f"{label:10} {sum(map(len, texts)):9d} {old / 1e6:13.2f} {table / 1e6:13.2f} {memo / 1e6:13.2f}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
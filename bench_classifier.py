@@ -0,0 +1,94 @@
+"""Microbenchmark the compiled keyword classifier against the old per-keyword loops.
+
+Usage:
+    python bench_classifier.py [--geojson geojson_output] [--incidents matched_incidents.json] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+# -----------------------------
+# Reference implementations (pre-classifier scraper)
+# -----------------------------
+def legacy_find_incident_types(text, incident_keywords, normalize_arabic):
+    if not text:
+        return []
+    norm_text = normalize_arabic(text)
+    found = []
+    for inc_type, keywords in incident_keywords.items():
+        for kw in keywords:
+            if normalize_arabic(kw) in norm_text:
+                found.append(inc_type)
+    return list(set(found))
+
+
+def legacy_extract_casualties(text, casualty_keywords):
+    tl = text.lower()
+    cats = []
+    for cat, kws in casualty_keywords.items():
+        for kw in kws:
+            if kw in tl:
+                cats.append(cat)
+    return list(set(cats))
+
+
+def time_it(fn, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for t in texts:
+            fn(t)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--incidents", default="matched_incidents.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["GEOJSON_FOLDER"] = args.geojson
+    import scraper
+    ik = scraper.IK
+
+    with open(args.incidents, 'r', encoding='utf-8') as f:
+        texts = [inc.get("details", {}).get("summary", "") for inc in json.load(f)]
+    # Every keyword on its own as well, so each pattern is exercised at least once
+    for kws in list(ik.incident_keywords.values()) + list(ik.casualty_keywords.values()):
+        texts.extend(kws)
+
+    def legacy(t):
+        return (legacy_find_incident_types(t, ik.incident_keywords, scraper.normalize_arabic),
+                legacy_extract_casualties(t, ik.casualty_keywords))
+
+    def compiled(t):
+        res = ik.classifier.classify(t)
+        return res.incident_types, res.casualties
+
+    mismatches = 0
+    for t in texts:
+        old_types, old_cats = legacy(t)
+        new_types, new_cats = compiled(t)
+        if set(old_types) != set(new_types) or set(old_cats) != set(new_cats):
+            mismatches += 1
+            print(f"MISMATCH: {t[:60]!r}")
+    print(f"{len(texts)} messages, mismatches: {mismatches}")
+
+    t_old = time_it(legacy, texts, args.repeat)
+    t_new = time_it(compiled, texts, args.repeat)
+    n = max(len(texts), 1)
+    print(f"per-keyword loops : {t_old / n * 1e6:9.1f} us/msg")
+    print(f"compiled automata : {t_new / n * 1e6:9.1f} us/msg")
+    if t_new > 0:
+        print(f"speedup           : {t_old / t_new:.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
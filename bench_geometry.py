@@ -0,0 +1,150 @@
+"""Benchmark NumPy geometry loading against the old pure-Python centroid rules.
+
+For every layer it reports the JSON parse on its own, then wall time and
+tracemalloc peak of computing every centroid from the parsed features with:
+  app      mean of every vertex (flatten_coords + extract_centroid)
+  scraper  mean of the first ring only
+  numpy    geometry.GeometryLayer (area-weighted polygons, line midpoints)
+
+With --check, polygon centroids are also compared with shapely's.
+
+Usage:
+    python bench_geometry.py [--geojson geojson_output] [--repeat 3] [--check]
+"""
+import argparse
+import math
+import os
+import time
+import tracemalloc
+
+from geometry import GeometryLayer, POLYGON
+from location_index import iter_features, list_sources
+
+
+# -----------------------------
+# Reference implementations (pre-geometry app.py / scraper.py)
+# -----------------------------
+def legacy_flatten_coords(coords):
+    if not coords:
+        return []
+    if isinstance(coords[0], (int, float)) and len(coords) == 2:
+        return [coords]
+    flattened = []
+    for c in coords:
+        flattened.extend(legacy_flatten_coords(c))
+    return flattened
+
+def legacy_app_centroid(coords):
+    points = legacy_flatten_coords(coords)
+    if not points:
+        return None
+    lon = sum(p[0] for p in points) / len(points)
+    lat = sum(p[1] for p in points) / len(points)
+    return [lon, lat]
+
+def legacy_scraper_centroid(coords):
+    if not coords:
+        return None
+    if isinstance(coords[0], list):
+        points = coords[0] if isinstance(coords[0][0], list) else coords
+    else:
+        points = [coords]
+    lon = sum([p[0] for p in points]) / len(points)
+    lat = sum([p[1] for p in points]) / len(points)
+    return [lon, lat]
+
+
+# -----------------------------
+# Runners: compute every centroid of a parsed layer
+# -----------------------------
+def run_legacy(features, centroid_fn):
+    out = []
+    for _, coords in features:
+        try:
+            out.append(centroid_fn(coords))
+        except Exception:
+            out.append(None)
+    return out
+
+def run_numpy(features):
+    return GeometryLayer.from_features(features).centroids()
+
+RUNNERS = {
+    "parse": None,
+    "app": lambda features: run_legacy(features, legacy_app_centroid),
+    "scraper": lambda features: run_legacy(features, legacy_scraper_centroid),
+    "numpy": run_numpy,
+}
+
+
+def measure(fn, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def check_shapely(path):
+    """Largest distance (degrees) between our polygon centroids and shapely's."""
+    try:
+        from shapely.geometry import shape
+    except ImportError:
+        return None
+    layer = GeometryLayer.from_features(iter_features(path))
+    ours = layer.centroids()
+    worst = 0.0
+    for i, (_, coords) in enumerate(iter_features(path)):
+        if layer.kinds[i] != POLYGON:
+            continue
+        gtype = "MultiPolygon" if isinstance(coords[0][0][0], list) else "Polygon"
+        try:
+            c = shape({"type": gtype, "coordinates": coords}).centroid
+        except Exception:
+            continue
+        if c.is_empty:
+            continue
+        worst = max(worst, math.hypot(c.x - ours[i][0], c.y - ours[i][1]))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="compare polygon centroids with shapely")
+    args = parser.parse_args()
+
+    totals = {name: [0.0, 0] for name in RUNNERS}
+    print(f"{'layer':40} {'feat':>6} " + " ".join(f"{n + ' ms':>11} {n + ' MB':>11}" for n in RUNNERS))
+    for fname in list_sources(args.geojson):
+        path = os.path.join(args.geojson, fname)
+        features = list(iter_features(path))
+        row = f"{fname[:40]:40} {len(features):6d} "
+        for name, fn in RUNNERS.items():
+            if fn is None:
+                elapsed, peak = measure(lambda p: list(iter_features(p)), path, args.repeat)
+            else:
+                elapsed, peak = measure(fn, features, args.repeat)
+            totals[name][0] += elapsed
+            totals[name][1] = max(totals[name][1], peak)
+            row += f"{elapsed * 1000:11.1f} {peak / 1e6:11.2f} "
+        if args.check:
+            worst = check_shapely(path)
+            if worst is not None:
+                row += f" max|d| vs shapely {worst:.2e}"
+        print(row)
+
+    print()
+    for name, (elapsed, peak) in totals.items():
+        print(f"{name:8} total {elapsed * 1000:9.1f} ms   largest peak {peak / 1e6:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark the compiled gazetteer matcher against the old linear scan.
+
+Usage:
+    python bench_location.py [--geojson geojson_output] [--incidents matched_incidents.json] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+# -----------------------------
+# Reference implementation (pre-automaton scraper.detect_location)
+# -----------------------------
+def legacy_detect_location(text, all_locations, location_keywords, normalize_arabic):
+    text_norm = normalize_arabic(text)
+    words = text_norm.split()
+
+    for loc_norm, loc_data in all_locations.items():
+        loc_words = loc_norm.split()
+        if len(loc_words) > 1:
+            for i in range(len(words) - len(loc_words) + 1):
+                if words[i:i+len(loc_words)] == loc_words:
+                    return loc_data["original"], loc_data["coordinates"]
+
+    for loc_norm, loc_data in all_locations.items():
+        loc_words = loc_norm.split()
+        if len(loc_words) == 1 and loc_words[0] in words:
+            return loc_data["original"], loc_data["coordinates"]
+
+    for kw in location_keywords:
+        if kw in text_norm:
+            for loc_norm, loc_data in all_locations.items():
+                if loc_norm.startswith(kw) or kw in loc_norm:
+                    return loc_data["original"], loc_data["coordinates"]
+
+    return None, None
+
+
+def load_summaries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        incidents = json.load(f)
+    return [inc.get("details", {}).get("summary", "") for inc in incidents]
+
+
+def time_it(fn, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for t in texts:
+            fn(t)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--incidents", default="matched_incidents.json")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["GEOJSON_FOLDER"] = args.geojson
+    start = time.perf_counter()
+    import scraper
+    print(f"scraper import (load + compile): {time.perf_counter() - start:.3f}s")
+
+    texts = load_summaries(args.incidents)
+    print(f"{len(texts)} summaries, {len(scraper.ALL_LOCATIONS)} locations")
+
+    def legacy(t):
+        return legacy_detect_location(t, scraper.ALL_LOCATIONS, scraper.LOCATION_KEYWORDS, scraper.normalize_arabic)
+
+    mismatches = 0
+    for t in texts:
+        if legacy(t) != scraper.detect_location(t):
+            mismatches += 1
+    print(f"mismatches: {mismatches}")
+
+    t_old = time_it(legacy, texts, args.repeat)
+    t_new = time_it(scraper.detect_location, texts, args.repeat)
+    n = max(len(texts), 1)
+    print(f"linear scan : {t_old * 1e3:9.2f} ms total, {t_old / n * 1e6:9.1f} us/msg")
+    print(f"automaton   : {t_new * 1e3:9.2f} ms total, {t_new / n * 1e6:9.1f} us/msg")
+    if t_new > 0:
+        print(f"speedup     : {t_old / t_new:.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
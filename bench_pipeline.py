@@ -0,0 +1,310 @@
+"""Offline benchmark of the scraper pipeline on a synthetic or recorded message corpus.
+
+Every message goes through scraper.Pipeline via backfill.run_backfill,
+exactly as a backfill would, with the Ollama API served by ollama_stub and
+the store writing to a temporary directory. The pipeline stages are wrapped
+with timers:
+
+  analyze          the CPU stage: one round trip to the pool
+  classify         find_incident_types + casualties (one classifier scan)
+  dedup            near-duplicate lookup (LSH; the MinHash is computed in analyze)
+  detect_location  gazetteer match
+  clean_summary    summary cleanup
+  llm              the LLM fallback (cache + HTTP client + stub)
+  store            save_match
+  total            one message end to end
+
+classify, detect_location and clean_summary are only timed with the thread
+executor; with --cpu-executor process they run in the workers and only
+analyze is reported.
+
+Each corpus size runs in a fresh interpreter, so peak RSS and the dedup /
+LLM cache state do not leak between sizes. --save writes the results as a
+baseline; --check compares against one and exits 1 when throughput drops or
+the end-to-end p95 grows by more than --tolerance, for CI.
+
+Usage:
+    python bench_pipeline.py [--sizes 1000,5000,20000] [--corpus messages.jsonl]
+                             [--geojson geojson_output] [--llm-delay 0] [--concurrency 8]
+                             [--seed 1] [--save bench_pipeline.json] [--check bench_pipeline.json]
+                             [--tolerance 0.25] [--cpu-executor thread]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+STAGES = ("analyze", "classify", "dedup", "detect_location", "clean_summary", "llm", "store", "total")
+PERCENTILES = (50, 95, 99)
+CHANNELS = ("bench_news", "bench_alerts", "bench_south", "bench_north", "bench_bekaa")
+P95_FLOOR_US = 50.0   # p95 growth below this is noise, never a regression
+
+
+# -----------------------------
+# Corpus
+# -----------------------------
+def synthetic_corpus(n, seed, location_names, incident_keywords, casualty_keywords):
+    """n Message records mixing the cases the pipeline branches on.
+
+    ~60% keyword + known place, ~15% reposts of a recent message (dedup),
+    ~10% no incident keyword and ~10% no known place (LLM fallback),
+    ~5% empty text (media-only posts).
+    """
+    from backfill import Message
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    names = sorted(location_names)
+    keywords = sorted({kw for kws in incident_keywords.values() for kw in kws})
+    casualties = sorted({kw for kws in casualty_keywords.values() for kw in kws})
+    fillers = ["عاجل", "مصادر محلية", "بحسب مراسلنا", "متابعة", "للمزيد تابعونا", "صور"]
+    messages, texts = [], []
+    for i in range(n):
+        roll = rng.random()
+        place, kw = rng.choice(names), rng.choice(keywords)
+        if roll < 0.60:
+            text = (f"{rng.choice(fillers)}: {kw} في {place} وسقوط {rng.randint(1, 20)} "
+                    f"{rng.choice(casualties)} https://t.me/{rng.choice(CHANNELS)}/{i}")
+        elif roll < 0.75 and texts:
+            # Repost: same event, different link and decoration
+            text = rng.choice(texts[-50:]).split(" https://")[0] + f" 🔴 https://t.me/repost/{i}"
+        elif roll < 0.85:
+            text = f"{rng.choice(fillers)} أخبار من {place} اليوم رقم {i}"
+        elif roll < 0.95:
+            text = f"{rng.choice(fillers)} {kw} في منطقة لم تحدد بعد رقم {i}"
+        else:
+            text = ""
+        texts.append(text)
+        messages.append(Message(rng.choice(CHANNELS), i + 1, text, start + timedelta(seconds=20 * i)))
+    return messages
+
+def recorded_corpus(path, n):
+    """The first n messages of a FileSource file, cycled with fresh ids if it is shorter."""
+    from backfill import FileSource, Message
+    source = FileSource(path)
+    base = sorted((m for msgs in source._load().values() for m in msgs), key=lambda m: m.date)
+    if not base:
+        return []
+    out = []
+    for i in range(n):
+        m = base[i % len(base)]
+        out.append(Message(m.channel, i + 1, m.text, m.date + timedelta(days=i // len(base))))
+    return out
+
+
+# -----------------------------
+# Child: one corpus size
+# -----------------------------
+def peak_rss_kb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def percentiles(samples):
+    if not samples:
+        return {f"p{p}": None for p in PERCENTILES}
+    samples = sorted(samples)
+    return {f"p{p}": samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6 for p in PERCENTILES}
+
+def child(args, size):
+    os.environ["GEOJSON_FOLDER"] = args.geojson
+    os.environ["LLM_BACKEND"] = "http"
+    os.environ["OLLAMA_URL"] = args.llm_url
+
+    with contextlib.redirect_stdout(sys.stderr):
+        import scraper
+    import backfill
+    from dedup import DEDUP_WINDOW, NearDuplicateDetector
+    from incident_store import IncidentStore
+    from llm_cache import CachedLLM, LLMCache
+    from llm_client import make_llm
+
+    tmp = tempfile.mkdtemp(prefix="bench_pipeline_")
+    # Fresh state: temporary store, memory-only LLM cache, empty dedup window
+    scraper.STORE = IncidentStore(os.path.join(tmp, "incidents"), legacy_path=None)
+    scraper.LLM = CachedLLM(
+        make_llm("http", model=scraper.OLLAMA_MODEL, base_url=os.environ["OLLAMA_URL"],
+                 timeout=scraper.PHI3_TIMEOUT, concurrency=scraper.LLM_CONCURRENCY,
+                 batch_size=scraper.LLM_BATCH_SIZE),
+        LLMCache(None, scraper.LLM_CACHE_SIZE, normalize=scraper.normalize_message),
+    )
+    scraper.DEDUP = NearDuplicateDetector(DEDUP_WINDOW)
+
+    if args.corpus:
+        messages = recorded_corpus(args.corpus, size)
+    else:
+        names = [loc["original"] for loc in scraper.ALL_LOCATIONS.values()]
+        messages = synthetic_corpus(size, args.seed, names,
+                                    scraper.IK.incident_keywords, scraper.IK.casualty_keywords)
+    corpus_path = os.path.join(tmp, "corpus.jsonl")
+    backfill.write_messages(corpus_path, messages)
+
+    samples = {stage: [] for stage in STAGES}
+
+    def timed(stage, fn):
+        def wrapper(*a, **kw):
+            t = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                samples[stage].append(time.perf_counter() - t)
+        return wrapper
+
+    def timed_async(stage, fn):
+        async def wrapper(*a, **kw):
+            t = time.perf_counter()
+            try:
+                return await fn(*a, **kw)
+            finally:
+                samples[stage].append(time.perf_counter() - t)
+        return wrapper
+
+    scraper.IK.classifier.classify = timed("classify", scraper.IK.classifier.classify)
+    scraper.DEDUP.add = timed("dedup", scraper.DEDUP.add)
+    scraper.detect_location = timed("detect_location", scraper.detect_location)
+    scraper.clean_summary = timed("clean_summary", scraper.clean_summary)
+    scraper.save_match = timed("store", scraper.save_match)
+    scraper.LLM.extract = timed_async("llm", scraper.LLM.extract)
+
+    async def run():
+        pipeline = scraper.Pipeline(set(), cpu_executor=args.cpu_executor)
+        pipeline._analyze = timed_async("analyze", pipeline._analyze)
+        pipeline.start()
+        source = backfill.FileSource(corpus_path)
+        checkpoints = backfill.Checkpoints(os.path.join(tmp, "checkpoints.json"))
+        try:
+            await backfill.run_backfill(source, timed_async("total", pipeline.process), checkpoints,
+                                        concurrency=args.concurrency, flush=pipeline.flush)
+        finally:
+            await pipeline.close()
+            await scraper.LLM.close()
+
+    baseline = peak_rss_kb()
+    start = time.perf_counter()
+    # The pipeline prints a line per message; keep the report clean
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    scraper.STORE.close()
+
+    report = {
+        "size": size,
+        "seconds": elapsed,
+        "throughput": size / elapsed if elapsed else None,
+        "rss_kb": peak_rss_kb() - baseline,
+        "llm_calls": scraper.LLM.cache.misses,
+        "records": len(scraper.STORE.load()),
+        "stages": {stage: dict(count=len(s), **percentiles(s)) for stage, s in samples.items()},
+    }
+    print(json.dumps(report))
+
+
+def start_stub(delay):
+    """ollama_stub in its own process, like the real Ollama; returns (process, url)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ollama_stub.py"),
+                             "--port", str(port), "--delay", str(delay)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return proc, url
+
+def run_child(args, size):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(size),
+           "--geojson", args.geojson, "--llm-url", args.llm_url,
+           "--concurrency", str(args.concurrency), "--seed", str(args.seed),
+           "--cpu-executor", args.cpu_executor]
+    if args.corpus:
+        cmd += ["--corpus", args.corpus]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+# -----------------------------
+# Regression check
+# -----------------------------
+def regressions(results, baseline, tolerance):
+    problems = []
+    old_by_size = {r["size"]: r for r in baseline.get("results", [])}
+    for new in results:
+        old = old_by_size.get(new["size"])
+        if not old:
+            continue
+        if new["throughput"] < old["throughput"] * (1 - tolerance):
+            problems.append(f"size {new['size']}: throughput {new['throughput']:.0f} msg/s "
+                            f"< baseline {old['throughput']:.0f}")
+        new_p95, old_p95 = new["stages"]["total"]["p95"], old["stages"]["total"]["p95"]
+        if new_p95 is not None and old_p95 is not None:
+            if new_p95 > old_p95 * (1 + tolerance) and new_p95 - old_p95 > P95_FLOOR_US:
+                problems.append(f"size {new['size']}: total p95 {new_p95:.0f} us > baseline {old_p95:.0f} us")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,20000")
+    parser.add_argument("--corpus", default=None, help="recorded JSONL corpus (backfill FileSource format)")
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds the stub takes per request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cpu-executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--save", default=None, help="write the results as a baseline")
+    parser.add_argument("--check", default=None, help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--llm-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args, args.child)
+        return
+
+    stub, args.llm_url = start_stub(args.llm_delay)
+    results = []
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.append(run_child(args, size))
+    finally:
+        stub.terminate()
+        stub.wait()
+    for r in results:
+        size = r["size"]
+        print(f"\n{size} messages: {r['throughput']:.0f} msg/s, {r['seconds']:.2f}s, "
+              f"peak RSS +{r['rss_kb'] / 1024:.1f} MB, {r['llm_calls']} LLM calls, {r['records']} records")
+        print(f"  {'stage':16} {'calls':>7} " + " ".join(f"{'p%d us' % p:>10}" for p in PERCENTILES))
+        for stage in STAGES:
+            st = r["stages"][stage]
+            cells = " ".join(f"{st[f'p{p}']:10.1f}" if st[f"p{p}"] is not None else f"{'-':>10}"
+                             for p in PERCENTILES)
+            print(f"  {stage:16} {st['count']:7d} {cells}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save}")
+    if args.check:
+        with open(args.check, "r", encoding="utf-8") as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        print(f"\n{len(problems)} regressions against {args.check}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Parity check and lookup benchmark for regions.RegionIndex.
+
+Without --admin, a synthetic set of ADM0-ADM3 boundary shapefiles is
+written (a warped grid over Lebanon's bbox whose cells nest exactly, with
+COD-AB style fields) and run through convert_shp_to_json, so the whole
+chain from shapefile to tags is exercised. The shapely backend (STRtree +
+prepared geometries) and the grid ray-casting fallback must return the
+same hierarchy for every random point; build time and microseconds per
+lookup are reported for both.
+
+Usage:
+    python bench_regions.py [--admin CONVERTED_ADMIN_FOLDER] [--points 20000] [--cells 24]
+                            [--seed 1]
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import shapefile  # pip install pyshp
+
+import regions
+from convert_shp_to_json import convert_folder
+
+BBOX = (35.10, 33.05, 36.62, 34.69)   # west, south, east, north
+LEVELS = ((0, 1, 1), (1, 2, 3), (2, 6, 6), (3, None, None))   # level, columns, rows (None: --cells)
+SAMPLES_PER_CELL = 20                  # vertices per edge of the finest level
+
+
+# -----------------------------
+# Synthetic admin boundaries
+# -----------------------------
+def warp(u, v):
+    """Unit square -> lon/lat; the edges stay on the bbox, the inside is wavy."""
+    west, south, east, north = BBOX
+    x = u + 0.03 * math.sin(6 * math.pi * v) * math.sin(math.pi * u)
+    y = v + 0.03 * math.sin(6 * math.pi * u) * math.sin(math.pi * v)
+    return [west + (east - west) * x, south + (north - south) * y]
+
+def cell_ring(i, j, nx, ny, steps):
+    """Clockwise ring of grid cell (i, j); shared edges use the same vertices on both sides."""
+    su, sv = steps // nx, steps // ny
+    u0, v0 = i * su, j * sv
+    ring = [warp((u0 + k) / steps, v0 / steps) for k in range(su)]
+    ring += [warp((u0 + su) / steps, (v0 + k) / steps) for k in range(sv)]
+    ring += [warp((u0 + su - k) / steps, (v0 + sv) / steps) for k in range(su)]
+    ring += [warp(u0 / steps, (v0 + sv - k) / steps) for k in range(sv)]
+    ring.append(ring[0])
+    return ring[::-1]
+
+def level_grid(level, cells):
+    _, nx, ny = LEVELS[level]
+    return nx or cells, ny or cells
+
+def pcode(level, i, j, nx, ny, cells):
+    """P-code of the level-`level` region holding cell (i, j) of an nx-by-ny grid; parents are prefixes."""
+    code = "LB"
+    for m in range(1, level + 1):
+        mx, my = level_grid(m, cells)
+        code += f"{i * mx // nx * my + j * my // ny:03d}"
+    return code
+
+def write_synthetic(folder, cells):
+    steps = cells * SAMPLES_PER_CELL
+    for level in range(len(LEVELS)):
+        nx, ny = level_grid(level, cells)
+        path = os.path.join(folder, f"lbn_admbnda_adm{level}_synthetic")
+        with shapefile.Writer(path, shapeType=shapefile.POLYGON) as w:
+            for k in range(level + 1):
+                w.field(f"ADM{k}_AR", "C", 60)
+                w.field(f"ADM{k}_PCODE", "C", 20)
+            for i in range(nx):
+                for j in range(ny):
+                    values = []
+                    for k in range(level + 1):
+                        values += [f"منطقة {pcode(k, i, j, nx, ny, cells)}", pcode(k, i, j, nx, ny, cells)]
+                    w.poly([cell_ring(i, j, nx, ny, steps)])
+                    w.record(*values)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def build(folder, backend):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = regions.load_regions(folder, backend)
+    return index, time.perf_counter() - start
+
+def time_lookups(index, points):
+    start = time.perf_counter()
+    results = [index.lookup(lat, lon) for lat, lon in points]
+    return results, (time.perf_counter() - start) / len(points) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--admin", default=None, help="folder of converted admin layers (default: synthetic)")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--cells", type=int, default=24, help="synthetic ADM3 grid size (a multiple of 6)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    folder = args.admin
+    if folder is None:
+        tmp = tempfile.mkdtemp(prefix="bench_regions_")
+        shp_folder, folder = os.path.join(tmp, "shp"), os.path.join(tmp, "json")
+        os.makedirs(shp_folder)
+        write_synthetic(shp_folder, args.cells)
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert_folder(shp_folder, folder, jobs=1)
+
+    backends = ["grid"] + (["shapely"] if regions.shapely is not None else [])
+    indexes = {}
+    for backend in backends:
+        index, seconds = build(folder, backend)
+        indexes[backend] = index
+        print(f"{backend:8} {len(index)} polygons, built in {seconds:.2f}s")
+    any_index = indexes["grid"]
+    if not len(any_index):
+        print(f"no admin layers in {folder}")
+        sys.exit(1)
+
+    west, south, east, north = BBOX
+    rng = random.Random(args.seed)
+    pad = 0.05
+    points = [(rng.uniform(south - pad, north + pad), rng.uniform(west - pad, east + pad))
+              for _ in range(args.points)]
+
+    results = {}
+    for backend, index in indexes.items():
+        results[backend], us = time_lookups(index, points)
+        tagged = sum(1 for r in results[backend] if r)
+        depth = sum(len(r) for r in results[backend]) / max(tagged, 1)
+        print(f"{backend:8} {us:8.1f} us/lookup, {tagged} of {len(points)} points tagged, "
+              f"{depth:.1f} levels each")
+
+    mismatches = 0
+    if len(results) == 2:
+        for point, a, b in zip(points, results["grid"], results["shapely"]):
+            if a != b:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"MISMATCH at {point}: grid {a} vs shapely {b}")
+        print(f"parity: {mismatches} mismatches in {len(points)} points")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
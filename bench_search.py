@@ -0,0 +1,111 @@
+"""Latency benchmark for the /search_location index over the full gazetteer.
+
+Queries are drawn from the gazetteer itself with a fixed seed: every prefix
+length of sampled names (keystroke by keystroke), exact names, and names
+with one or two random typos. Reports percentiles per query kind against
+the old linear scan, and how often a typo query still finds its name.
+
+Usage:
+    python bench_search.py [--geojson geojson_output] [--samples 300] [--limit 10]
+"""
+import argparse
+import random
+import time
+
+from location_index import load_locations
+from search_index import SearchIndex, max_distance
+
+SEED = 20250818
+
+
+# -----------------------------
+# Reference implementation (pre-index app.search_location)
+# -----------------------------
+def legacy_search(norm_query, locations):
+    for loc_norm, loc_data in locations.items():
+        if norm_query in loc_norm:
+            return loc_data
+    return None
+
+
+# -----------------------------
+# Query generation
+# -----------------------------
+def typo(word, rng, edits):
+    letters = sorted(set(word))
+    for _ in range(edits):
+        i = rng.randrange(len(word))
+        op = rng.choice(("delete", "insert", "replace", "swap"))
+        if op == "delete" and len(word) > 1:
+            word = word[:i] + word[i + 1:]
+        elif op == "insert":
+            word = word[:i] + rng.choice(letters) + word[i:]
+        elif op == "swap" and i + 1 < len(word):
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        else:
+            word = word[:i] + rng.choice(letters) + word[i + 1:]
+    return word
+
+def make_queries(names, samples):
+    rng = random.Random(SEED)
+    picked = rng.sample(names, min(samples, len(names)))
+    queries = {"keystroke": [], "exact": [], "typo": []}
+    for name in picked:
+        queries["exact"].append((name, name))
+        queries["keystroke"].extend((name[:n], name) for n in range(1, len(name) + 1))
+        # Misspell the longest word within what the index tolerates for it
+        words = name.split()
+        longest = max(range(len(words)), key=lambda k: len(words[k]))
+        edits = max_distance(words[longest])
+        if edits:
+            words[longest] = typo(words[longest], rng, edits)
+            queries["typo"].append((" ".join(words), name))
+    return queries
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+def run(fn, queries):
+    times = []
+    for q, _ in queries:
+        start = time.perf_counter()
+        fn(q)
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--index", default="location_index.bin")
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    locations = load_locations(args.geojson, args.index)
+    start = time.perf_counter()
+    index = SearchIndex(locations)
+    print(f"index built over {len(index)} names in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    queries = make_queries(list(locations), args.samples)
+    print(f"{'kind':10} {'queries':>8} {'impl':7} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'max us':>9}")
+    for kind, qs in queries.items():
+        for impl, fn in (
+            ("linear", lambda q: legacy_search(q, locations)),
+            ("index", lambda q: index.search(q, args.limit)),
+        ):
+            t = run(fn, qs)
+            print(f"{kind:10} {len(qs):8d} {impl:7} {percentile(t, 50):9.1f} {percentile(t, 95):9.1f} "
+                  f"{percentile(t, 99):9.1f} {t[-1]:9.1f}")
+
+    for kind in ("exact", "typo"):
+        qs = queries[kind]
+        hits = sum(any(name == target for name, _, _ in index.search(q, args.limit)) for q, target in qs)
+        legacy = sum(legacy_search(q, locations) is not None for q, _ in qs)
+        print(f"{kind:10} target in top {args.limit}: {hits}/{len(qs)}   linear scan found anything: {legacy}/{len(qs)}")
+
+
+if __name__ == "__main__":
+    main()
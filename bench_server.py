@@ -0,0 +1,241 @@
+"""Load benchmark of the API: the development server against serve.py.
+
+A temporary working directory gets a synthetic store of --incidents recent
+records (Arabic summaries, nested details, coordinates in Lebanon), all
+inside the app's /incidents time window. Each server runs in its own
+process group on that directory:
+
+  flask   python app.py with FAST_JSON=0 RESPONSE_CACHE_BYTES=0: the debug
+          server with Flask's JSON encoder, every body encoded per request
+  serve   python serve.py --workers N: pre-forked workers, serving.dumps,
+          bodies cached by ETag
+
+Every scenario runs for --seconds with --concurrency client threads:
+
+  full    GET /incidents, no Accept-Encoding
+  gzip    GET /incidents, Accept-Encoding: br, gzip
+  poll    GET /incidents with the current ETag in If-None-Match (304)
+  stats   GET /stats
+
+requests/s, p50/p99 latency and bytes per response are reported. The
+decoded /incidents payloads of both servers must be equal.
+
+Usage:
+    python bench_server.py [--incidents 2000] [--seconds 5] [--concurrency 8] [--workers N]
+                           [--geojson geojson_output] [--seed 1]
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import serving
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("full", "gzip", "poll", "stats")
+PERCENTILES = (50, 99)
+STARTUP_TIMEOUT = 180   # seconds for a server to load the gazetteer and answer
+BBOX = (35.10, 33.05, 36.62, 34.69)   # west, south, east, north
+TYPES = ("airstrike", "shelling", "explosion", "shooting", "fire", "protest", "medical", "other")
+WORDS = ("غارة", "جوية", "استهدفت", "منزلا", "في", "بلدة", "جنوب", "لبنان", "وأفادت", "مصادر", "محلية",
+         "بسقوط", "جرحى", "وتضرر", "عدد", "من", "المباني", "المجاورة", "وهرعت", "سيارات", "الإسعاف",
+         "إلى", "المكان", "عاجل", "مراسلنا", "قصف", "مدفعي", "على", "أطراف", "البلدة")
+
+
+# -----------------------------
+# Synthetic store
+# -----------------------------
+def synthetic_incidents(n, seed):
+    """n records dated within the last 20 minutes, in the store's record format."""
+    rng = random.Random(seed)
+    west, south, east, north = BBOX
+    now = datetime.now(timezone.utc)
+    records = []
+    for i in range(n):
+        date = now - timedelta(seconds=rng.uniform(0, 1200))
+        casualties = rng.sample(["killed", "injured", "missing"], rng.randint(0, 2))
+        records.append({
+            "incident_type": rng.choice(TYPES),
+            "location": f"بلدة {rng.randint(1, 400)}",
+            "channel": f"bench_{rng.randint(1, 5)}",
+            "message_id": i + 1,
+            "date": date.strftime("%Y-%m-%d %H:%M:%S+00:00"),
+            "threat_level": "yes",
+            "coordinates": [round(rng.uniform(west, east), 6), round(rng.uniform(south, north), 6)],
+            "details": {
+                "numbers_found": [rng.randint(1, 30) for _ in range(rng.randint(0, 3))],
+                "casualties": casualties,
+                "summary": " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45))),
+            },
+        })
+    return records
+
+
+# -----------------------------
+# Servers
+# -----------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(name, workdir, geojson, workers):
+    port = free_port()
+    env = dict(os.environ, GEOJSON_FOLDER=geojson, PORT=str(port), PYTHONPATH=HERE)
+    if name == "flask":
+        cmd = [sys.executable, os.path.join(HERE, "app.py")]
+        env.update(FAST_JSON="0", RESPONSE_CACHE_BYTES="0")
+    else:
+        cmd = [sys.executable, os.path.join(HERE, "serve.py"), "--host", "127.0.0.1", "--workers", str(workers)]
+    log = open(os.path.join(workdir, f"{name}.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with {proc.returncode}; see {log.name}")
+        try:
+            if request(port, "/")[0] == 200:
+                return proc, port
+        except OSError:
+            time.sleep(0.2)
+    stop_server(proc)
+    raise RuntimeError(f"{name} did not answer within {STARTUP_TIMEOUT}s; see {log.name}")
+
+def stop_server(proc):
+    # The debug server's reloader and serve.py's workers share the process group
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+# -----------------------------
+# Load
+# -----------------------------
+def request(port, path, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        conn.request("GET", path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+def decode(headers, body):
+    encoding = headers.get("Content-Encoding")
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "br":
+        body = serving.brotli.decompress(body)
+    return json.loads(body)
+
+def scenario_request(scenario, etag):
+    if scenario == "full":
+        return "/incidents", {}, 200
+    if scenario == "gzip":
+        return "/incidents", {"Accept-Encoding": "br, gzip"}, 200
+    if scenario == "poll":
+        return "/incidents", {"If-None-Match": etag}, 304
+    return "/stats", {}, 200
+
+def run_load(port, scenario, seconds, concurrency):
+    _, headers, _ = request(port, "/incidents")
+    path, req_headers, expected = scenario_request(scenario, headers.get("ETag"))
+    request(port, path, req_headers)   # warm up caches
+    latencies, sizes, errors = [], [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _, body = request(port, path, req_headers)
+            except OSError as e:
+                status, body = repr(e), b""
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status == expected:
+                    latencies.append(elapsed)
+                    sizes.append(len(body))
+                else:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    pct = {p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e3 if latencies else None
+           for p in PERCENTILES}
+    return {"rps": len(latencies) / wall, "pct": pct, "bytes": sum(sizes) / max(len(sizes), 1),
+            "errors": len(errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--incidents", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5.0, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="serve.py workers")
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_server_")
+    with open(os.path.join(workdir, "matched_incidents.json"), "w", encoding="utf-8") as f:
+        json.dump(synthetic_incidents(args.incidents, args.seed), f, ensure_ascii=False)
+    geojson = os.path.abspath(args.geojson)
+
+    results, payloads = {}, {}
+    try:
+        for name in ("flask", "serve"):
+            proc, port = start_server(name, workdir, geojson, args.workers)
+            try:
+                _, headers, body = request(port, "/incidents", {"Accept-Encoding": "br, gzip"})
+                payloads[name] = decode(headers, body)
+                for scenario in SCENARIOS:
+                    results[name, scenario] = run_load(port, scenario, args.seconds, args.concurrency)
+            finally:
+                stop_server(proc)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    n = len(payloads["serve"]["incidents"])
+    print(f"{n} incidents per /incidents response, {args.concurrency} clients, "
+          f"serve.py with {args.workers} workers, compression: {serving.ENCODINGS[0]}")
+    print(f"{'server':8} {'scenario':8} {'req/s':>9} " + " ".join(f"{'p%d ms' % p:>9}" for p in PERCENTILES)
+          + f" {'bytes':>10} {'errors':>7}")
+    for (name, scenario), r in results.items():
+        cells = " ".join(f"{r['pct'][p]:9.2f}" if r["pct"][p] is not None else f"{'-':>9}" for p in PERCENTILES)
+        print(f"{name:8} {scenario:8} {r['rps']:9.1f} {cells} {r['bytes']:10.0f} {r['errors']:7d}")
+    for scenario in SCENARIOS:
+        base, new = results["flask", scenario]["rps"], results["serve", scenario]["rps"]
+        print(f"{scenario:8} serve/flask throughput x{new / base:.2f}" if base else f"{scenario:8} no flask requests")
+
+    same = payloads["flask"] == payloads["serve"]
+    print(f"payload parity: {'ok' if same else 'MISMATCH'}")
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
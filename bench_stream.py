@@ -0,0 +1,119 @@
+"""Memory benchmark: whole-file json.load versus the streaming layer loader.
+
+Every loader reduces all geojson_output layers to name + centroid. Each
+one runs in a fresh interpreter, so peak RSS is not polluted by the
+others. It is measured once plainly (wall time, peak RSS above the
+post-import baseline) and once under tracemalloc (peak Python heap).
+
+  json_load  json.load + mean of every vertex (pre-geometry app loader)
+  geometry   json.load + GeometryLayer centroids per file
+  stream     geojson_stream.stream_centroids, one feature at a time
+
+Usage:
+    python bench_stream.py [--geojson geojson_output]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+MODES = ("json_load", "geometry", "stream")
+
+
+# -----------------------------
+# Loaders
+# -----------------------------
+def load_json_load(folder):
+    from bench_geometry import legacy_app_centroid
+    from location_index import list_sources
+    out = {}
+    for fname in list_sources(folder):
+        with open(os.path.join(folder, fname), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for feat in data:
+            name, coords = feat.get("name"), feat.get("coordinates")
+            if name and coords:
+                out[name] = legacy_app_centroid(coords)
+    return out
+
+def load_geometry(folder):
+    from geometry import GeometryLayer
+    from location_index import iter_features, list_sources
+    out = {}
+    for fname in list_sources(folder):
+        layer = GeometryLayer.from_features(iter_features(os.path.join(folder, fname)))
+        out.update(zip(layer.names, layer.centroids().tolist()))
+    return out
+
+def load_stream(folder):
+    from geojson_stream import stream_centroids
+    from location_index import list_sources
+    out = {}
+    for fname in list_sources(folder):
+        out.update(stream_centroids(os.path.join(folder, fname)))
+    return out
+
+LOADERS = {"json_load": load_json_load, "geometry": load_geometry, "stream": load_stream}
+
+
+def peak_rss_kb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def child(mode, folder, trace):
+    # Import everything up front so the baseline includes numpy and friends
+    import numpy  # noqa: F401
+    import bench_geometry, geojson_stream, geometry, location_index  # noqa: F401
+    baseline = peak_rss_kb()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = LOADERS[mode](folder)
+    elapsed = time.perf_counter() - start
+    report = {"mode": mode, "features": len(result), "seconds": elapsed,
+              "rss_kb": peak_rss_kb() - baseline}
+    if trace:
+        report["traced_peak"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(json.dumps(report))
+
+
+def run_child(mode, folder, trace):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--geojson", folder]
+    if trace:
+        cmd.append("--trace")
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.geojson, args.trace)
+        return
+
+    total = sum(os.path.getsize(os.path.join(args.geojson, f))
+                for f in os.listdir(args.geojson) if f.endswith(".json"))
+    largest = max((os.path.getsize(os.path.join(args.geojson, f)), f)
+                  for f in os.listdir(args.geojson) if f.endswith(".json"))
+    print(f"{args.geojson}: {total / 1e6:.1f} MB, largest {largest[1]} ({largest[0] / 1e6:.1f} MB)")
+    print(f"{'mode':10} {'features':>9} {'time ms':>9} {'peak RSS MB':>12} {'heap peak MB':>13}")
+    for mode in MODES:
+        plain = run_child(mode, args.geojson, False)
+        traced = run_child(mode, args.geojson, True)
+        print(f"{mode:10} {plain['features']:9d} {plain['seconds'] * 1000:9.1f} "
+              f"{plain['rss_kb'] / 1024:12.2f} {traced['traced_peak'] / 1e6:13.2f}")
+
+
+if __name__ == "__main__":
+    main()
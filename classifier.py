@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+from arabic import normalize_arabic
+from automaton import AhoCorasick
+
+
+Classification = namedtuple(
+    "Classification", ["incident_types", "casualties", "incident_spans", "casualty_spans"]
+)
+
+
+# -----------------------------
+# Compiled keyword classifier
+# -----------------------------
+class IncidentClassifier:
+    """Keyword dictionaries compiled into character-level automata.
+
+    Incident keywords are normalized once and matched against the normalized
+    message, like find_incident_types always did. Casualty keywords keep the
+    extract_casualties rule and are matched raw against the lower-cased text.
+    Spans are (start, end, category) offsets into the text that was scanned.
+    """
+
+    def __init__(self, incident_keywords, casualty_keywords=None):
+        self._categories = list(incident_keywords)
+        self._casualty_categories = list(casualty_keywords or {})
+        self._incidents, self._incidents_always = self._compile(incident_keywords, normalize_arabic)
+        self._casualties, self._casualties_always = self._compile(casualty_keywords or {}, None)
+
+    @staticmethod
+    def _compile(keywords, normalize):
+        automaton = AhoCorasick()
+        always = set()
+        for cat, kws in keywords.items():
+            for kw in kws:
+                pattern = normalize(kw) if normalize else kw
+                if pattern:
+                    automaton.add(pattern, cat)
+                else:
+                    # An empty keyword is a substring of every message
+                    always.add(cat)
+        return automaton.build(), always
+
+    @staticmethod
+    def _scan(automaton, always, order, text):
+        spans = list(automaton.iter_matches(text))
+        found = set(always)
+        found.update(cat for _, _, cat in spans)
+        return [cat for cat in order if cat in found], spans
+
+    def incident_types(self, text):
+        if not text:
+            return []
+        return self._scan(self._incidents, self._incidents_always, self._categories,
+                          normalize_arabic(text))[0]
+
+    def casualties(self, text):
+        return self._scan(self._casualties, self._casualties_always, self._casualty_categories,
+                          text.lower())[0]
+
+    def classify(self, text):
+        text = text or ""
+        types, type_spans = [], []
+        if text:
+            types, type_spans = self._scan(self._incidents, self._incidents_always,
+                                           self._categories, normalize_arabic(text))
+        cats, cat_spans = self._scan(self._casualties, self._casualties_always,
+                                     self._casualty_categories, text.lower())
+        return Classification(types, cats, type_spans, cat_spans)
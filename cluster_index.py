@@ -0,0 +1,135 @@
+import math
+from collections import Counter
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+MIN_ZOOM = 0
+MAX_ZOOM = 16
+CLUSTER_RADIUS = 60    # pixels
+TILE_EXTENT = 256      # pixels per tile side
+MAX_LAT = 85.05112878
+
+
+def mercator(lat, lon):
+    """lat/lon -> Web Mercator x, y in [0, 1] (y grows southwards, like tiles)."""
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    x = lon / 360.0 + 0.5
+    s = math.sin(math.radians(lat))
+    y = 0.5 - 0.25 * math.log((1 + s) / (1 - s)) / math.pi
+    return x, y
+
+
+# -----------------------------
+# Incremental grid clustering
+# -----------------------------
+class _Cell:
+    __slots__ = ("count", "sum_lat", "sum_lon", "types", "items")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lon = 0.0
+        self.types = Counter()
+        self.items = set()
+
+
+class ClusterIndex:
+    """Per-zoom grid clusters in the spirit of supercluster, kept up to date per point.
+
+    Every zoom level has its own grid whose cells are CLUSTER_RADIUS pixels
+    wide at that zoom. Adding or removing a point touches one cell per
+    zoom, so there is no rebuild; a query reads only the cells inside the
+    requested bbox at the requested zoom.
+    """
+
+    def __init__(self, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, radius=CLUSTER_RADIUS, extent=TILE_EXTENT):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self._size = {z: radius / (extent * (1 << z)) for z in range(min_zoom, max_zoom + 1)}
+        self._grids = {z: {} for z in range(min_zoom, max_zoom + 1)}
+        self._points = {}   # item -> (lat, lon, kind, x, y)
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, item):
+        return item in self._points
+
+    def _key(self, z, x, y):
+        size = self._size[z]
+        return int(x // size), int(y // size)
+
+    def add(self, item, lat, lon, kind=None):
+        if item in self._points:
+            self.remove(item)
+        x, y = mercator(lat, lon)
+        self._points[item] = (lat, lon, kind, x, y)
+        for z, grid in self._grids.items():
+            key = self._key(z, x, y)
+            cell = grid.get(key)
+            if cell is None:
+                cell = grid[key] = _Cell()
+            cell.count += 1
+            cell.sum_lat += lat
+            cell.sum_lon += lon
+            cell.types[kind] += 1
+            cell.items.add(item)
+
+    def remove(self, item):
+        point = self._points.pop(item, None)
+        if point is None:
+            return
+        lat, lon, kind, x, y = point
+        for z, grid in self._grids.items():
+            key = self._key(z, x, y)
+            cell = grid[key]
+            cell.count -= 1
+            if not cell.count:
+                del grid[key]
+                continue
+            cell.sum_lat -= lat
+            cell.sum_lon -= lon
+            cell.types[kind] -= 1
+            if not cell.types[kind]:
+                del cell.types[kind]
+            cell.items.discard(item)
+
+    def clear(self):
+        for grid in self._grids.values():
+            grid.clear()
+        self._points.clear()
+
+    def clusters(self, zoom, bbox=None):
+        """Cells at `zoom` overlapping bbox (west, south, east, north).
+
+        Returns dicts with the mean point, the point count, per-kind counts
+        and, for single points, the item itself.
+        """
+        z = max(self.min_zoom, min(self.max_zoom, int(zoom)))
+        grid = self._grids[z]
+        if bbox is None:
+            cells = grid.values()
+        else:
+            west, south, east, north = bbox
+            x0, y0 = self._key(z, *mercator(north, west))
+            x1, y1 = self._key(z, *mercator(south, east))
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(grid):
+                cells = [cell for (cx, cy), cell in grid.items() if x0 <= cx <= x1 and y0 <= cy <= y1]
+            else:
+                cells = [
+                    grid[(cx, cy)]
+                    for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)
+                    if (cx, cy) in grid
+                ]
+        out = []
+        for cell in cells:
+            cluster = {
+                "coordinates": [cell.sum_lat / cell.count, cell.sum_lon / cell.count],
+                "count": cell.count,
+                "types": dict(cell.types),
+            }
+            if cell.count == 1:
+                cluster["item"] = next(iter(cell.items))
+            out.append(cluster)
+        return z, out
@@ -1,37 +1,37 @@
-import os
+"""Convert a folder of shapefiles into the name + coordinates JSON layers.
+
+Files are converted in parallel, one process per file, and records are
+streamed straight from the shapefile into the output. Administrative
+boundary layers (ADM0-ADM4 fields) also keep each polygon's level, P-code
+and the names of the levels above it, for regions.py. A manifest in the
+output folder remembers each source's mtime, size and hash, so unchanged
+shapefiles are skipped on the next run.
+
+Usage:
+    python convert_shp_to_json.py [INPUT_FOLDER] [OUTPUT_FOLDER] [--jobs 4]
+                                  [--precision 6] [--indent 2] [--force]
+"""
+import argparse
+import hashlib
 import json
+import os
 import re
+import textwrap
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import shapefile  # pip install pyshp
-from shapely.geometry import shape, mapping
+
+from arabic import is_arabic, normalize_arabic
 
 # -----------------------------
 # CONFIG
 # -----------------------------
 INPUT_FOLDER = r"C:\Users\user\Downloads\admin\admin"
 OUTPUT_FOLDER = r"C:\Users\user\OneDrive - Lebanese University\Documents\GitHub\Incident_Project\geojson_output_2"
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-# Arabic normalization
-RE_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u06D6-\u06ED]+")
-
-def normalize_arabic(text: str) -> str:
-    if not text:
-        return ""
-    text = RE_DIACRITICS.sub("", text)
-    text = text.replace('\u0640', '')  # Tatweel
-    text = re.sub(r"[إأآا]", "ا", text)
-    text = re.sub(r"[ؤ]", "و", text)
-    text = re.sub(r"[ئ]", "ي", text)
-    text = text.replace('ة', 'ه')
-    text = re.sub(r"[يى]", "ي", text)
-    text = re.sub(r"[^\w\s\u0600-\u06FF]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-def is_arabic(text):
-    if not text:
-        return False
-    return bool(re.search(r'[\u0600-\u06FF]', text))
+MANIFEST_FILE = ".convert_manifest.json"
+SIDECAR_EXTS = (".shp", ".shx", ".dbf")   # files whose content defines the output
+FORMAT_VERSION = 2   # 2: admin layers carry level, pcode and hierarchy
+RE_ADMIN_FIELD = re.compile(r"^ADM(\d)")
 
 # -----------------------------
 # Detect appropriate name field
@@ -55,55 +55,211 @@ def detect_name_field(fields):
 
     return None
 
+def admin_fields(fields, name_field):
+    """(level, [(level, name field, pcode field), ...] for ADM0..level), or (None, []).
+
+    The level is the one the name field belongs to; names fall back from
+    Arabic to English per level, like detect_name_field.
+    """
+    match = RE_ADMIN_FIELD.match(name_field)
+    if not match:
+        return None, []
+    level = int(match.group(1))
+    levels = []
+    for k in range(level + 1):
+        name = next((f for f in (f"ADM{k}_AR", f"ADM{k}_EN") if f in fields), None)
+        pcode = f"ADM{k}_PCODE" if f"ADM{k}_PCODE" in fields else None
+        if name or pcode:
+            levels.append((k, name, pcode))
+    return level, levels
+
+def clean_name(name):
+    return normalize_arabic(name, strip_punctuation=True) if is_arabic(name) else name
+
+# -----------------------------
+# Coordinates
+def round_coords(coords, precision):
+    """Nested tuples/lists of numbers -> nested lists, rounded when precision is set."""
+    if isinstance(coords, (int, float)):
+        return coords if precision is None else round(coords, precision)
+    return [round_coords(c, precision) for c in coords]
+
 # -----------------------------
 # Convert a SHP file to JSON with coordinates
-def shp_to_json(shp_path, json_path):
+def shp_to_json(shp_path, json_path, precision=None, indent=None):
+    """Stream one shapefile into json_path; returns (status, feature_count)."""
     try:
         sf = shapefile.Reader(shp_path)
     except Exception as e:
         print(f"[SKIP] Cannot read {shp_path}: {e}")
-        return
+        return "skip", 0
 
-    fields = [f[0] for f in sf.fields[1:]]  # skip DeletionFlag
-    name_field = detect_name_field(fields)
+    with sf:
+        fields = [f[0] for f in sf.fields[1:]]  # skip DeletionFlag
+        name_field = detect_name_field(fields)
 
-    if not name_field:
-        print(f"[SKIP] No suitable name field in {shp_path}")
-        return
+        if not name_field:
+            print(f"[SKIP] No suitable name field in {shp_path}")
+            return "skip", 0
+        level, levels = admin_fields(fields, name_field)
+        read_fields = [name_field] + sorted({f for _, name, pcode in levels for f in (name, pcode) if f} - {name_field})
 
-    name_idx = fields.index(name_field)
+        # Same layout json.dump(features, indent=...) produces, one feature at a time
+        pad = " " * indent if indent else ""
+        tmp_path = json_path + ".tmp"
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("[")
+            for shape_rec in sf.iterShapeRecords(fields=read_fields):
+                # Values come back in the file's field order, not read_fields'
+                values = shape_rec.record.as_dict()
+                name = values[name_field]
+                if not name:
+                    continue
 
-    features = []
-    for rec, shp in zip(sf.records(), sf.shapes()):
-        name = rec[name_idx]
-        if not name:
-            continue
+                # Normalize if Arabic
+                name = clean_name(name)
+
+                geo = shape_rec.shape.__geo_interface__
+                if not geo.get("coordinates"):
+                    continue
+                feature = {
+                    "name": name,
+                    "coordinates": round_coords(geo["coordinates"], precision)
+                }
+                if level is not None:
+                    hierarchy = [
+                        {"level": k, "name": clean_name(values[n]) if n and values[n] else None,
+                         "pcode": values[p] if p else None}
+                        for k, n, p in levels
+                    ]
+                    feature["level"] = level
+                    feature["pcode"] = hierarchy[-1]["pcode"] if hierarchy and hierarchy[-1]["level"] == level else None
+                    feature["hierarchy"] = hierarchy
+                text = json.dumps(feature, ensure_ascii=False, indent=indent,
+                                  separators=None if indent else (",", ":"))
+                f.write(("," if count else "") + ("\n" + textwrap.indent(text, pad) if indent else text))
+                count += 1
+            f.write("\n]" if indent and count else "]")
 
-        # Normalize if Arabic
-        if is_arabic(name):
-            name = normalize_arabic(name)
+    if count:
+        os.replace(tmp_path, json_path)
+        print(f"[DONE] {json_path} -> {count} features")
+        return "done", count
+    os.remove(tmp_path)
+    print(f"[EMPTY] {json_path}")
+    return "empty", 0
 
-        geom = shape(shp.__geo_interface__)
-        coords = mapping(geom)['coordinates']  # all coordinates
+# -----------------------------
+# Change detection
+def source_files(shp_path):
+    base = os.path.splitext(shp_path)[0]
+    paths = []
+    for ext in SIDECAR_EXTS:
+        for candidate in (base + ext, base + ext.upper()):
+            if os.path.exists(candidate):
+                paths.append(candidate)
+                break
+    return paths
 
-        feature = {
-            "name": name,
-            "coordinates": coords
-        }
-        features.append(feature)
+def source_stat(shp_path):
+    stats = [os.stat(p) for p in source_files(shp_path)]
+    return [[st.st_mtime, st.st_size] for st in stats]
 
-    if features:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(features, f, ensure_ascii=False, indent=2)
-        print(f"[DONE] {json_path} -> {len(features)} features")
-    else:
-        print(f"[EMPTY] {json_path}")
+def source_hash(shp_path):
+    h = hashlib.sha1()
+    for path in source_files(shp_path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_folder, manifest):
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def is_current(entry, shp_path, json_path, options):
+    """True if json_path was produced from this exact source with these options."""
+    if not entry or entry.get("options") != options or not os.path.exists(json_path):
+        return False
+    if entry.get("stat") == source_stat(shp_path):
+        return True
+    # Touched but not changed (copied, checked out again): compare content
+    return entry.get("sha1") == source_hash(shp_path)
+
+def convert_job(shp_path, json_path, precision, indent):
+    """Worker entry point; hashes the source too so the parent never re-reads it."""
+    status, count = shp_to_json(shp_path, json_path, precision, indent)
+    return status, count, source_stat(shp_path), source_hash(shp_path)
 
 # -----------------------------
-# Process all SHP files in INPUT_FOLDER
-for file in os.listdir(INPUT_FOLDER):
-    if file.lower().endswith(".shp"):
-        shp_path = os.path.join(INPUT_FOLDER, file)
+# Process all SHP files in the input folder
+def convert_folder(input_folder, output_folder, jobs=None, precision=None, indent=None, force=False):
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_manifest(output_folder)
+    options = {"precision": precision, "indent": indent, "format": FORMAT_VERSION}
+
+    pending = {}
+    skipped = 0
+    for file in sorted(os.listdir(input_folder)):
+        if not file.lower().endswith(".shp"):
+            continue
+        shp_path = os.path.join(input_folder, file)
         base_name = os.path.splitext(file)[0]
-        json_path = os.path.join(OUTPUT_FOLDER, f"{base_name}.json")
-        shp_to_json(shp_path, json_path)
+        json_path = os.path.join(output_folder, f"{base_name}.json")
+        entry = manifest.get(file)
+        if not force and is_current(entry, shp_path, json_path, options):
+            # Refresh the stat so the next run skips the hash
+            entry["stat"] = source_stat(shp_path)
+            print(f"[SKIP] {file} unchanged")
+            skipped += 1
+            continue
+        pending[file] = (shp_path, json_path)
+
+    converted = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(convert_job, shp_path, json_path, precision, indent): file
+                for file, (shp_path, json_path) in pending.items()
+            }
+            for fut in as_completed(futures):
+                file = futures[fut]
+                try:
+                    status, count, stat, sha1 = fut.result()
+                except Exception as e:
+                    print(f"[SKIP] {file}: {e}")
+                    continue
+                if status == "done":
+                    converted += 1
+                    manifest[file] = {"stat": stat, "sha1": sha1, "options": options,
+                                      "output": os.path.basename(pending[file][1]), "features": count}
+                else:
+                    manifest.pop(file, None)
+    save_manifest(output_folder, manifest)
+    print(f"[DONE] {converted} converted, {len(pending) - converted} failed or empty, {skipped} unchanged")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", default=INPUT_FOLDER)
+    parser.add_argument("output", nargs="?", default=OUTPUT_FOLDER)
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--precision", type=int, default=None, help="round coordinates to N decimals")
+    parser.add_argument("--indent", type=int, default=None, help="pretty-print with N spaces (default: compact)")
+    parser.add_argument("--force", action="store_true", help="convert even if the source is unchanged")
+    args = parser.parse_args()
+    convert_folder(args.input, args.output, args.jobs, args.precision, args.indent, args.force)
+
+
+if __name__ == "__main__":
+    main()
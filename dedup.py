@@ -0,0 +1,155 @@
+import hashlib
+import itertools
+import random
+from collections import deque
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+DEDUP_WINDOW = 6 * 3600   # seconds a message can still absorb reposts
+NUM_PERM = 64             # MinHash signature length
+BANDS = 16                # LSH bands of NUM_PERM // BANDS rows each
+THRESHOLD = 0.7           # estimated Jaccard similarity counted as the same text
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20250818)   # fixed seed: signatures must be stable across runs
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+# -----------------------------
+# MinHash
+# -----------------------------
+def _features(text):
+    words = text.split()
+    # Words plus word bigrams: an added prefix or a dropped word changes few features
+    return set(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+def minhash(text, num_perm=NUM_PERM):
+    hashes = [
+        int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+        for f in _features(text)
+    ]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS[:num_perm])
+
+def similarity(sig_a, sig_b):
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+# -----------------------------
+# Streaming near-duplicate detector
+# -----------------------------
+class Cluster:
+    """Messages that carry the same text, e.g. one event reposted by several channels."""
+
+    def __init__(self, cluster_id, signature, timestamp):
+        self.id = cluster_id
+        self.signature = signature
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.members = []       # (channel, message_id)
+        self.candidates = []    # lightweight records for select_best_message
+        # None until the first message is processed, False if it had no incident,
+        # else {"location", "coordinates", "incident_types", "cluster_id"}
+        self.resolved = None
+        self.pending = None     # reposts waiting while the first message is processed
+
+
+class NearDuplicateDetector:
+    """MinHash signatures with LSH buckets over a sliding time window.
+
+    Each signature is cut into BANDS bands and every band is a bucket key,
+    so only messages that share a bucket are compared. Clusters not seen for
+    `window` seconds are dropped, and a message only joins a cluster seen
+    within `window` of it, before or after. Timestamps need not only move
+    forward: a backfill replays channels one after another, so time jumps
+    back at every channel, and a jump of more than `window` starts afresh.
+    """
+
+    def __init__(self, window=DEDUP_WINDOW, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.window = window
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.duplicates = 0
+        self._buckets = {}
+        self._order = deque()   # (queued_at, cluster), oldest first; requeued lazily on expiry
+        self._latest = None     # newest timestamp seen
+        self._ids = itertools.count(1)
+
+    def clear(self):
+        self._buckets.clear()
+        self._order.clear()
+        self._latest = None
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [(b, signature[b * r:(b + 1) * r]) for b in range(self.bands)]
+
+    def _expire(self, now):
+        if self._latest is not None and now < self._latest - self.window:
+            # Back in time by more than the window: nothing held can match any more
+            self.clear()
+        if self._latest is None or now > self._latest:
+            self._latest = now
+        while self._order and now - self._order[0][0] > self.window:
+            _, cluster = self._order.popleft()
+            if now - cluster.last_seen <= self.window:
+                # Seen again since it was queued; requeue with its new time
+                self._order.append((cluster.last_seen, cluster))
+                continue
+            for key in self._band_keys(cluster.signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.pop(cluster.id, None)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def __len__(self):
+        return len({cid for bucket in self._buckets.values() for cid in bucket})
+
+    def add(self, text_norm, timestamp, member=None, signature=None):
+        """Return (cluster, is_duplicate) for a normalized message.
+
+        Empty messages (media-only posts) get a cluster of their own and are
+        never reported as duplicates. `signature` may be minhash(text_norm)
+        computed elsewhere (e.g. in a worker process).
+        """
+        self._expire(timestamp)
+        if signature is None and text_norm:
+            signature = minhash(text_norm, self.num_perm)
+        if signature is None:
+            return Cluster(next(self._ids), None, timestamp), False
+        keys = self._band_keys(signature)
+
+        best, best_sim = None, self.threshold
+        seen = set()
+        for key in keys:
+            for cid, cluster in self._buckets.get(key, {}).items():
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                if abs(timestamp - cluster.last_seen) > self.window:
+                    continue
+                sim = similarity(signature, cluster.signature)
+                if sim >= best_sim:
+                    best, best_sim = cluster, sim
+
+        if best is not None:
+            best.last_seen = max(best.last_seen, timestamp)
+            if member is not None:
+                best.members.append(member)
+            self.duplicates += 1
+            return best, True
+
+        cluster = Cluster(next(self._ids), signature, timestamp)
+        if member is not None:
+            cluster.members.append(member)
+        for key in keys:
+            self._buckets.setdefault(key, {})[cluster.id] = cluster
+        self._order.append((timestamp, cluster))
+        return cluster, False
@@ -0,0 +1,74 @@
+from automaton import AhoCorasick
+
+
+# -----------------------------
+# Compiled gazetteer matcher
+# -----------------------------
+class LocationMatcher:
+    """Token-level Aho-Corasick automaton over normalized location names.
+
+    `locations` is the {normalized_name: {"original", "coordinates"}} map
+    built by the loaders. Dict order is the match priority, exactly like the
+    old linear scan: the first multi-word location in the map wins, then the
+    first single-word one, then the keyword fallback.
+    """
+
+    def __init__(self, locations, keywords=()):
+        self.locations = locations
+        self._names = []
+        self._single = []
+        self._automaton = AhoCorasick()
+        for loc_norm in locations:
+            words = loc_norm.split()
+            if not words:
+                continue
+            rank = len(self._names)
+            self._names.append(loc_norm)
+            self._single.append(len(words) == 1)
+            self._automaton.add(words, rank)
+        self._automaton.build()
+
+        # The fallback location depends only on the keyword, so resolve it once
+        self._fallback = []
+        for kw in keywords:
+            for loc_norm in locations:
+                if loc_norm.startswith(kw) or kw in loc_norm:
+                    self._fallback.append((kw, loc_norm))
+                    break
+
+    def __len__(self):
+        return len(self._names)
+
+    def find_all(self, text_norm):
+        """Return every (start_word, end_word, loc_norm) match in the text."""
+        names = self._names
+        return [
+            (start, end, names[rank])
+            for start, end, rank in self._automaton.iter_matches(text_norm.split())
+        ]
+
+    def match(self, text_norm):
+        """Return the normalized name of the best location, or None."""
+        best_multi = best_single = None
+        single = self._single
+        for _, _, rank in self._automaton.iter_matches(text_norm.split()):
+            if single[rank]:
+                if best_single is None or rank < best_single:
+                    best_single = rank
+            elif best_multi is None or rank < best_multi:
+                best_multi = rank
+        if best_multi is not None:
+            return self._names[best_multi]
+        if best_single is not None:
+            return self._names[best_single]
+        for kw, loc_norm in self._fallback:
+            if kw in text_norm:
+                return loc_norm
+        return None
+
+    def detect(self, text_norm):
+        loc_norm = self.match(text_norm)
+        if loc_norm is None:
+            return None, None
+        loc_data = self.locations[loc_norm]
+        return loc_data["original"], loc_data["coordinates"]
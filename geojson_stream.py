@@ -0,0 +1,173 @@
+import json
+
+from geometry import GeometryLayer
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+CHUNK_CHARS = 1 << 16       # characters read from the file at a time
+BATCH_VERTICES = 1 << 12    # vertices gathered before centroids are computed
+
+_WS = " \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+def feature_name_coords(feat):
+    """(name, coordinates) of one layer entry, or None.
+
+    Accepts both the converter's {"name", "coordinates"} entries and GeoJSON
+    features with properties/geometry.
+    """
+    if not isinstance(feat, dict):
+        return None
+    props = feat.get("properties") or feat
+    name = props.get("name") or feat.get("name")
+    geom = feat.get("geometry") if "geometry" in feat else feat
+    coords = geom.get("coordinates") if isinstance(geom, dict) else None
+    if name and coords:
+        return name, coords
+    return None
+
+
+# -----------------------------
+# Incremental parser
+# -----------------------------
+class _Reader:
+    """A sliding text buffer over a file; consumed text is dropped."""
+
+    def __init__(self, f, chunk=CHUNK_CHARS):
+        self.f = f
+        self.chunk = chunk
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self, at_least=0):
+        """Read another chunk (at least `at_least` chars); False at end of file."""
+        if self.eof:
+            return False
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.f.read(max(self.chunk, at_least))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def skip_ws(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.more():
+                return
+
+    def peek(self):
+        self.skip_ws()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more of the file as needed."""
+        self.skip_ws()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Usually the value runs past the buffer; grow it geometrically
+                if not self.more(len(self.buf) - self.pos):
+                    raise
+                continue
+            # A number at the very end of the buffer may still be cut short
+            if end == len(self.buf) and not self.eof and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def _find_features_array(reader):
+    """Position the reader just inside the feature array."""
+    first = reader.peek()
+    if first == "[":
+        reader.pos += 1
+        return
+    if first != "{":
+        raise ValueError("expected a JSON array or object")
+    reader.pos += 1
+    # Walk the object's keys; values other than "features" are decoded and dropped
+    while True:
+        if reader.peek() == "}":
+            raise ValueError("object has no features array")
+        key = reader.value()
+        reader.expect(":")
+        if key == "features":
+            reader.expect("[")
+            return
+        reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+
+def iter_raw_features(file_path, chunk=CHUNK_CHARS):
+    """Yield the entries of a layer file one at a time, without loading the whole file.
+
+    Works on the converter's top-level array and on GeoJSON
+    FeatureCollections. Only one entry is decoded in memory at a time.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        reader = _Reader(f, chunk)
+        _find_features_array(reader)
+        if reader.peek() == "]":
+            return
+        while True:
+            yield reader.value()
+            sep = reader.peek()
+            if sep == ",":
+                reader.pos += 1
+            elif sep == "]":
+                return
+            else:
+                raise ValueError(f"expected ',' or ']' at offset {reader.pos}")
+
+def stream_features(file_path, chunk=CHUNK_CHARS):
+    """Like location_index.iter_features, but parsed incrementally."""
+    for feat in iter_raw_features(file_path, chunk):
+        item = feature_name_coords(feat)
+        if item is not None:
+            yield item
+
+
+# -----------------------------
+# Name + centroid reduction
+# -----------------------------
+def _count_vertices(coords):
+    first = coords[0] if coords else None
+    if isinstance(first, (int, float)):
+        return 1
+    if first and isinstance(first[0], (int, float)):
+        return len(coords)   # a ring or line: count without visiting each vertex
+    return sum(map(_count_vertices, coords))
+
+def stream_centroids(file_path, batch_vertices=BATCH_VERTICES, chunk=CHUNK_CHARS):
+    """Yield (name, [lon, lat] or None) per feature, in file order.
+
+    Features are parsed one at a time and reduced in small batches, so
+    memory is bounded by the batch size instead of the file.
+    """
+    batch, vertices = [], 0
+    for name, coords in stream_features(file_path, chunk):
+        batch.append((name, coords))
+        vertices += _count_vertices(coords)
+        if vertices >= batch_vertices:
+            yield from _reduce(batch)
+            batch, vertices = [], 0
+    if batch:
+        yield from _reduce(batch)
+
+def _reduce(batch):
+    layer = GeometryLayer.from_features(batch)
+    for name, (lon, lat) in zip(layer.names, layer.centroids().tolist()):
+        yield name, (None if lon != lon else [lon, lat])
@@ -0,0 +1,198 @@
+from itertools import chain
+
+import numpy as np
+
+# -----------------------------
+# Geometry kinds
+# -----------------------------
+POINT, LINE, POLYGON = 0, 1, 2
+
+# The converted layers store bare coordinate arrays without a geometry type,
+# so the type comes from the nesting depth:
+#   1: [x, y]                 Point
+#   2: [[x, y], ...]          LineString
+#   3: [[[x, y], ...], ...]   Polygon (closed rings) or MultiLineString
+#   4: [[[[x, y], ...]]]      MultiPolygon
+
+
+def _depth(coords):
+    depth = 0
+    while isinstance(coords, (list, tuple)) and coords:
+        coords = coords[0]
+        depth += 1
+    return depth
+
+def _closed(ring):
+    return len(ring) >= 4 and ring[0][0] == ring[-1][0] and ring[0][1] == ring[-1][1]
+
+def split_parts(coords):
+    """Return (kind, [(part, is_hole), ...]) where every part is a list of [x, y]."""
+    depth = _depth(coords)
+    if depth == 1:
+        return POINT, [([coords[:2]], False)]
+    if depth == 2:
+        return LINE, [(coords, False)]
+    if depth == 3:
+        if all(_closed(r) for r in coords):
+            return POLYGON, [(r, i > 0) for i, r in enumerate(coords)]
+        return LINE, [(p, False) for p in coords]
+    if depth == 4:
+        return POLYGON, [(r, i > 0) for poly in coords for i, r in enumerate(poly)]
+    raise ValueError(f"unsupported coordinate nesting depth {depth}")
+
+
+def _pack_points(points):
+    """(P, 2) float64 array from a list of [x, y] (or [x, y, z]) lists."""
+    if sum(map(len, points)) == 2 * len(points):
+        # Flat iterator straight into the buffer; no per-point row objects
+        flat = np.fromiter(chain.from_iterable(points), dtype=np.float64, count=2 * len(points))
+        return flat.reshape(-1, 2)
+    return np.array([p[:2] for p in points], dtype=np.float64).reshape(-1, 2)
+
+
+# -----------------------------
+# Ragged coordinate layer
+# -----------------------------
+class GeometryLayer:
+    """All geometries of one layer packed into flat NumPy arrays.
+
+    coords       (P, 2) float64, every vertex of every part
+    part_start   (R + 1,) index into coords where each part begins
+    part_hole    (R,) True for polygon holes (interior rings)
+    part_feature (R,) feature each part belongs to
+    kinds        (F,) POINT / LINE / POLYGON, -1 for unusable geometry
+    """
+
+    def __init__(self, names, kinds, coords, part_start, part_hole, part_feature):
+        self.names = names
+        self.kinds = kinds
+        self.coords = coords
+        self.part_start = part_start
+        self.part_hole = part_hole
+        self.part_feature = part_feature
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_features(cls, features):
+        """Build from an iterable of (name, coordinates) pairs."""
+        names, kinds, points = [], [], []
+        part_start, part_hole, part_feature = [0], [], []
+        for name, coords in features:
+            fid = len(names)
+            names.append(name)
+            try:
+                kind, parts = split_parts(coords)
+            except (ValueError, TypeError, IndexError):
+                kinds.append(-1)
+                continue
+            kinds.append(kind)
+            for part, hole in parts:
+                if not part:
+                    continue
+                points.extend(part)
+                part_start.append(len(points))
+                part_hole.append(hole)
+                part_feature.append(fid)
+        return cls(
+            names,
+            np.array(kinds, dtype=np.int8),
+            _pack_points(points),
+            np.array(part_start, dtype=np.int64),
+            np.array(part_hole, dtype=bool),
+            np.array(part_feature, dtype=np.int64),
+        )
+
+    # -----------------------------
+    # Centroids
+    # -----------------------------
+    def centroids(self):
+        """(F, 2) lon/lat per feature; NaN where the geometry is unusable.
+
+        Points are themselves, lines get the point halfway along their
+        length, polygons the area-weighted centroid with holes subtracted.
+        Degenerate lines and polygons fall back to the mean of their vertices.
+        """
+        n_feat = len(self.names)
+        out = np.full((n_feat, 2), np.nan)
+        n_parts = len(self.part_hole)
+        if n_parts == 0:
+            return out
+
+        xy = self.coords
+        starts = self.part_start[:-1]
+        ends = self.part_start[1:]
+        counts = ends - starts
+        feat = self.part_feature
+        kinds = self.kinds[feat]
+
+        # Vertex mean per feature: the fallback, and exact for points
+        sums = np.zeros((n_feat, 2))
+        np.add.at(sums, feat, np.add.reduceat(xy, starts, axis=0))
+        nverts = np.bincount(feat, weights=counts, minlength=n_feat)
+        has = nverts > 0
+        out[has] = sums[has] / nverts[has, None]
+
+        # Segments between consecutive vertices of the same part
+        vert_part = np.repeat(np.arange(n_parts), counts)
+        same = vert_part[:-1] == vert_part[1:]
+        # Shift every part to its first vertex to keep the products well conditioned
+        local = xy - xy[np.repeat(starts, counts)]
+        a, b = local[:-1], local[1:]
+        seg_part = vert_part[:-1]
+
+        self._polygon_centroids(out, a, b, same, seg_part, kinds, starts)
+        self._line_midpoints(out, xy, a, b, same, seg_part, kinds, starts)
+        return out
+
+    def _polygon_centroids(self, out, a, b, same, seg_part, kinds, starts):
+        n_parts = len(self.part_hole)
+        cross = (a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]) * same
+        area2 = np.bincount(seg_part, weights=cross, minlength=n_parts)
+        cx6 = np.bincount(seg_part, weights=(a[:, 0] + b[:, 0]) * cross, minlength=n_parts)
+        cy6 = np.bincount(seg_part, weights=(a[:, 1] + b[:, 1]) * cross, minlength=n_parts)
+
+        is_poly = (kinds == POLYGON) & (area2 != 0)
+        area = np.abs(area2) / 2.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ring_cx = cx6 / (3.0 * area2) + self.coords[starts, 0]
+            ring_cy = cy6 / (3.0 * area2) + self.coords[starts, 1]
+        # Holes take their area away from the polygon, whatever their winding
+        weight = np.where(self.part_hole, -area, area) * is_poly
+
+        n_feat = len(self.names)
+        w = np.bincount(self.part_feature, weights=weight, minlength=n_feat)
+        wx = np.bincount(self.part_feature, weights=np.nan_to_num(ring_cx) * weight, minlength=n_feat)
+        wy = np.bincount(self.part_feature, weights=np.nan_to_num(ring_cy) * weight, minlength=n_feat)
+        ok = (self.kinds == POLYGON) & (w > 0)
+        out[ok, 0] = wx[ok] / w[ok]
+        out[ok, 1] = wy[ok] / w[ok]
+
+    def _line_midpoints(self, out, xy, a, b, same, seg_part, kinds, starts):
+        seg_len = np.hypot(b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]) * same
+        seg_line = same & (kinds[seg_part] == LINE)
+        seg_len = seg_len * seg_line
+        seg_feat = self.part_feature[seg_part]
+
+        n_feat = len(self.names)
+        total = np.bincount(seg_feat, weights=seg_len, minlength=n_feat)
+        is_line = (self.kinds == LINE) & (total > 0)
+        if not is_line.any():
+            return
+        # Global running length; each feature's segments are contiguous
+        cum = np.cumsum(seg_len)
+        first_seg = np.full(n_feat, len(seg_len), dtype=np.int64)
+        np.minimum.at(first_seg, seg_feat, np.arange(len(seg_len)))
+        fids = np.nonzero(is_line)[0]
+        before = np.where(first_seg[fids] > 0, cum[first_seg[fids] - 1], 0.0)
+        target = before + total[fids] / 2.0
+        # Segment where the running length crosses the halfway mark
+        idx = np.searchsorted(cum, target)
+        idx = np.minimum(idx, len(seg_len) - 1)
+        start_len = cum[idx] - seg_len[idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(seg_len[idx] > 0, (target - start_len) / seg_len[idx], 0.0)
+        # Segment idx runs from vertex idx to idx + 1
+        p0, p1 = xy[idx], xy[idx + 1]
+        out[fids] = p0 + (p1 - p0) * t[:, None]
@@ -0,0 +1,281 @@
+import heapq
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+
+from incident_store import read_legacy, read_segment
+from cluster_index import ClusterIndex
+from regions import region_key, region_keys
+from rollups import Rollups, TOP_LOCATIONS
+from spatial_index import GridIndex, haversine_km
+
+
+# -----------------------------
+# Time helpers
+# -----------------------------
+def parse_timestamp(date_str):
+    """Parse a record date to a UTC epoch; naive dates are taken as UTC."""
+    try:
+        dt = datetime.fromisoformat(date_str.replace("Z", "+00:00"))
+    except Exception:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+# -----------------------------
+# Incident cache
+# -----------------------------
+class IncidentCache:
+    """Pre-normalized incidents kept in memory and refreshed from the store.
+
+    The store is only re-read when a file's mtime or size changes, and when
+    the newest segment merely grew only the new lines are parsed. Records
+    are kept in store order with a timestamp index beside them, so a time
+    window is a bisect rather than a scan. If `locate` is given (prepared
+    record -> (lat, lon) or None) records also go into a grid index, so a
+    bbox or radius only visits the cells it covers, and into per-zoom map
+    clusters limited to the last `cluster_hours` (None keeps every record).
+    Per-hour and per-day counts are kept in `rollups` as records arrive,
+    and records tagged with "regions" are indexed by each region's P-code
+    and name.
+    """
+
+    def __init__(self, store, prepare=None, locate=None, cluster_hours=None):
+        self.store = store
+        self.prepare = prepare or (lambda inc: inc)
+        self.locate = locate
+        self.cluster_hours = cluster_hours
+        self.records = []
+        self.generation = 0
+        self.version = "0"
+        self.last_modified = None
+        self._times = []      # sorted (timestamp, seq)
+        self._ts = []         # timestamp (or None) per seq
+        self._spatial = GridIndex()
+        self._map_clusters = ClusterIndex()
+        self._cluster_expiry = []   # heap of (timestamp, seq) in the map clusters
+        self.rollups = Rollups()
+        self._by_region = {}  # region key -> seqs, ascending
+        self._undated = []    # seqs without a parseable date, always returned
+        self._latest = {}     # (cluster_id, incident_type) -> newest seq
+        self._superseded = set()
+        self._files = None    # [(path, mtime_ns, size)]
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+    def _stat_files(self):
+        files = []
+        for path in self.store.files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, st.st_mtime_ns, st.st_size))
+        return files
+
+    def _cluster_cutoff(self):
+        if self.cluster_hours is None:
+            return None
+        return time.time() - self.cluster_hours * 3600
+
+    def _add(self, records):
+        cutoff = self._cluster_cutoff()
+        for inc in records:
+            seq = len(self.records)
+            inc = self.prepare(inc)
+            self.records.append(inc)
+            # A better repost of the same event replaces the earlier record
+            if inc.get("cluster_id"):
+                key = (inc["cluster_id"], inc.get("incident_type"))
+                if key in self._latest:
+                    old = self._latest[key]
+                    self._superseded.add(old)
+                    self._map_clusters.remove(old)
+                    self.rollups.remove(self.records[old], self._ts[old])
+                self._latest[key] = seq
+            ts = parse_timestamp(inc.get("date") or "")
+            self._ts.append(ts)
+            self.rollups.add(inc, ts)
+            for key in region_keys(inc.get("regions")):
+                self._by_region.setdefault(key, []).append(seq)
+            if ts is None:
+                self._undated.append(seq)
+            else:
+                insort(self._times, (ts, seq))
+            point = self.locate(inc) if self.locate is not None else None
+            if point:
+                self._spatial.insert(seq, point[0], point[1])
+                if cutoff is None or ts is None or ts >= cutoff:
+                    self._map_clusters.add(seq, point[0], point[1], inc.get("incident_type"))
+                    if ts is not None:
+                        heapq.heappush(self._cluster_expiry, (ts, seq))
+
+    def _reload(self, files):
+        self.records, self._times, self._undated, self._offsets = [], [], [], {}
+        self._ts = []
+        self._spatial.clear()
+        self._map_clusters.clear()
+        self._cluster_expiry = []
+        self.rollups.clear()
+        self._by_region = {}
+        self._latest, self._superseded = {}, set()
+        self.generation += 1
+        for path, _, _ in files:
+            if path == self.store.legacy_path:
+                self._add(read_legacy(path))
+            else:
+                records, self._offsets[path] = read_segment(path)
+                self._add(records)
+
+    def refresh(self):
+        """Bring the cache up to date; returns True if anything changed."""
+        with self._lock:
+            files = self._stat_files()
+            if files == self._files:
+                return False
+            old = self._files or []
+            # Appends only touch the newest segment; anything else (compaction,
+            # a rewritten legacy file, a new segment) is a full reload.
+            grown = (
+                len(files) in (len(old), len(old) + 1) and old
+                and files[:len(old) - 1] == old[:-1]
+                and files[len(old) - 1][0] == old[-1][0]
+                and files[len(old) - 1][2] >= old[-1][2]
+                and old[-1][0] in self._offsets
+            )
+            if grown:
+                for path, _, _ in files[len(old) - 1:]:
+                    records, self._offsets[path] = read_segment(path, self._offsets.get(path, 0))
+                    self._add(records)
+            else:
+                self._reload(files)
+            self._files = files
+            # Derived from the files, not from process state, so every worker agrees
+            self.version = "%08x" % zlib.crc32(repr(files).encode("utf-8"))
+            if files:
+                self.last_modified = datetime.fromtimestamp(
+                    max(mtime for _, mtime, _ in files) / 1e9, tz=timezone.utc)
+            return True
+
+    def window(self, hours_window=None, bbox=None, near=None, radius_km=None, region=None):
+        """Return (records, etag) for the records dated within the last hours_window."""
+        records, etag, _ = self.snapshot(hours_window, bbox, near, radius_km, region)
+        return records, etag
+
+    def _area_seqs(self, bbox, near, radius_km):
+        if bbox is not None:
+            return self._spatial.query_bbox(*bbox)
+        return [seq for _, seq in self._spatial.query_radius(near[0], near[1], radius_km)]
+
+    def _in_area(self, seq, bbox, near, radius_km):
+        point = self._spatial.point(seq)
+        if point is None:
+            return False
+        lat, lon = point
+        if bbox is not None:
+            west, south, east, north = bbox
+            return south <= lat <= north and west <= lon <= east
+        return haversine_km(near[0], near[1], lat, lon) <= radius_km
+
+    def _region_seqs(self, region):
+        return self._by_region.get(region_key(region), ())
+
+    def snapshot(self, hours_window=None, bbox=None, near=None, radius_km=None, region=None):
+        """Like window(), plus the cursor to pass to since() afterwards.
+
+        bbox is (west, south, east, north); near is (lat, lon) with
+        radius_km. Records without coordinates never match an area.
+        region is a P-code or an admin region name at any level.
+        """
+        self.refresh()
+        area = bbox is not None or near is not None
+        with self._lock:
+            cutoff = None
+            start = 0
+            if hours_window is not None:
+                cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours_window)).timestamp()
+                start = bisect_left(self._times, (cutoff, -1))
+            if area or region is not None:
+                ts = self._ts
+                candidates = self._area_seqs(bbox, near, radius_km) if area else self._region_seqs(region)
+                if area and region is not None:
+                    in_region = set(self._region_seqs(region))
+                    candidates = [seq for seq in candidates if seq in in_region]
+                seqs = sorted(
+                    seq for seq in candidates
+                    if seq not in self._superseded
+                    and (cutoff is None or ts[seq] is None or ts[seq] >= cutoff)
+                )
+            elif hours_window is None:
+                seqs = [seq for seq in range(len(self.records)) if seq not in self._superseded]
+            else:
+                # Back in store order, as load_incidents always returned them
+                seqs = sorted(
+                    seq for seq in [seq for _, seq in self._times[start:]] + self._undated
+                    if seq not in self._superseded
+                )
+            records = [self.records[seq] for seq in seqs]
+            etag = f"{self.version}-{hours_window}-{start}"
+            if area or region is not None:
+                etag += "-" + "%08x" % zlib.crc32(repr((bbox, near, radius_km, region)).encode("utf-8"))
+            return records, etag, len(self.records)
+
+    def since(self, cursor, hours_window=None, refresh=True, bbox=None, near=None, radius_km=None,
+              region=None):
+        """Return (records, cursor) for the records added after cursor.
+
+        The cursor is the number of records seen so far; store order is
+        append order and compaction keeps it, so it only moves forward.
+        A record may supersede one the client already has (same cluster_id
+        and incident_type); the client is expected to replace it.
+        Returns (None, cursor) if the cursor is ahead of the store, which
+        means the client must do a full reload. bbox / near / radius_km
+        and region filter like snapshot().
+        """
+        if refresh:
+            self.refresh()
+        with self._lock:
+            total = len(self.records)
+            if cursor > total:
+                return None, total
+            seqs = range(cursor, total)
+            if hours_window is not None:
+                cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours_window)).timestamp()
+                seqs = [seq for seq in seqs if (self._ts[seq] or cutoff) >= cutoff]
+            if bbox is not None or near is not None:
+                seqs = [seq for seq in seqs if self._in_area(seq, bbox, near, radius_km)]
+            if region is not None:
+                in_region = set(self._region_seqs(region))
+                seqs = [seq for seq in seqs if seq in in_region]
+            return [self.records[seq] for seq in seqs], total
+
+    def map_clusters(self, zoom, bbox=None):
+        """Return (zoom, clusters, cursor) for the map at `zoom` inside bbox.
+
+        Each cluster has its mean [lat, lon], a count and per-incident_type
+        counts; a cluster of one also carries the incident itself.
+        """
+        self.refresh()
+        with self._lock:
+            cutoff = self._cluster_cutoff()
+            expiry = self._cluster_expiry
+            while expiry and cutoff is not None and expiry[0][0] < cutoff:
+                self._map_clusters.remove(heapq.heappop(expiry)[1])
+            zoom, clusters = self._map_clusters.clusters(zoom, bbox)
+            for cluster in clusters:
+                if "item" in cluster:
+                    cluster["incident"] = self.records[cluster.pop("item")]
+            return zoom, clusters, len(self.records)
+
+    def stats(self, interval="day", since=None, until=None, incident_type=None, top=TOP_LOCATIONS):
+        """Counts from the rollups (see Rollups.query), plus the cursor they are current to."""
+        self.refresh()
+        with self._lock:
+            stats = self.rollups.query(interval, since, until, incident_type, top)
+            stats["cursor"] = len(self.records)
+            return stats
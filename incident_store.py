@@ -0,0 +1,304 @@
+"""Append-only incident store: JSONL segments written once, fsync'd in batches.
+
+Usage:
+    python incident_store.py compact [--dir incidents] [--legacy matched_incidents.json]
+    python incident_store.py stats   [--dir incidents] [--legacy matched_incidents.json]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+STORE_DIR = "incidents"
+LEGACY_FILE = "matched_incidents.json"
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+FSYNC_EVERY = 20        # records
+FSYNC_INTERVAL = 2.0    # seconds
+
+COMPACT_MARKER = "compact.json"   # inputs a committed compaction has not removed yet
+
+RE_SEGMENT = re.compile(r"^segment-(\d{6})\.jsonl$")
+
+
+# -----------------------------
+# Segment helpers
+# -----------------------------
+def segment_name(seq):
+    return f"segment-{seq:06d}.jsonl"
+
+def _segment_seq(path):
+    return int(RE_SEGMENT.match(os.path.basename(path)).group(1))
+
+def read_segment(path, offset=0):
+    """Return (records, end_offset) for the complete lines after offset.
+
+    A trailing line without a newline is a write still in progress (or cut
+    by a crash), so it is left for the next read instead of being parsed.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    records = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            print(f"[STORE] Skipping corrupt line in {path}: {e}")
+    return records, offset + end
+
+def _write_segment(path, records):
+    """Atomically replace (or create) the segment at path with records."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_legacy(path):
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except Exception as e:
+        print(f"Error loading existing matches: {e}")
+        return []
+
+
+# -----------------------------
+# Store
+# -----------------------------
+class IncidentStore:
+    """Records live in the legacy JSON array (read-only) followed by JSONL segments.
+
+    Only one process (the scraper) should append; any number may read.
+    """
+
+    def __init__(self, root=STORE_DIR, legacy_path=LEGACY_FILE,
+                 fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL,
+                 segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.root = root
+        self.legacy_path = legacy_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.segment_max_bytes = segment_max_bytes
+        self._fh = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def segments(self):
+        if not os.path.isdir(self.root):
+            return []
+        names = sorted(n for n in os.listdir(self.root) if RE_SEGMENT.match(n))
+        return [os.path.join(self.root, n) for n in names]
+
+    def _compaction(self):
+        """The marker of an interrupted compaction as (target, sources, legacy), or None."""
+        try:
+            with open(os.path.join(self.root, COMPACT_MARKER), "r", encoding="utf-8") as f:
+                marker = json.load(f)
+        except FileNotFoundError:
+            return None
+        target = os.path.join(self.root, marker["target"])
+        return target, [os.path.join(self.root, n) for n in marker["sources"]], marker["legacy"]
+
+    def files(self):
+        """The files holding the records, in store order: the legacy file, then the segments.
+
+        Inputs of a compaction that was committed but not cleaned up are
+        left out: the merged segment already holds their records.
+        """
+        skip = set()
+        compaction = self._compaction()
+        # Until the merged file is renamed into place the old files are the store
+        if compaction and not os.path.exists(compaction[0] + ".tmp"):
+            target, sources, legacy = compaction
+            skip.update(sources)
+            if legacy:
+                skip.add(self.legacy_path)
+        paths = [self.legacy_path] if self.legacy_path and os.path.exists(self.legacy_path) else []
+        return [p for p in paths + self.segments() if p not in skip]
+
+    # --- Write path
+    def _open_segment(self):
+        os.makedirs(self.root, exist_ok=True)
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1]) < self.segment_max_bytes:
+            path = segments[-1]
+        else:
+            seq = _segment_seq(segments[-1]) + 1 if segments else 1
+            path = os.path.join(self.root, segment_name(seq))
+        self._fh = open(path, "ab")
+        # A crash can leave a partial last line; start on a fresh one
+        if self._fh.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._fh.write(b"\n")
+
+    def append(self, record):
+        try:
+            if self._fh is None or self._fh.tell() >= self.segment_max_bytes:
+                self.close()
+                self._open_segment()
+            self._fh.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._fh.flush()
+            self._pending += 1
+            if (self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self.sync()
+        except Exception as e:
+            print(f"Error saving match: {e}")
+
+    def sync(self):
+        if self._fh is not None and self._pending:
+            os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
+
+    # --- Read path
+    def load(self):
+        records = []
+        for path in self.files():
+            records.extend(read_legacy(path) if path == self.legacy_path else read_segment(path)[0])
+        return records
+
+    # --- Maintenance
+    def compact(self):
+        """Fold the legacy file and every closed segment into a single segment.
+
+        The newest segment may still be appended to by a running scraper, so
+        it is left alone. Record order is preserved. The inputs are listed in
+        a marker before the merged segment replaces the target, so a crash
+        never leaves their records in two places: readers skip them, and
+        the next compact() removes them.
+        """
+        self._finish_compaction()
+        segments = self.segments()
+        closed = segments[:-1]
+        has_legacy = bool(self.legacy_path) and os.path.exists(self.legacy_path)
+        if closed:
+            target = closed[-1]
+        else:
+            # Give the legacy records a segment that sorts before the active one
+            seq = _segment_seq(segments[0]) - 1 if segments else 1
+            target = os.path.join(self.root, segment_name(seq)) if seq >= 0 else None
+        if target is None or (not has_legacy and len(closed) < 2):
+            print("[STORE] Nothing to compact")
+            return 0
+        os.makedirs(self.root, exist_ok=True)
+
+        records = read_legacy(self.legacy_path)
+        for path in closed:
+            records.extend(read_segment(path)[0])
+
+        tmp_path = target + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        marker_path = os.path.join(self.root, COMPACT_MARKER)
+        with open(marker_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"target": os.path.basename(target),
+                       "sources": [os.path.basename(p) for p in closed[:-1]],
+                       "legacy": has_legacy}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(marker_path + ".tmp", marker_path)
+        self._finish_compaction()
+        print(f"[STORE] Compacted {len(records)} records into {target}")
+        return len(records)
+
+    def _finish_compaction(self):
+        """Commit the merged segment of a marked compaction, then remove its inputs."""
+        compaction = self._compaction()
+        if compaction is None:
+            return
+        target, sources, legacy = compaction
+        if os.path.exists(target + ".tmp"):
+            os.replace(target + ".tmp", target)
+        for path in sources:
+            if os.path.exists(path):
+                os.remove(path)
+        if legacy and self.legacy_path and os.path.exists(self.legacy_path):
+            os.replace(self.legacy_path, self.legacy_path + ".bak")
+        os.remove(os.path.join(self.root, COMPACT_MARKER))
+
+    def rewrite(self, transform, include_active=False):
+        """Pass every record through transform(record) -> record, rewriting the files in place.
+
+        Each file is replaced atomically and keeps its records in order.
+        The newest segment may still be appended to by a running scraper,
+        so it is only rewritten with include_active. It is then written under
+        the next segment name: readers such as IncidentCache take a grown
+        newest segment for appends and would read on from their old offset.
+        Returns the record count.
+        """
+        self._finish_compaction()
+        segments = self.segments()
+        active = segments.pop() if segments else None
+        total = 0
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            records = [transform(rec) for rec in read_legacy(self.legacy_path)]
+            tmp_path = self.legacy_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.legacy_path)
+            total += len(records)
+        for path in segments:
+            records, _ = read_segment(path)
+            _write_segment(path, [transform(rec) for rec in records])
+            total += len(records)
+        if include_active and active:
+            records, _ = read_segment(active)
+            _write_segment(os.path.join(self.root, segment_name(_segment_seq(active) + 1)),
+                           [transform(rec) for rec in records])
+            # Until the old name is gone a reader may see both; its next refresh reloads
+            os.remove(active)
+            total += len(records)
+        return total
+
+
+def load_incidents(root=STORE_DIR, legacy_path=LEGACY_FILE):
+    return IncidentStore(root, legacy_path).load()
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["compact", "stats"])
+    parser.add_argument("--dir", default=STORE_DIR)
+    parser.add_argument("--legacy", default=LEGACY_FILE)
+    args = parser.parse_args()
+
+    store = IncidentStore(args.dir, args.legacy)
+    if args.command == "compact":
+        store.compact()
+    else:
+        segments = [p for p in store.files() if p != store.legacy_path]
+        size = sum(os.path.getsize(p) for p in segments)
+        print(f"{len(store.load())} records, {len(segments)} segments ({size} bytes), "
+              f"legacy file: {'yes' if os.path.exists(args.legacy) else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+from arabic import normalize_arabic
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+CACHE_FILE = "llm_cache.sqlite"
+CACHE_SIZE = 2048   # entries kept in memory
+
+
+# -----------------------------
+# Two-tier cache
+# -----------------------------
+class LLMCache:
+    """LLM extraction results keyed by a hash of the normalized message and model.
+
+    A bounded in-memory LRU sits in front of a SQLite table that survives
+    restarts. Only successful extractions are stored; a timeout or an
+    unparsable answer should be retried next time, not remembered.
+    """
+
+    def __init__(self, path=CACHE_FILE, capacity=CACHE_SIZE, normalize=normalize_arabic):
+        self.capacity = capacity
+        self.normalize = normalize
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, model TEXT, value TEXT, created REAL)"
+            )
+            self._db.commit()
+
+    def key(self, message, model):
+        text = self.normalize(message or "")
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            self.memory_hits += 1
+            return self._lru[key]
+        if self._db is not None:
+            row = self._db.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value, model=""):
+        if value is None:
+            return
+        self._remember(key, value)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, value, created) VALUES (?, ?, ?, ?)",
+                (key, model, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CachedLLM:
+    """Wraps an LLM backend (anything with async extract/close) with an LLMCache.
+
+    Identical messages that arrive while the first one is still being
+    answered wait for that answer instead of calling the model again.
+    """
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.model = getattr(backend, "model", "")
+        self.shared_hits = 0
+        self._inflight = {}
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["shared_hits"] = self.shared_hits
+        return stats
+
+    async def extract(self, message):
+        if not message:
+            return None
+        key = self.cache.key(message, self.model)
+        if key in self._inflight:
+            self.shared_hits += 1
+            result = await asyncio.shield(self._inflight[key])
+            return json.loads(json.dumps(result)) if result is not None else None
+        cached = self.cache.get(key)
+        if cached is not None:
+            # Callers may edit the result; keep the cached copy intact
+            return json.loads(json.dumps(cached))
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await self.backend.extract(message)
+            self.cache.put(key, result, self.model)
+            fut.set_result(result)
+            # result is also the copy in the memory cache and the one waiters copy from
+            return json.loads(json.dumps(result)) if result is not None else None
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # Nobody else may be waiting; don't warn about an unretrieved exception
+            fut.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def close(self):
+        await self.backend.close()
+        self.cache.close()
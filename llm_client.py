@@ -0,0 +1,344 @@
+import asyncio
+import json
+import re
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+import metrics
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+OLLAMA_URL = "http://127.0.0.1:11434"
+DEFAULT_MODEL = "phi3:mini"
+DEFAULT_TIMEOUT = 60
+DEFAULT_CONCURRENCY = 2
+DEFAULT_BATCH_SIZE = 1       # messages per prompt; 1 disables batching
+DEFAULT_BATCH_WAIT = 0.05    # seconds to wait for a batch to fill up
+
+LLM_CALLS = metrics.counter("llm_calls_total", "Model calls by outcome: ok, timeout, error, unparsable",
+                            ["outcome"])
+LLM_SECONDS = metrics.histogram("llm_request_seconds", "Duration of one model call, batches included")
+
+def _count_call(result=None, error=None):
+    if isinstance(error, (asyncio.TimeoutError, subprocess.TimeoutExpired)):
+        LLM_CALLS.inc(outcome="timeout")
+    elif error is not None:
+        LLM_CALLS.inc(outcome="error")
+    else:
+        LLM_CALLS.inc(outcome="ok" if result is not None else "unparsable")
+
+
+# -----------------------------
+# Prompts
+# -----------------------------
+def build_prompt(message: str) -> str:
+    return f"""
+You are an incident analysis assistant.
+Return ONLY valid JSON. Do NOT include any explanations.
+{{"location": ..., "incident_type": ..., "threat_level": ..., "casualties": [...], "numbers": [...]}}
+
+Message: "{message}"
+"""
+
+def build_batch_prompt(messages) -> str:
+    numbered = "\n".join(f'{i}. "{m}"' for i, m in enumerate(messages, 1))
+    return f"""
+You are an incident analysis assistant.
+Return ONLY a valid JSON array with exactly one object per message, in the same order. Do NOT include any explanations.
+[{{"location": ..., "incident_type": ..., "threat_level": ..., "casualties": [...], "numbers": [...]}}, ...]
+
+Messages:
+{numbered}
+"""
+
+
+# -----------------------------
+# Robust Phi3 JSON Extractor
+# -----------------------------
+def _strip_fences(text):
+    text = re.sub(r'```json|```', '', text).strip()
+    text = re.sub(r'^"{3,}', '', text).strip()
+    return re.sub(r'"{3,}$', '', text).strip()
+
+def _clean_json(json_str):
+    json_str = re.sub(r'//.*', '', json_str)
+    return re.sub(r',\s*([}\]])', r'\1', json_str)
+
+def _fix_fields(data):
+    # Force incident_type as list
+    itype = data.get("incident_type")
+    if itype:
+        if not isinstance(itype, list):
+            data["incident_type"] = [itype]
+    else:
+        data["incident_type"] = []
+    if "threat_level" in data and data["threat_level"] not in ["yes", "no"]:
+        data["threat_level"] = "yes"
+    return data
+
+def robust_json_extract(text):
+    if not text:
+        return None
+
+    text = _strip_fences(text)
+    start = text.find('{')
+    end = text.rfind('}')
+    if start == -1 or end == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(_clean_json(text[start:end+1]))
+        return _fix_fields(data)
+    except Exception:
+        return None
+
+def robust_json_list_extract(text, expected):
+    """Parse a batch answer; returns None unless it has exactly `expected` objects."""
+    if not text:
+        return None
+    text = _strip_fences(text)
+    start = text.find('[')
+    end = text.rfind(']')
+    if start == -1 or end == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(_clean_json(text[start:end+1]))
+    except Exception:
+        return None
+    if not isinstance(data, list) or len(data) != expected:
+        return None
+    return [_fix_fields(d) if isinstance(d, dict) else None for d in data]
+
+
+# -----------------------------
+# Phi3 JSON query (subprocess)
+# -----------------------------
+def query_phi3_json(message: str, model=DEFAULT_MODEL, timeout=DEFAULT_TIMEOUT):
+    if not message:
+        return None
+
+    start = time.perf_counter()
+    try:
+        res = subprocess.run(
+            ["ollama", "run", model],
+            input=build_prompt(message).encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout
+        )
+        text = res.stdout.decode("utf-8", errors="ignore").strip()
+        result = robust_json_extract(text)
+        _count_call(result)
+        return result
+    except Exception as e:
+        print("Phi3 call failed:", e)
+        _count_call(error=e)
+        return None
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - start)
+
+
+class SubprocessLLM:
+    """The original `ollama run` path, moved off the event loop into threads."""
+
+    def __init__(self, model=DEFAULT_MODEL, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+        self.model = model
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(concurrency)
+
+    async def extract(self, message):
+        async with self._sem:
+            return await asyncio.to_thread(query_phi3_json, message, self.model, self.timeout)
+
+    async def close(self):
+        pass
+
+
+# -----------------------------
+# Ollama HTTP client
+# -----------------------------
+class HTTPError(Exception):
+    pass
+
+
+class OllamaClient:
+    """Async client for an Ollama-compatible /api/generate endpoint.
+
+    Keeps a pool of HTTP/1.1 keep-alive connections, caps the number of
+    requests in flight with a semaphore, and can pack several messages into
+    one prompt (batch_size > 1). A batch answer that does not parse falls
+    back to one request per message.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, base_url=OLLAMA_URL, timeout=DEFAULT_TIMEOUT,
+                 concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE,
+                 batch_wait=DEFAULT_BATCH_WAIT):
+        url = urlsplit(base_url)
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 80
+        self.model = model
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self._sem = asyncio.Semaphore(concurrency)
+        self._idle = []
+        self._pending = []
+        self._flush_handle = None
+        self._batches = set()   # running batch tasks; the loop itself only keeps weak references
+
+    # --- Connection pool
+    async def _acquire(self, fresh=False):
+        while self._idle and not fresh:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        return await asyncio.open_connection(self.host, self.port), False
+
+    def _release(self, conn, reusable):
+        if reusable:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    # --- HTTP
+    async def _request(self, path, payload):
+        try:
+            return await self._send(path, payload)
+        except (HTTPError, ConnectionError, asyncio.IncompleteReadError) as e:
+            # A pooled connection the server already closed; retry on a new one
+            if not getattr(e, "reused", False):
+                raise
+            return await self._send(path, payload, fresh=True)
+
+    async def _send(self, path, payload, fresh=False):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"POST {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("ascii")
+        conn, reused = await self._acquire(fresh)
+        reader, writer = conn
+        reusable = False
+        try:
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise HTTPError("connection closed by server")
+            except (HTTPError, ConnectionError) as e:
+                e.reused = reused
+                raise
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                data = await self._read_chunked(reader)
+            else:
+                data = await reader.readexactly(int(headers.get("content-length", 0)))
+            reusable = headers.get("connection", "").lower() != "close"
+            if status != 200:
+                raise HTTPError(f"HTTP {status}: {data[:200]!r}")
+            return json.loads(data)
+        finally:
+            self._release(conn, reusable)
+
+    @staticmethod
+    async def _read_chunked(reader):
+        parts = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return b"".join(parts)
+            parts.append(await reader.readexactly(size))
+            await reader.readline()
+
+    async def generate(self, prompt):
+        async with self._sem:
+            # Timed inside the semaphore: waiting for a slot is not the model's time
+            with LLM_SECONDS.time():
+                res = await asyncio.wait_for(
+                    self._request("/api/generate", {"model": self.model, "prompt": prompt, "stream": False}),
+                    self.timeout,
+                )
+        return res.get("response", "")
+
+    # --- Extraction
+    async def _extract_one(self, message):
+        try:
+            result = robust_json_extract(await self.generate(build_prompt(message)))
+        except Exception as e:
+            print("Phi3 call failed:", repr(e))
+            _count_call(error=e)
+            return None
+        _count_call(result)
+        return result
+
+    async def extract(self, message):
+        if not message:
+            return None
+        if self.batch_size == 1:
+            return await self._extract_one(message)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((message, fut))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        messages = [m for m, _ in batch]
+        results = None
+        if len(batch) > 1:
+            try:
+                text = await self.generate(build_batch_prompt(messages))
+                results = robust_json_list_extract(text, len(batch))
+                _count_call(results)
+            except Exception as e:
+                print("Phi3 batch call failed:", repr(e))
+                _count_call(error=e)
+        if results is None:
+            results = await asyncio.gather(*(self._extract_one(m) for m in messages))
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+
+def make_llm(backend="http", **kwargs):
+    if backend == "subprocess":
+        kwargs.pop("base_url", None)
+        kwargs.pop("batch_size", None)
+        kwargs.pop("batch_wait", None)
+        return SubprocessLLM(**kwargs)
+    return OllamaClient(**kwargs)
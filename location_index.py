@@ -0,0 +1,496 @@
+"""Precompiled, memory-mappable location index built from the geojson_output folder.
+
+Layer files are parsed in parallel worker processes. When two layers share
+a name, the layer with the better LAYER_PRIORITY wins (places over
+buildings); within the same priority the later file wins.
+
+Usage:
+    python location_index.py [GEOJSON_FOLDER] [--out location_index.bin] [--force] [--jobs N]
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from arabic import normalize_arabic, is_arabic
+from geojson_stream import feature_name_coords, stream_centroids
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+INDEX_FILE = "location_index.bin"
+INDEX_VERSION = 2   # 2: area-weighted polygon centroids, line midpoints
+MAGIC = b"LOCIDX01"
+
+FLAG_ARABIC = 1
+FLAG_CENTROID = 2
+
+# Which layer keeps a name that appears in several, matched on the file name;
+# lower wins. "waterways" is listed before "water" so it matches first.
+LAYER_PRIORITY = [
+    ("places", 0),
+    ("natural", 1),
+    ("waterways", 1),
+    ("water", 1),
+    ("landuse", 2),
+    ("pofw", 3),
+    ("pois", 3),
+    ("transport", 3),
+    ("traffic", 4),
+    ("buildings", 5),
+]
+DEFAULT_PRIORITY = 3
+LAZY_MAX_PRIORITY = 1                  # layers loaded before serving in lazy mode
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024   # below this, worker start-up costs more than it saves
+
+LOAD_SECONDS = metrics.gauge("gazetteer_load_seconds",
+                             "Last location map load: full, priority (lazy first pass) or background",
+                             ["phase"])
+INDEX_BUILDS = metrics.counter("gazetteer_index_builds_total", "Location index rebuilds")
+
+# File layout:
+#   MAGIC | uint32 header length | JSON header | padding to 8 bytes | sections
+# Every section is 8-byte aligned and described by (offset, length) in the header.
+SECTIONS = [
+    ("centroids", "d"),      # lon, lat pairs (NaN when no centroid)
+    ("flags", "B"),          # FLAG_ARABIC | FLAG_CENTROID
+    ("sources", "H"),        # index into header["sources"]
+    ("norm_offsets", "I"),   # code point offsets into norm_names
+    ("orig_offsets", "I"),   # code point offsets into original_names
+    ("norm_names", None),    # utf-8
+    ("orig_names", None),    # utf-8
+]
+
+
+# -----------------------------
+# Source manifest
+# -----------------------------
+def list_sources(folder_path):
+    # Sorted so ties between equal-priority layers do not depend on the filesystem order
+    return sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".json"))
+
+def layer_priority(file_name):
+    name = file_name.lower()
+    for key, priority in LAYER_PRIORITY:
+        if key in name:
+            return priority
+    return DEFAULT_PRIORITY
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def source_manifest(folder_path):
+    manifest = []
+    for name in list_sources(folder_path):
+        st = os.stat(os.path.join(folder_path, name))
+        manifest.append({"name": name, "mtime": st.st_mtime, "size": st.st_size, "sha1": None})
+    return manifest
+
+
+# -----------------------------
+# Build
+# -----------------------------
+def iter_features(file_path):
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        features = data.get("features", [])
+    elif isinstance(data, list):
+        features = data
+    else:
+        features = []
+    for feat in features:
+        item = feature_name_coords(feat)
+        if item is not None:
+            yield item
+
+def parse_layer(file_path):
+    """Names, flags and centroids of one layer file, in file order."""
+    layer = {"sha1": file_sha1(file_path), "norms": [], "origs": [],
+             "flags": array("B"), "centroids": array("d")}
+    try:
+        # Parsed feature by feature, so memory does not grow with the layer
+        for name, centroid in stream_centroids(file_path):
+            flag = FLAG_ARABIC if is_arabic(name) else 0
+            if centroid:
+                flag |= FLAG_CENTROID
+                layer["centroids"].extend(centroid)
+            else:
+                layer["centroids"].extend((float("nan"), float("nan")))
+            layer["flags"].append(flag)
+            layer["norms"].append(normalize_arabic(name))
+            layer["origs"].append(name)
+    except Exception as e:
+        print(f"Error loading {os.path.basename(file_path)}: {e}")
+    return layer
+
+def _parse_in_worker(paths):
+    # A fresh interpreter rather than multiprocessing: app.py and scraper.py load
+    # locations at import time, and spawn-based pools re-import the main module
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--parse-layer", *paths],
+                          capture_output=True)
+    if proc.stderr:
+        sys.stdout.write(proc.stderr.decode("utf-8", "replace"))
+    if proc.returncode != 0:
+        print(f"[INDEX] Worker failed on {len(paths)} files, parsing in-process")
+        return [parse_layer(p) for p in paths]
+    return pickle.loads(proc.stdout)
+
+def parse_layers(paths, jobs=None):
+    """parse_layer for every path, in order; spread over worker processes when worth it."""
+    jobs = min(jobs or os.cpu_count() or 1, len(paths))
+    sizes = [os.path.getsize(p) for p in paths]
+    if jobs <= 1 or sum(sizes) < PARALLEL_MIN_BYTES:
+        return [parse_layer(p) for p in paths]
+    # One worker per job, each given a share of the files: largest file to the
+    # least loaded worker, so interpreter start-up is paid once per worker
+    shares = [[] for _ in range(jobs)]
+    loads = [0] * jobs
+    for i in sorted(range(len(paths)), key=lambda i: -sizes[i]):
+        w = loads.index(min(loads))
+        shares[w].append(i)
+        loads[w] += sizes[i]
+    parsed = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for share, layers in zip(shares, pool.map(_parse_in_worker, [[paths[i] for i in sh] for sh in shares])):
+            parsed.update(zip(share, layers))
+    return [parsed[i] for i in range(len(paths))]
+
+def merge_locations(rows, arabic_only=False, require_centroid=True):
+    """{normalized_name: {"original", "coordinates"}} from rows in source order.
+
+    rows are (norm, original, flag, lon, lat, priority). A name keeps the
+    entry from its best-priority layer; equal priorities let the later row
+    win. The dict order is that of each name's first appearance.
+    """
+    locations, ranks = {}, {}
+    for norm, original, flag, lon, lat, priority in rows:
+        if arabic_only and not flag & FLAG_ARABIC:
+            continue
+        has_centroid = flag & FLAG_CENTROID
+        if require_centroid and not has_centroid:
+            continue
+        if ranks.get(norm, priority) < priority:
+            continue
+        ranks[norm] = priority
+        locations[norm] = {
+            "original": original,
+            "coordinates": [lon, lat] if has_centroid else None,
+        }
+    return locations
+
+def _layer_rows(layer, priority):
+    centroids = layer["centroids"].tolist()
+    for i, (norm, original, flag) in enumerate(zip(layer["norms"], layer["origs"], layer["flags"])):
+        yield norm, original, flag, centroids[2 * i], centroids[2 * i + 1], priority
+
+def build_index(folder_path, index_path=INDEX_FILE, jobs=None):
+    start = time.perf_counter()
+    INDEX_BUILDS.inc()
+    manifest = source_manifest(folder_path)
+    centroids, flags, sources = array("d"), array("B"), array("H")
+    norm_offsets, orig_offsets = array("I", [0]), array("I", [0])
+    norm_parts, orig_parts = [], []
+    norm_len = orig_len = 0
+
+    layers = parse_layers([os.path.join(folder_path, src["name"]) for src in manifest], jobs)
+    # Merged in manifest order, so the file is the same however the work was split
+    for src_idx, (src, layer) in enumerate(zip(manifest, layers)):
+        src["sha1"] = layer["sha1"]
+        centroids.extend(layer["centroids"])
+        flags.extend(layer["flags"])
+        sources.extend([src_idx] * len(layer["flags"]))
+        for norm, name in zip(layer["norms"], layer["origs"]):
+            norm_parts.append(norm)
+            orig_parts.append(name)
+            norm_len += len(norm)
+            orig_len += len(name)
+            norm_offsets.append(norm_len)
+            orig_offsets.append(orig_len)
+
+    blobs = {
+        "centroids": centroids.tobytes(),
+        "flags": flags.tobytes(),
+        "sources": sources.tobytes(),
+        "norm_offsets": norm_offsets.tobytes(),
+        "orig_offsets": orig_offsets.tobytes(),
+        "norm_names": "".join(norm_parts).encode("utf-8"),
+        "orig_names": "".join(orig_parts).encode("utf-8"),
+    }
+    header = {
+        "version": INDEX_VERSION,
+        "byteorder": sys.byteorder,
+        "count": len(flags),
+        "sources": manifest,
+        "sections": {},
+    }
+    # Offsets are relative to the start of the data area, so the header size does not matter
+    offset = 0
+    for name, _ in SECTIONS:
+        header["sections"][name] = [offset, len(blobs[name])]
+        offset += _align(len(blobs[name]))
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    # The app and the scraper may rebuild at the same time: each writes its own
+    # temp file, so whichever replaces the index last installs a whole one
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(index_path) + ".",
+                                    suffix=".tmp", dir=os.path.dirname(index_path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            for name, _ in SECTIONS:
+                f.write(blobs[name])
+                f.write(b"\0" * (_align(len(blobs[name])) - len(blobs[name])))
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    print(f"[INDEX] {index_path}: {len(flags)} locations from {len(manifest)} files "
+          f"in {time.perf_counter() - start:.2f}s")
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+# -----------------------------
+# Load
+# -----------------------------
+class LocationIndex:
+    """Read-only view over a location index file, backed by mmap."""
+
+    def __init__(self, index_path=INDEX_FILE):
+        self.path = index_path
+        self._file = open(index_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = {}
+        buf = view = None
+        try:
+            if self._mmap[:8] != MAGIC:
+                raise ValueError(f"{index_path} is not a location index")
+            (header_len,) = struct.unpack_from("<I", self._mmap, 8)
+            self.header = json.loads(self._mmap[12:12 + header_len].decode("utf-8"))
+            data_start = _align(12 + header_len)
+
+            buf = memoryview(self._mmap)
+            for name, fmt in SECTIONS:
+                offset, length = self.header["sections"][name]
+                view = buf[data_start + offset:data_start + offset + length]
+                self._views[name] = view.cast(fmt) if fmt else view
+        except Exception:
+            # The traceback keeps these alive, and the mmap cannot close while they are
+            for v in (view, buf):
+                if v is not None:
+                    v.release()
+            self.close()
+            raise
+        self.centroids = self._views["centroids"]
+        self.flags = self._views["flags"]
+        self.source_ids = self._views["sources"]
+        self.sources = [s["name"] for s in self.header["sources"]]
+        self._norm_names = None
+        self._orig_names = None
+
+    def __len__(self):
+        return self.header["count"]
+
+    def close(self):
+        # Views must be released before the mmap can be closed
+        for view in getattr(self, "_views", {}).values():
+            view.release()
+        self._views = {}
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _names(self):
+        if self._norm_names is None:
+            self._norm_names = bytes(self._views["norm_names"]).decode("utf-8")
+            self._orig_names = bytes(self._views["orig_names"]).decode("utf-8")
+        return self._norm_names, self._orig_names
+
+    def norm_name(self, i):
+        off = self._views["norm_offsets"]
+        return self._names()[0][off[i]:off[i + 1]]
+
+    def original_name(self, i):
+        off = self._views["orig_offsets"]
+        return self._names()[1][off[i]:off[i + 1]]
+
+    def centroid(self, i):
+        if not self.flags[i] & FLAG_CENTROID:
+            return None
+        return [self.centroids[2 * i], self.centroids[2 * i + 1]]
+
+    def source(self, i):
+        return self.sources[self.source_ids[i]]
+
+    def is_stale(self, folder_path):
+        if self.header.get("version") != INDEX_VERSION or self.header.get("byteorder") != sys.byteorder:
+            return True
+        current = {s["name"]: s for s in source_manifest(folder_path)}
+        indexed = {s["name"]: s for s in self.header["sources"]}
+        if current.keys() != indexed.keys():
+            return True
+        for name, src in current.items():
+            old = indexed[name]
+            if src["mtime"] == old["mtime"] and src["size"] == old["size"]:
+                continue
+            # Touched but maybe not modified: only the content hash decides
+            if file_sha1(os.path.join(folder_path, name)) != old["sha1"]:
+                return True
+        return False
+
+    def to_locations(self, arabic_only=False, require_centroid=True):
+        """Build the {normalized_name: {"original", "coordinates"}} map (see merge_locations)."""
+        norm_names, orig_names = self._names()
+        norm_off = self._views["norm_offsets"].tolist()
+        orig_off = self._views["orig_offsets"].tolist()
+        centroids = self.centroids.tolist()
+        priorities = [layer_priority(name) for name in self.sources]
+        rows = (
+            (norm_names[norm_off[i]:norm_off[i + 1]], orig_names[orig_off[i]:orig_off[i + 1]],
+             flag, centroids[2 * i], centroids[2 * i + 1], priorities[src])
+            for i, (flag, src) in enumerate(zip(self.flags.tolist(), self.source_ids.tolist()))
+        )
+        return merge_locations(rows, arabic_only, require_centroid)
+
+def _open_current(folder_path, index_path):
+    """The index at index_path if it is up to date with folder_path, else None."""
+    if not os.path.exists(index_path):
+        return None
+    try:
+        index = LocationIndex(index_path)
+        if not index.is_stale(folder_path):
+            return index
+        index.close()
+    except Exception as e:
+        print(f"[INDEX] Rebuilding {index_path}: {e}")
+    return None
+
+def open_index(folder_path, index_path=INDEX_FILE, force=False, jobs=None):
+    """Open the index for folder_path, rebuilding it first if a source changed."""
+    index = None if force else _open_current(folder_path, index_path)
+    if index is not None:
+        return index
+    build_index(folder_path, index_path, jobs)
+    return LocationIndex(index_path)
+
+def load_locations(folder_path, index_path=INDEX_FILE, arabic_only=False, require_centroid=True, jobs=None):
+    start = time.perf_counter()
+    with open_index(folder_path, index_path, jobs=jobs) as index:
+        locations = index.to_locations(arabic_only=arabic_only, require_centroid=require_centroid)
+    LOAD_SECONDS.set(time.perf_counter() - start, phase="full")
+    return locations
+
+
+class LazyLocations:
+    """Locations that can be served before every layer is parsed.
+
+    An up-to-date index is simply loaded. Otherwise only the layers with a
+    priority up to LAZY_MAX_PRIORITY are parsed before returning, and the
+    full index is rebuilt in a background thread once start() is called;
+    when it is done, `locations` is replaced and on_complete(locations) is
+    called.
+    """
+
+    def __init__(self, folder_path, index_path=INDEX_FILE, arabic_only=False, require_centroid=True,
+                 on_complete=None, jobs=None):
+        self.folder_path = folder_path
+        self.index_path = index_path
+        self.arabic_only = arabic_only
+        self.require_centroid = require_centroid
+        self.on_complete = on_complete
+        self.jobs = jobs
+        self.complete = threading.Event()
+
+        start = time.perf_counter()
+        index = _open_current(folder_path, index_path)
+        if index is not None:
+            with index:
+                self.locations = index.to_locations(arabic_only, require_centroid)
+            LOAD_SECONDS.set(time.perf_counter() - start, phase="full")
+            self.complete.set()
+            return
+
+        names = [n for n in list_sources(folder_path) if layer_priority(n) <= LAZY_MAX_PRIORITY]
+        layers = parse_layers([os.path.join(folder_path, n) for n in names], jobs)
+        rows = (row for name, layer in zip(names, layers) for row in _layer_rows(layer, layer_priority(name)))
+        self.locations = merge_locations(rows, arabic_only, require_centroid)
+        LOAD_SECONDS.set(time.perf_counter() - start, phase="priority")
+        print(f"[INDEX] {len(self.locations)} locations from {len(names)} priority layers, "
+              f"the rest load in the background")
+
+    def start(self):
+        """Load the remaining layers in a background thread (no-op if already complete)."""
+        if not self.complete.is_set():
+            threading.Thread(target=self._finish, name="location-index", daemon=True).start()
+
+    def _finish(self):
+        start = time.perf_counter()
+        try:
+            with open_index(self.folder_path, self.index_path, force=True, jobs=self.jobs) as index:
+                self.locations = index.to_locations(self.arabic_only, self.require_centroid)
+            LOAD_SECONDS.set(time.perf_counter() - start, phase="background")
+            if self.on_complete:
+                self.on_complete(self.locations)
+        except Exception as e:
+            print(f"[INDEX] Background load failed: {e}")
+        finally:
+            self.complete.set()
+
+    def wait(self, timeout=None):
+        return self.complete.wait(timeout)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", nargs="?", default="geojson_output")
+    parser.add_argument("--out", default=INDEX_FILE)
+    parser.add_argument("--force", action="store_true", help="rebuild even if sources are unchanged")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--parse-layer", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.parse_layer:
+        # Worker mode: anything printed goes to stderr, stdout carries the pickle
+        with contextlib.redirect_stdout(sys.stderr):
+            layers = [parse_layer(p) for p in args.parse_layer]
+        sys.stdout.buffer.write(pickle.dumps(layers, protocol=pickle.HIGHEST_PROTOCOL))
+        return
+
+    start = time.perf_counter()
+    with open_index(args.folder, args.out, force=args.force, jobs=args.jobs) as index:
+        locations = index.to_locations()
+        print(f"{len(index)} indexed, {len(locations)} unique names, "
+              f"loaded in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""Process-wide metrics in the Prometheus text format, and a sampling profiler.
+
+Metrics register themselves in REGISTRY when created at import time:
+
+    SAVE_SECONDS = histogram("scraper_save_seconds", "save_match duration")
+    with SAVE_SECONDS.time():
+        ...
+
+render() produces the text a Prometheus scrape expects. Values that
+another object already keeps (cache hit counters, queue sizes) are read
+when rendering, through gauge/counter callbacks, so the hot path does not
+pay for them twice.
+
+Processes without a web app (the scraper) serve the same text with
+serve_http(), or write it to a file for node_exporter's textfile collector.
+
+The profiler samples every thread's stack at a fixed interval and counts
+collapsed stacks ("a;b;c N", the flamegraph.pl input). It is off by
+default and is switched on and off at runtime.
+"""
+import asyncio
+import bisect
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# Seconds; covers a cached lookup (tens of us) up to an LLM call timing out
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+PROFILE_INTERVAL = 0.005    # seconds between stack samples
+PROFILE_MIN_INTERVAL = 0.001   # shorter intervals spend the CPU walking stacks
+PROFILE_MAX_DEPTH = 64
+FILE_INTERVAL = 15          # seconds between write_file() calls in write_periodically
+
+
+# -----------------------------
+# Metric types
+# -----------------------------
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[n]) for n in labelnames)
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, optionally per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # callback() -> {label tuple: value}; for counts some object already keeps
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        values = self.callback() if self.callback else dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    """A value that goes up and down; set() it or give a callback."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative buckets plus sum and count, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label tuple -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(s) for key, s in self._series.items()}
+        for key, s in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cumulative += n
+                yield (self.name + "_bucket",
+                       _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative)
+            yield self.name + "_sum", _format_labels(self.labelnames, key), s[-1]
+            yield self.name + "_count", _format_labels(self.labelnames, key), cumulative
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Modules may be imported twice (__main__ and by name); keep the first
+            return self._metrics.setdefault(metric.name, metric)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # A failing callback must not take the whole scrape down
+                lines.append(f"# {metric.name}: {e!r}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def counter(name, help, labelnames=(), callback=None, registry=REGISTRY):
+    return registry.register(Counter(name, help, labelnames, callback))
+
+def gauge(name, help, labelnames=(), callback=None, registry=REGISTRY):
+    return registry.register(Gauge(name, help, labelnames, callback))
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+    return registry.register(Histogram(name, help, labelnames, buckets))
+
+def render(registry=REGISTRY):
+    return registry.render()
+
+def write_file(path, registry=REGISTRY):
+    """Write the metrics atomically, e.g. for node_exporter's textfile collector."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+def stats_callback(get_stats, fields):
+    """Callback for a counter/gauge labelled by one field of an object's stats() dict.
+
+    get_stats is called on every render, so it can follow a global that gets swapped.
+    """
+    def read():
+        stats = get_stats() or {}
+        return {(field,): stats[field] for field in fields if field in stats}
+    return read
+
+
+# -----------------------------
+# Sampling profiler
+# -----------------------------
+class SamplingProfiler:
+    """Counts collapsed stacks of every other thread, sampled every `interval` seconds."""
+
+    def __init__(self, interval=PROFILE_INTERVAL, max_depth=PROFILE_MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = _StackCounter()
+        self.samples = 0
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, reset=True):
+        if self.running:
+            return False
+        if reset:
+            self.stacks.clear()
+            self.samples = 0
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._stop.set()
+        self._thread.join()
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    thread = threading._active.get(ident)
+                    names[ident] = thread.name if thread else str(ident)
+                stack.append(names[ident])
+                with self._lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, limit=None):
+        """Collapsed stacks, most sampled first."""
+        with self._lock:
+            top = self.stacks.most_common(limit)
+        return "".join(f"{stack} {n}\n" for stack, n in top)
+
+    def status(self):
+        return {"running": self.running, "interval": self.interval,
+                "samples": self.samples, "stacks": len(self.stacks), "started": self.started}
+
+
+PROFILER = SamplingProfiler()
+
+def profiler_control(action, interval=None):
+    """Apply 'start', 'stop' or 'status' to PROFILER; returns its status.
+
+    interval (seconds, a number or its text) applies to 'start'; raises
+    ValueError for an unknown action or an interval that is not a finite
+    number >= PROFILE_MIN_INTERVAL.
+    """
+    if action == "start":
+        if interval is not None:
+            interval = float(interval)
+            if not (PROFILE_MIN_INTERVAL <= interval < math.inf):
+                raise ValueError(f"interval must be a number of seconds >= {PROFILE_MIN_INTERVAL}")
+            PROFILER.interval = interval
+        PROFILER.start()
+    elif action == "stop":
+        PROFILER.stop()
+    elif action != "status":
+        raise ValueError(f"unknown profiler action {action!r}")
+    return PROFILER.status()
+
+
+# -----------------------------
+# Standalone endpoint
+# -----------------------------
+def handle_path(path):
+    """(status, content type, body) for GET /metrics or /profile[?action=start|stop|status]."""
+    url = urlsplit(path)
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    if url.path == "/metrics":
+        return 200, CONTENT_TYPE, render()
+    if url.path == "/profile":
+        action = query.get("action")
+        if action is None:
+            return 200, "text/plain; charset=utf-8", PROFILER.report()
+        try:
+            status = profiler_control(action, query.get("interval"))
+        except ValueError as e:
+            return 400, "text/plain; charset=utf-8", f"{e}\n"
+        return 200, "text/plain; charset=utf-8", "".join(f"{k} {v}\n" for k, v in status.items())
+    return 404, "text/plain; charset=utf-8", "not found\n"
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 2 or parts[0] != "GET":
+            status, ctype, body = 405, "text/plain; charset=utf-8", "only GET\n"
+        else:
+            status, ctype, body = handle_path(parts[1])
+        data = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: {ctype}\r\nContent-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode("ascii") + data
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve_http(host="127.0.0.1", port=9108):
+    """Serve /metrics and /profile on the running event loop; returns the asyncio server."""
+    return await asyncio.start_server(_handle, host, port)
+
+async def write_periodically(path, interval=FILE_INTERVAL):
+    while True:
+        try:
+            write_file(path)
+        except OSError as e:
+            print(f"[METRICS] Could not write {path}: {e}")
+        await asyncio.sleep(interval)
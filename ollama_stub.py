@@ -0,0 +1,102 @@
+"""Local stand-in for the Ollama HTTP API, for running the LLM path offline.
+
+Answers POST /api/generate with canned JSON after an optional delay, so the
+scraper and benchmarks can exercise the LLM client without a model.
+
+Usage:
+    python ollama_stub.py [--port 11434] [--delay 0.2]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RE_BATCH_ITEM = re.compile(r'^\d+\. "(.*)"$', re.M)
+RE_MESSAGE = re.compile(r'Message: "(.*)"', re.S)
+
+STUB_TYPES = {
+    "حريق": "fire",
+    "غارة": "airstrike",
+    "حادث": "vehicle_accident",
+    "انفجار": "explosion",
+}
+
+
+def stub_answer(message):
+    itype = next((t for kw, t in STUB_TYPES.items() if kw in message), "other")
+    return {"location": None, "incident_type": itype, "threat_level": "yes",
+            "casualties": [], "numbers": re.findall(r"[0-9]+", message)}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    # Headers and body go out as two writes; with Nagle on, the body waits
+    # for the client's delayed ACK (~40 ms) on every keep-alive request
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt = payload.get("prompt", "")
+        self.server.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+        batch = RE_BATCH_ITEM.findall(prompt)
+        if batch:
+            answer = [stub_answer(m) for m in batch]
+        else:
+            match = RE_MESSAGE.search(prompt)
+            answer = stub_answer(match.group(1) if match else prompt)
+        body = json.dumps({
+            "model": payload.get("model"),
+            "response": json.dumps(answer, ensure_ascii=False),
+            "done": True,
+        }, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and hung up
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_stub(port=0, delay=0.0):
+    """Start the stub in a daemon thread; returns the server (see .server_address)."""
+    handler = type("Handler", (StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.calls = 0
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per request")
+    args = parser.parse_args()
+    server = start_stub(args.port, args.delay)
+    print(f"Ollama stub listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
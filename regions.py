@@ -0,0 +1,317 @@
+"""Administrative region lookup: which ADM0-ADM4 polygons contain a point.
+
+The admin layers are the converter's output for the boundary shapefiles
+(entries with "level", "pcode" and "hierarchy"). Polygons are kept whole,
+not reduced to a centroid. With shapely, they go into an STRtree and are
+prepared, so a lookup is a tree query plus a prepared point test. Without
+it, a grid over the layers records, per cell, which polygons cover it
+entirely and which only cross it; only the crossing ones are ray cast, and
+only against the edges in the point's grid row.
+
+Usage:
+    python regions.py lookup LAT LON [--geojson geojson_output]
+    python regions.py retag [--geojson geojson_output] [--dir incidents]
+                            [--legacy matched_incidents.json] [--active]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from arabic import normalize_arabic
+from geojson_stream import iter_raw_features
+from incident_store import IncidentStore, LEGACY_FILE, STORE_DIR
+from location_index import list_sources
+
+try:
+    import shapely
+    from shapely.geometry import shape
+except ImportError:   # the grid fallback needs no extra package
+    shapely = None
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+GEOJSON_FOLDER = "geojson_output"
+RE_ADMIN_FILE = re.compile(r"adm(\d)", re.IGNORECASE)   # COD-AB names: *_admbnda_adm2_*
+GRID_DEGREES = 0.02   # fallback grid cell (~2 km); a region's bbox should stay well under 1e6 cells
+
+Region = namedtuple("Region", "level name pcode hierarchy")
+
+
+# -----------------------------
+# Loading
+# -----------------------------
+def admin_files(folder_path):
+    return [name for name in list_sources(folder_path) if RE_ADMIN_FILE.search(name)]
+
+def iter_admin_features(path):
+    """(Region, coordinates) for every polygon entry of one admin layer file."""
+    match = RE_ADMIN_FILE.search(os.path.basename(path))
+    file_level = int(match.group(1)) if match else None
+    for feat in iter_raw_features(path):
+        if not isinstance(feat, dict):
+            continue
+        props = feat.get("properties") or feat
+        geom = feat.get("geometry") if "geometry" in feat else feat
+        coords = geom.get("coordinates") if isinstance(geom, dict) else None
+        level = props.get("level", file_level)
+        if not coords or level is None or _depth(coords) not in (3, 4):
+            continue
+        name = props.get("name")
+        hierarchy = tuple(
+            (h.get("level"), h.get("name"), h.get("pcode")) for h in props.get("hierarchy") or ()
+        )
+        yield Region(int(level), name, props.get("pcode"), hierarchy), coords
+
+def load_regions(folder_path=GEOJSON_FOLDER, backend=None):
+    """RegionIndex over the admin layers in folder_path (empty if there are none)."""
+    start = time.perf_counter()
+    regions, polygons = [], []
+    files = admin_files(folder_path) if os.path.isdir(folder_path) else []
+    for name in files:
+        for region, coords in iter_admin_features(os.path.join(folder_path, name)):
+            regions.append(region)
+            polygons.append(coords)
+    index = RegionIndex(regions, polygons, backend)
+    if files:
+        print(f"[REGIONS] {len(index)} admin polygons from {len(files)} files "
+              f"({index.backend}) in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+# -----------------------------
+# Geometry helpers
+# -----------------------------
+def _depth(coords):
+    depth = 0
+    while isinstance(coords, (list, tuple)) and coords:
+        coords = coords[0]
+        depth += 1
+    return depth
+
+def _rings(coords):
+    """Every ring of a Polygon (depth 3) or MultiPolygon (depth 4)."""
+    return list(coords) if _depth(coords) == 3 else [ring for poly in coords for ring in poly]
+
+def _edges(coords):
+    edges = []
+    for ring in _rings(coords):
+        for (x1, y1, *_), (x2, y2, *_) in zip(ring, ring[1:] + ring[:1]):
+            if x1 != x2 or y1 != y2:
+                edges.append((x1, y1, x2, y2))
+    return edges
+
+def _crossings_inside(edges, x, y):
+    # Even-odd rule over all rings, so holes and multipolygon parts just work
+    inside = False
+    for x1, y1, x2, y2 in edges:
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+# -----------------------------
+# Grid-accelerated ray casting (no shapely)
+# -----------------------------
+class _GridPolygons:
+    INSIDE, BOUNDARY = 1, 0
+
+    def __init__(self, polygons, cell=GRID_DEGREES):
+        self.cell = cell
+        self.cells = {}   # (ix, iy) -> [(polygon id, INSIDE | BOUNDARY)]
+        self.rows = []    # polygon id -> {iy: edges overlapping that grid row}
+        for pid, coords in enumerate(polygons):
+            self._add(pid, coords)
+
+    def _row(self, y):
+        return math.floor(y / self.cell)
+
+    def _add(self, pid, coords):
+        cell = self.cell
+        rows, boundary = {}, set()
+        xs, ys = [], []
+        for edge in _edges(coords):
+            x1, y1, x2, y2 = edge
+            xs += (x1, x2)
+            ys += (y1, y2)
+            iy0, iy1 = sorted((self._row(y1), self._row(y2)))
+            ix0, ix1 = sorted((math.floor(x1 / cell), math.floor(x2 / cell)))
+            for iy in range(iy0, iy1 + 1):
+                # Horizontal edges never cross a horizontal ray, but still make cells boundary ones
+                if y1 != y2:
+                    rows.setdefault(iy, []).append(edge)
+                # The edge's bbox: conservative, but most edges are far shorter than a cell
+                boundary.update((ix, iy) for ix in range(ix0, ix1 + 1))
+        self.rows.append(rows)
+        if not xs:
+            return
+        for ix in range(math.floor(min(xs) / cell), math.floor(max(xs) / cell) + 1):
+            for iy in range(self._row(min(ys)), self._row(max(ys)) + 1):
+                if (ix, iy) in boundary:
+                    self.cells.setdefault((ix, iy), []).append((pid, self.BOUNDARY))
+                # No edge crosses the cell, so its center decides for the whole cell
+                elif _crossings_inside(rows.get(iy, ()), (ix + 0.5) * cell, (iy + 0.5) * cell):
+                    self.cells.setdefault((ix, iy), []).append((pid, self.INSIDE))
+
+    def containing(self, x, y):
+        iy = self._row(y)
+        return [
+            pid for pid, state in self.cells.get((math.floor(x / self.cell), iy), ())
+            if state == self.INSIDE or _crossings_inside(self.rows[pid].get(iy, ()), x, y)
+        ]
+
+
+# -----------------------------
+# STRtree + prepared geometries (shapely)
+# -----------------------------
+class _TreePolygons:
+    def __init__(self, polygons):
+        geoms = []
+        for coords in polygons:
+            gtype = "Polygon" if _depth(coords) == 3 else "MultiPolygon"
+            geom = shape({"type": gtype, "coordinates": coords})
+            if not geom.is_valid:
+                geom = shapely.make_valid(geom)
+            geoms.append(geom)
+        self.geoms = np.array(geoms, dtype=object)
+        shapely.prepare(self.geoms)
+        self.tree = shapely.STRtree(self.geoms)
+
+    def containing(self, x, y):
+        candidates = self.tree.query(shapely.Point(x, y))
+        if not len(candidates):
+            return []
+        # intersects, not contains: a point on a shared border belongs to both sides
+        hits = shapely.intersects_xy(self.geoms[candidates], x, y)
+        return sorted(candidates[hits].tolist())
+
+
+# -----------------------------
+# Region index
+# -----------------------------
+class RegionIndex:
+    """Admin polygons of every level; lookup(lat, lon) gives the point's ADM hierarchy.
+
+    backend is "shapely" or "grid"; by default shapely when it is installed.
+    """
+
+    def __init__(self, regions, polygons, backend=None):
+        if backend is None:
+            backend = "shapely" if shapely is not None else "grid"
+        if backend == "shapely" and shapely is None:
+            raise ValueError("the shapely backend needs shapely installed")
+        if backend not in ("shapely", "grid"):
+            raise ValueError(f"unknown region backend {backend!r}")
+        self.backend = backend
+        self.regions = list(regions)
+        self._polygons = _TreePolygons(polygons) if backend == "shapely" else _GridPolygons(polygons)
+        self._tags = {}   # containing ids -> ((level, name, pcode), ...); few distinct sets exist
+
+    def __len__(self):
+        return len(self.regions)
+
+    def containing(self, lat, lon):
+        """Ids of every region that contains the point, in index order."""
+        if not self.regions:
+            return []
+        return self._polygons.containing(lon, lat)
+
+    def lookup(self, lat, lon):
+        """[{"level", "name", "pcode"}, ...] from ADM0 down, or [] outside every region.
+
+        Each level comes from the polygon that contains the point; levels
+        without a layer of their own are filled in from the hierarchy the
+        converter stored on the deepest one.
+        """
+        ids = tuple(self.containing(lat, lon))
+        tags = self._tags.get(ids)
+        if tags is None:
+            tags = self._tags[ids] = self._hierarchy(ids)
+        return [{"level": level, "name": name, "pcode": pcode} for level, name, pcode in tags]
+
+    def _hierarchy(self, ids):
+        by_level = {}
+        for rid in ids:
+            region = self.regions[rid]
+            by_level.setdefault(region.level, region)
+        if not by_level:
+            return ()
+        tags = {level: (r.name, r.pcode) for level, r in by_level.items()}
+        deepest = by_level[max(by_level)]
+        for level, name, pcode in deepest.hierarchy:
+            if level is not None and level not in tags:
+                tags[level] = (name, pcode)
+        return tuple((level, name, pcode) for level, (name, pcode) in sorted(tags.items()))
+
+    def tag(self, record):
+        """Set record["regions"] from its [lon, lat] coordinates; returns the record."""
+        coords = record.get("coordinates")
+        if isinstance(coords, list) and len(coords) == 2:
+            lon, lat = coords
+            record["regions"] = self.lookup(lat, lon)
+        return record
+
+
+def region_keys(tags):
+    """What ?region= matches a tagged record on: each level's pcode and normalized name."""
+    keys = set()
+    for tag in tags or ():
+        if tag.get("pcode"):
+            keys.add(str(tag["pcode"]).casefold())
+        if tag.get("name"):
+            keys.add(normalize_arabic(tag["name"]).casefold())
+    return keys
+
+def region_key(query):
+    return normalize_arabic(query.strip()).casefold()
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def retag(index, store_dir=STORE_DIR, legacy_path=LEGACY_FILE, include_active=False):
+    """Re-tag every stored record with its regions, rewriting the store files in place."""
+    changed = 0
+
+    def transform(record):
+        nonlocal changed
+        before = record.get("regions")
+        index.tag(record)
+        changed += record.get("regions") != before
+        return record
+
+    total = IncidentStore(store_dir, legacy_path).rewrite(transform, include_active=include_active)
+    print(f"[REGIONS] {changed} of {total} records re-tagged")
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["lookup", "retag"])
+    parser.add_argument("coords", nargs="*", type=float, help="LAT LON for lookup")
+    parser.add_argument("--geojson", default=GEOJSON_FOLDER)
+    parser.add_argument("--backend", choices=["shapely", "grid"], default=None)
+    parser.add_argument("--dir", default=STORE_DIR)
+    parser.add_argument("--legacy", default=LEGACY_FILE)
+    parser.add_argument("--active", action="store_true",
+                        help="also rewrite the newest segment (only with the scraper stopped)")
+    args = parser.parse_args()
+
+    index = load_regions(args.geojson, args.backend)
+    if args.command == "lookup":
+        if len(args.coords) != 2:
+            parser.error("lookup needs LAT LON")
+        print(json.dumps(index.lookup(*args.coords), ensure_ascii=False, indent=2))
+    else:
+        if not len(index):
+            parser.error(f"no admin layers in {args.geojson}")
+        retag(index, args.dir, args.legacy, args.active)
+
+
+if __name__ == "__main__":
+    main()
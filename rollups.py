@@ -0,0 +1,148 @@
+from bisect import bisect_left, insort
+from collections import Counter
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+INTERVALS = {"hour": 3600, "day": 86400}   # bucket widths in seconds, aligned to UTC
+TOP_LOCATIONS = 10
+
+
+def record_casualties(inc):
+    """Casualty categories of a record, each once."""
+    details = inc.get("details")
+    casualties = details.get("casualties") if isinstance(details, dict) else None
+    if not isinstance(casualties, list):
+        return ()
+    return {c for c in casualties if isinstance(c, str)}
+
+
+# -----------------------------
+# Time-bucketed counters
+# -----------------------------
+class _Bucket:
+    __slots__ = ("count", "types", "locations", "casualties", "type_locations", "type_casualties")
+
+    def __init__(self):
+        self.count = 0
+        self.types = Counter()
+        self.locations = Counter()
+        self.casualties = Counter()
+        self.type_locations = Counter()    # (incident_type, location) -> n, for ?type= queries
+        self.type_casualties = Counter()   # (incident_type, category) -> n
+
+    def update(self, itype, location, casualties, sign):
+        self.count += sign
+        self.types[itype] += sign
+        for counter, key in ((self.locations, location), (self.type_locations, (itype, location))):
+            if location:
+                counter[key] += sign
+                if counter[key] <= 0:
+                    del counter[key]
+        for cat in casualties:
+            self.casualties[cat] += sign
+            self.type_casualties[itype, cat] += sign
+            if self.casualties[cat] <= 0:
+                del self.casualties[cat]
+            if self.type_casualties[itype, cat] <= 0:
+                del self.type_casualties[itype, cat]
+        if self.types[itype] <= 0:
+            del self.types[itype]
+
+    def view(self, incident_type=None):
+        """(count, by_type, casualties, locations) of this bucket, optionally for one type."""
+        if incident_type is None:
+            return self.count, self.types, self.casualties, self.locations
+        casualties = {cat: n for (t, cat), n in self.type_casualties.items() if t == incident_type}
+        locations = {loc: n for (t, loc), n in self.type_locations.items() if t == incident_type}
+        n = self.types.get(incident_type, 0)
+        return n, ({incident_type: n} if n else {}), casualties, locations
+
+
+class Rollups:
+    """Incident counts per hour and per day, by type, location and casualty category.
+
+    add() and remove() touch one bucket per interval, so the tables follow
+    the store record by record; a query reads only the buckets in its time
+    range. Undated records are only counted when no range is given.
+    """
+
+    def __init__(self, intervals=INTERVALS):
+        self.intervals = dict(intervals)
+        self.clear()
+
+    def clear(self):
+        self._buckets = {name: {} for name in self.intervals}
+        self._starts = {name: [] for name in self.intervals}   # sorted bucket starts
+        self._undated = _Bucket()
+
+    def _update(self, inc, ts, sign):
+        itype = inc.get("incident_type") or "other"
+        location = inc.get("location") or None
+        casualties = record_casualties(inc)
+        if ts is None:
+            self._undated.update(itype, location, casualties, sign)
+            return
+        for name, width in self.intervals.items():
+            start = int(ts // width * width)
+            buckets = self._buckets[name]
+            bucket = buckets.get(start)
+            if bucket is None:
+                if sign < 0:
+                    continue
+                bucket = buckets[start] = _Bucket()
+                insort(self._starts[name], start)
+            bucket.update(itype, location, casualties, sign)
+            if bucket.count <= 0:
+                del buckets[start]
+                starts = self._starts[name]
+                del starts[bisect_left(starts, start)]
+
+    def add(self, inc, ts):
+        self._update(inc, ts, 1)
+
+    def remove(self, inc, ts):
+        """Take back a record added earlier (a repost superseded it)."""
+        self._update(inc, ts, -1)
+
+    def query(self, interval="day", since=None, until=None, incident_type=None, top=TOP_LOCATIONS):
+        """Per-bucket counts between since and until (epoch seconds), plus totals.
+
+        Bucket starts are epoch seconds; every bucket that overlaps
+        [since, until) is included. by_location lists the `top` locations.
+        """
+        if interval not in self.intervals:
+            raise ValueError(f"interval must be one of {', '.join(self.intervals)}")
+        width = self.intervals[interval]
+        starts = self._starts[interval]
+        lo = 0 if since is None else bisect_left(starts, since // width * width)
+        hi = len(starts) if until is None else bisect_left(starts, until)
+        buckets = self._buckets[interval]
+
+        total, by_type, casualties, locations = 0, Counter(), Counter(), Counter()
+        series = []
+        for start in starts[lo:hi]:
+            n, types, cats, locs = buckets[start].view(incident_type)
+            if not n:
+                continue
+            series.append({"start": start, "count": n, "by_type": dict(types), "casualties": dict(cats)})
+            total += n
+            by_type.update(types)
+            casualties.update(cats)
+            locations.update(locs)
+        undated = 0
+        if since is None and until is None:
+            undated, types, cats, locs = self._undated.view(incident_type)
+            total += undated
+            by_type.update(types)
+            casualties.update(cats)
+            locations.update(locs)
+        return {
+            "interval": interval,
+            "buckets": series,
+            "total": total,
+            "undated": undated,
+            "by_type": dict(by_type.most_common()),
+            "casualties": dict(casualties.most_common()),
+            "by_location": [{"location": loc, "count": n} for loc, n in locations.most_common(top)],
+        }
@@ -1,23 +1,68 @@
+"""Telegram incident scraper: live channel monitoring, or a backfill of channel history.
+
+Metrics are served on http://127.0.0.1:METRICS_PORT/metrics (default 9108),
+with /profile?action=start|stop|status toggling the sampling profiler and
+/profile returning its collapsed stacks.
+
+Usage:
+    python scraper.py
+    python scraper.py --backfill [--from-file messages.jsonl] [--channels a,b]
+                                 [--page-size 500] [--concurrency 8] [--reset]
+"""
+import argparse
 import asyncio
-import json
+import multiprocessing
 import os
 import re
-import subprocess
-import ast
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from telethon import TelegramClient, events
 from telethon.tl.types import Channel
 import qrcode
+from arabic import normalize_arabic
+import backfill
+import metrics
+from backfill import Message
+from classifier import IncidentClassifier
+from dedup import DEDUP_WINDOW, NearDuplicateDetector, minhash
+from gazetteer import LocationMatcher
+from incident_store import IncidentStore
+from llm_cache import CachedLLM, LLMCache
+from llm_client import make_llm
+from location_index import LazyLocations, load_locations
+from regions import load_regions
 
 # -----------------------------
 # CONFIG
 # -----------------------------
-GEOJSON_FOLDER = r"C:\Users\user\OneDrive - Lebanese University\Documents\GitHub\Incident_Project\geojson_output"
-OUTPUT_FILE = "matched_incidents.json"
+GEOJSON_FOLDER = os.environ.get("GEOJSON_FOLDER", r"C:\Users\user\OneDrive - Lebanese University\Documents\GitHub\Incident_Project\geojson_output")
+OUTPUT_FILE = "matched_incidents.json"  # legacy array, read before the store segments
+STORE_DIR = "incidents"
+LOCATION_INDEX_FILE = "location_index.bin"
+# "1": when the index needs a rebuild, start matching against the priority
+# layers and swap in the rest once they are parsed
+LOCATIONS_LAZY = os.environ.get("LOCATIONS_LAZY", "0") == "1"
 OLLAMA_MODEL = "phi3:mini"
 MAX_NUMBER_LEN = 6
 api_id = 20976159
 api_hash = '41bca65c99c9f4fb21ed627cc8f19ad8'
 PHI3_TIMEOUT = 60
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "http")   # "http" or "subprocess"
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
+LLM_CONCURRENCY = 2    # model calls in flight
+LLM_BATCH_SIZE = 1     # messages per prompt (1 = no batching)
+LLM_CACHE_FILE = "llm_cache.sqlite"
+LLM_CACHE_SIZE = 2048  # answers kept in memory; all of them are kept on disk
+PIPELINE_WORKERS = 3   # messages between the CPU pool and the writer at once
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "1000"))
+INGEST_OVERFLOW = os.environ.get("INGEST_OVERFLOW", "block")   # "block", "drop_oldest" or "drop_newest"
+CPU_EXECUTOR = os.environ.get("CPU_EXECUTOR", "thread")        # "thread" or "process"
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", "2"))
+WRITE_QUEUE_SIZE = 1000
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))   # /metrics and /profile; 0 disables
+METRICS_FILE = os.environ.get("METRICS_FILE")                # also write the metrics here, for node_exporter
 
 LOCATION_KEYWORDS = [
     # Longer / specific first
@@ -35,70 +80,33 @@ LOCATION_KEYWORDS = [
 LOCATION_KEYWORDS = sorted(LOCATION_KEYWORDS, key=len, reverse=True)
 
 
-# -----------------------------
-# Arabic normalization
-# -----------------------------
-RE_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u06D6-\u06ED]+")
-
-def normalize_arabic(text: str) -> str:
-    if not text:
-        return ""
-    text = RE_DIACRITICS.sub("", text)
-    text = text.replace('\u0640', '')
-    text = re.sub(r"[إأآا]", "ا", text)
-    text = re.sub(r"[ؤ]", "و", text)
-    text = re.sub(r"[ئ]", "ي", text)
-    text = text.replace('ة', 'ه')
-    text = re.sub(r"[يى]", "ي", text)
-    return re.sub(r"\s+", " ", text).strip()
-
-def is_arabic(text: str) -> bool:
-    return bool(re.search(r'[\u0600-\u06FF]', text))
-
 # -----------------------------
 # Load GeoJSON locations
 # -----------------------------
-def extract_centroid(coords):
-    if not coords:
-        return None
-    if isinstance(coords[0], list):
-        points = coords[0] if isinstance(coords[0][0], list) else coords
+def load_all_geojson_folder(folder_path):
+    # Served from the precompiled index; only rebuilt when a source file changes
+    if LOCATIONS_LAZY:
+        lazy = LazyLocations(folder_path, LOCATION_INDEX_FILE, arabic_only=True, require_centroid=False,
+                             on_complete=use_locations)
+        use_locations(lazy.locations)
+        lazy.start()
     else:
-        points = [coords]
-    lon = sum([p[0] for p in points]) / len(points)
-    lat = sum([p[1] for p in points]) / len(points)
-    return [lon, lat]
+        use_locations(load_locations(folder_path, LOCATION_INDEX_FILE, arabic_only=True, require_centroid=False))
 
-def load_geojson_file(file_path):
-    if not os.path.exists(file_path):
-        return {}
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    features = data.get('features', data) if isinstance(data, dict) else data
-    norm_map = {}
-    for item in features:
-        props = item.get('properties', item) if isinstance(item, dict) else item
-        name = props.get('name') or item.get('name')
-        coords = item.get('geometry', {}).get('coordinates') if 'geometry' in item else item.get('coordinates')
-        if name and coords and is_arabic(name):
-            try:
-                centroid = extract_centroid(coords)
-            except Exception:
-                centroid = None
-            norm_map[normalize_arabic(name)] = {"original": name, "coordinates": centroid}
-    return norm_map
+GAZETTEER_LOCATIONS = metrics.gauge("gazetteer_locations", "Names in the location map in use")
 
-def load_all_geojson_folder(folder_path):
-    all_map = {}
-    for file in os.listdir(folder_path):
-        if file.lower().endswith('.json'):
-            file_path = os.path.join(folder_path, file)
-            locations = load_geojson_file(file_path)
-            all_map.update(locations)
-    return all_map
+def use_locations(locations):
+    global ALL_LOCATIONS, LOCATION_MATCHER
+    # Compiled once per location map; detect_location is a single pass over the message
+    matcher = LocationMatcher(locations, LOCATION_KEYWORDS)
+    ALL_LOCATIONS = locations
+    LOCATION_MATCHER = matcher
+    GAZETTEER_LOCATIONS.set(len(locations))
+    print(f"Loaded {len(locations)} Arabic locations from GeoJSON folder")
 
-ALL_LOCATIONS = load_all_geojson_folder(GEOJSON_FOLDER)
-print(f"Loaded {len(ALL_LOCATIONS)} Arabic locations from GeoJSON folder")
+load_all_geojson_folder(GEOJSON_FOLDER)   # sets ALL_LOCATIONS, LOCATION_MATCHER
+# Admin polygons for tagging records with their ADM hierarchy; empty without admin layers
+REGIONS = load_regions(GEOJSON_FOLDER)
 
 # -----------------------------
 # Location detection
@@ -115,31 +123,8 @@ def detect_location_from_map(text_norm):
     return None, None
 
 def detect_location(text):
-    text_norm = normalize_arabic(text)
-    words = text_norm.split()
-
-    # Step 1: Multi-word location matches
-    for loc_norm, loc_data in ALL_LOCATIONS.items():
-        loc_words = loc_norm.split()
-        if len(loc_words) > 1:
-            for i in range(len(words) - len(loc_words) + 1):
-                if words[i:i+len(loc_words)] == loc_words:
-                    return loc_data["original"], loc_data["coordinates"]
-
-    # Step 2: Single-word location matches
-    for loc_norm, loc_data in ALL_LOCATIONS.items():
-        loc_words = loc_norm.split()
-        if len(loc_words) == 1 and loc_words[0] in words:
-            return loc_data["original"], loc_data["coordinates"]
-
-    # Step 3: Keyword fallback (optional)
-    for kw in LOCATION_KEYWORDS:
-        if kw in text_norm:
-            for loc_norm, loc_data in ALL_LOCATIONS.items():
-                if loc_norm.startswith(kw) or kw in loc_norm:
-                    return loc_data["original"], loc_data["coordinates"]
-
-    return None, None
+    # Multi-word matches first, then single-word, then keyword fallback
+    return LOCATION_MATCHER.detect(normalize_arabic(text))
 
 # -----------------------------
 # Incident keywords
@@ -167,14 +152,11 @@ class IncidentKeywords:
             'missing': ['مفقود', 'مفقودين', 'مفقودة', 'مفقودات', 'اختفى', 'اختفاء', 'فقدان', 'حالة فقدان', 'بلاغ فقدان', 'مفقود الشخص', 'مفقودة الشخص']
         }
 
+        # Keywords are normalized and compiled once, not on every message
+        self.classifier = IncidentClassifier(self.incident_keywords, self.casualty_keywords)
+
     def extract_casualties(self, text):
-        tl = text.lower()
-        cats = []
-        for cat, kws in self.casualty_keywords.items():
-            for kw in kws:
-                if kw in tl:
-                    cats.append(cat)
-        return list(set(cats))
+        return self.classifier.casualties(text)
 
     def extract_numbers(self, text):
         nums = re.findall(r"[0-9]+|[٠-٩]+", text)
@@ -187,97 +169,20 @@ IK = IncidentKeywords()
 # -----------------------------
 # Incident detection helper (multi)
 # -----------------------------
-def find_incident_types(text, incident_keywords):
-    if not text:
-        return []
-    norm_text = normalize_arabic(text)
-    found = []
-    for inc_type, keywords in incident_keywords.items():
-        for kw in keywords:
-            if normalize_arabic(kw) in norm_text:
-                found.append(inc_type)
-    return list(set(found))
+def find_incident_types(text):
+    return IK.classifier.incident_types(text)
 
 # -----------------------------
-# Robust Phi3 JSON Extractor
+# Load/save matches
 # -----------------------------
-def robust_json_extract(text):
-    if not text:
-        return None
-        
-    text = re.sub(r'```json|```', '', text).strip()
-    text = re.sub(r'^"{3,}', '', text).strip()
-    text = re.sub(r'"{3,}$', '', text).strip()
-    start = text.find('{')
-    end = text.rfind('}')
-    if start == -1 or end == -1 or end <= start:
-        return None
-    json_str = text[start:end+1]
-    json_str = re.sub(r'//.*', '', json_str)
-    json_str = re.sub(r',\s*([}\]])', r'\1', json_str)
-    try:
-        data = json.loads(json_str)
-        # Force incident_type as list
-        itype = data.get("incident_type")
-        if itype:
-            if not isinstance(itype, list):
-                data["incident_type"] = [itype]
-        else:
-            data["incident_type"] = []
-        if "threat_level" in data and data["threat_level"] not in ["yes", "no"]:
-            data["threat_level"] = "yes"
-        return data
-    except Exception:
-        return None
+STORE = IncidentStore(STORE_DIR, legacy_path=OUTPUT_FILE)
 
-# -----------------------------
-# Phi3 JSON query
-# -----------------------------
-def query_phi3_json(message: str):
-    if not message:
-        return None
-        
-    prompt = f"""
-You are an incident analysis assistant.
-Return ONLY valid JSON. Do NOT include any explanations.
-{{"location": ..., "incident_type": ..., "threat_level": ..., "casualties": [...], "numbers": [...]}}
+def load_existing_matches():
+    return STORE.load()
 
-Message: "{message}"
-"""
-
-    try:
-        res = subprocess.run(
-            ["ollama", "run", OLLAMA_MODEL],
-            input=prompt.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=PHI3_TIMEOUT
-        )
-        text = res.stdout.decode("utf-8", errors="ignore").strip()
-        return robust_json_extract(text)
-    except Exception as e:
-        print("Phi3 call failed:", e)
-        return None
-
-# -----------------------------
-# Load/save matches
-# -----------------------------
-def load_existing_matches(path=OUTPUT_FILE):
-    if os.path.exists(path):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading existing matches: {e}")
-            return []
-    return []
-
-def save_matches(matches, path=OUTPUT_FILE):
-    try:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(matches, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving matches: {e}")
+def save_match(record):
+    # Appends one line; the store fsyncs in batches instead of rewriting the file
+    STORE.append(record)
 
 # -----------------------------
 # Deduplication
@@ -292,6 +197,23 @@ def select_best_message(records):
     ), reverse=True)
     return records[0]
 
+# Same event reposted by several channels within DEDUP_WINDOW
+DEDUP = NearDuplicateDetector(DEDUP_WINDOW)
+
+def merge_duplicate(cluster, candidate):
+    """Decide what to do with a near-duplicate message.
+
+    Returns the cluster's resolved location/types if the new message is
+    now the best of the cluster (its records supersede the earlier ones),
+    or None if it should just be dropped.
+    """
+    cluster.candidates.append(candidate)
+    if not cluster.resolved:
+        return None
+    if select_best_message(list(cluster.candidates)) is not candidate:
+        return None
+    return cluster.resolved
+
 # -----------------------------
 # Clean summary helper
 # -----------------------------
@@ -315,128 +237,377 @@ def clean_summary(text: str) -> str:
 
     return text
 
+def normalize_message(text: str) -> str:
+    # Reposts differ in links, control characters and diacritics, not in content
+    return normalize_arabic(clean_summary(text))
+
 # -----------------------------
-# Phi3 worker queue (multi-incident)
+# LLM fallback
 # -----------------------------
-message_queue = asyncio.Queue()
-
-async def phi3_worker(matches, existing_ids):
-    VALID_INCIDENT_TYPES = set(IK.incident_keywords.keys())
+# One pooled HTTP client shared by all workers; "subprocess" keeps the old `ollama run` path.
+# Answers are cached by message content, so forwarded copies never reach the model.
+LLM = CachedLLM(
+    make_llm(LLM_BACKEND, model=OLLAMA_MODEL, base_url=OLLAMA_URL, timeout=PHI3_TIMEOUT,
+             concurrency=LLM_CONCURRENCY, batch_size=LLM_BATCH_SIZE),
+    LLMCache(LLM_CACHE_FILE, LLM_CACHE_SIZE, normalize=normalize_message),
+)
+
+# Read from whatever LLM is current when scraped (the benchmark swaps it)
+metrics.counter("llm_cache_lookups_total", "LLM cache lookups by result",
+                ["result"], callback=metrics.stats_callback(
+                    lambda: LLM.stats(), ("memory_hits", "disk_hits", "shared_hits", "misses")))
+metrics.gauge("llm_cache_hit_ratio", "Share of LLM cache lookups answered from memory or disk",
+              callback=lambda: {(): LLM.stats()["hit_rate"]})
 
-    while True:
+# -----------------------------
+# Message pipeline (multi-incident), shared by live and backfill
+#
+#   ingest queue (bounded) -> CPU pool: analyze_message -> dedup, LLM fallback
+#   (event loop) -> write queue -> single writer -> STORE
+# -----------------------------
+VALID_INCIDENT_TYPES = set(IK.incident_keywords.keys())
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+STAGE_SECONDS = metrics.histogram(
+    "scraper_stage_seconds",
+    "Per-message stage duration: keyword, summary, location, minhash (in the CPU pool), "
+    "analyze (pool round trip), dedup, llm (cache included), save", ["stage"])
+MESSAGES = metrics.counter("scraper_messages_total",
+                           "Messages by outcome: match, skip, duplicate, seen, dropped, error", ["outcome"])
+ACTIVE_PIPELINE = None
+
+def _queue_depths():
+    if ACTIVE_PIPELINE is None:
+        return {}
+    return {("ingest",): ACTIVE_PIPELINE.queue.qsize(), ("write",): ACTIVE_PIPELINE.writes.qsize()}
+
+metrics.gauge("scraper_queue_depth", "Items waiting in the pipeline queues", ["queue"], callback=_queue_depths)
+
+def message_from_event(event):
+    channel_name = (
+        event.chat.username if event.chat and getattr(event.chat, 'username', None)
+        else str(event.chat_id)
+    )
+    return Message(channel_name, event.id, event.raw_text or "", event.date)
+
+def analyze_message(text):
+    """The CPU-bound part of a message; runs in the CPU pool, off the event loop.
+
+    Stage timings travel back with the result, so they are recorded in the
+    parent whether the pool is threads or processes.
+    """
+    t0 = time.perf_counter()
+    # --- Incident type and casualty detection (keywords first, one scan)
+    classification = IK.classifier.classify(text)
+    t1 = time.perf_counter()
+
+    # --- Clean summary
+    summary = clean_summary(text)
+    if len(summary) > 300:
+        summary = summary[:300] + "..."
+    t2 = time.perf_counter()
+
+    # --- Location detection using map (also for reposts: cheaper than a second trip to the pool)
+    location, coordinates = detect_location(text)
+    t3 = time.perf_counter()
+    signature = minhash(normalize_message(text))
+    return {
+        "incident_types": classification.incident_types,
+        "details": {
+            "numbers_found": IK.extract_numbers(text),
+            "casualties": classification.casualties,
+            "summary": summary
+        },
+        "signature": signature,
+        "location": location,
+        "coordinates": coordinates,
+        "timings": {"keyword": t1 - t0, "summary": t2 - t1, "location": t3 - t2,
+                    "minhash": time.perf_counter() - t3},
+    }
+
+def _init_cpu_worker():
+    # Ctrl-C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def make_cpu_pool(kind=CPU_EXECUTOR, workers=CPU_WORKERS):
+    if kind == "thread":
+        return ThreadPoolExecutor(workers, thread_name_prefix="detect")
+    if kind == "process":
+        # Spawned, not forked: every worker imports this module and so loads the
+        # gazetteer once, complete, instead of inheriting a half-loaded lazy map
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_cpu_worker)
+    raise ValueError(f"unknown CPU executor {kind!r}")
+
+
+class Pipeline:
+    """Bounded ingest queue -> CPU pool -> dedup / LLM fallback -> single writer.
+
+    put() applies the overflow policy when the ingest queue is full:
+    "block" waits for room (backpressure on the Telegram handler),
+    "drop_oldest" / "drop_newest" drop a message and count it; a backfill
+    can pick dropped messages up later.
+    """
+
+    def __init__(self, existing_ids, workers=PIPELINE_WORKERS, queue_size=INGEST_QUEUE_SIZE,
+                 overflow=INGEST_OVERFLOW, cpu_executor=CPU_EXECUTOR, cpu_workers=CPU_WORKERS,
+                 write_queue_size=WRITE_QUEUE_SIZE):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow!r}")
+        self.existing_ids = existing_ids
+        self.workers = workers
+        self.overflow = overflow
+        self.queue = asyncio.Queue(queue_size)
+        self.writes = asyncio.Queue(write_queue_size)
+        self.cpu = make_cpu_pool(cpu_executor, cpu_workers)
+        # The store's appends and fsyncs block; they get one thread of their own
+        self._io = ThreadPoolExecutor(1, thread_name_prefix="store")
+        self.dropped = 0
+        self.tasks = []
+
+    def start(self):
+        global ACTIVE_PIPELINE
+        ACTIVE_PIPELINE = self
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._writer()))
+
+    async def put(self, msg):
+        """Queue a message for the workers; False if the overflow policy dropped it."""
+        if self.overflow == "block":
+            await self.queue.put(msg)
+            return True
+        if self.queue.full():
+            self.dropped += 1
+            MESSAGES.inc(outcome="dropped")
+            if self.overflow == "drop_newest":
+                print(f"[DROP] {msg.channel}:{msg.id} (ingest queue full)")
+                return False
+            old = self.queue.get_nowait()
+            self.queue.task_done()
+            print(f"[DROP] {old.channel}:{old.id} (ingest queue full)")
+        self.queue.put_nowait(msg)
+        return True
+
+    async def _worker(self):
+        while True:
+            msg = await self.queue.get()
+            try:
+                await self.process(msg)
+            except Exception as e:
+                MESSAGES.inc(outcome="error")
+                print(f"Error processing message: {e}")
+            finally:
+                # Exactly once per get(), whatever happened to the message
+                self.queue.task_done()
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            record = await self.writes.get()
+            try:
+                with STAGE_SECONDS.time(stage="save"):
+                    await loop.run_in_executor(self._io, save_match, record)
+            except Exception as e:
+                print(f"Error saving match: {e}")
+            finally:
+                self.writes.task_done()
+
+    async def _analyze(self, text):
+        with STAGE_SECONDS.time(stage="analyze"):
+            analysis = await asyncio.get_running_loop().run_in_executor(self.cpu, analyze_message, text)
+        for stage, seconds in analysis.pop("timings").items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        return analysis
+
+    async def process(self, msg):
+        """Run one channel message through detection, the LLM fallback and the writer."""
+        text = msg.text or ""
+        channel_name = msg.channel
+        msg_id = msg.id
+
+        # Skip already processed messages
+        if (channel_name, msg_id) in self.existing_ids:
+            MESSAGES.inc(outcome="seen")
+            return
+
+        analysis = await self._analyze(text)
+
+        # --- Near-duplicate merge, before any LLM work
+        with STAGE_SECONDS.time(stage="dedup"):
+            cluster, is_dup = DEDUP.add(None, msg.date.timestamp(), (channel_name, msg_id),
+                                        signature=analysis["signature"])
+        await self._process_member(msg, analysis, cluster, is_dup)
+
+    async def _process_member(self, msg, analysis, cluster, is_dup):
+        """Record msg as its cluster's first message or a repost that adds to it, or drop it."""
+        if is_dup and cluster.resolved is None:
+            if cluster.pending is not None:
+                # The first message is still being processed (e.g. waiting on the
+                # LLM); this repost is decided once that one is done
+                cluster.pending.append((msg, analysis))
+                return
+            # The first message failed: this repost takes its place
+            is_dup = False
+        resolved = merge_duplicate(cluster, {"details": analysis["details"]}) if is_dup else None
+        if is_dup and not resolved:
+            print(f"[DUP] {(msg.text or '')[:50]}... (repost of cluster {cluster.id})")
+            MESSAGES.inc(outcome="duplicate")
+            self.existing_ids.add((msg.channel, msg.id))
+            return
+
+        if is_dup:
+            await self._resolve(msg, analysis, cluster, resolved)
+            return
+        cluster.pending = []
         try:
-            event = await message_queue.get()
-            text = event.raw_text or ""
-            channel_name = (
-                event.chat.username if event.chat and getattr(event.chat, 'username', None)
-                else str(event.chat_id)
-            )
-            msg_id = event.id
-
-            # Skip already processed messages
-            if (channel_name, msg_id) in existing_ids:
-                message_queue.task_done()
-                continue
-
-            # --- Location detection using map
-            location, coordinates = detect_location(text)
-
-            # --- Incident type detection (keywords first)
-            incident_types = find_incident_types(text, IK.incident_keywords)
-
-            # --- Fallback to Phi3 if keywords fail or location not found
-            phi3_res = None
-            if not incident_types or not location:
-                phi3_res = query_phi3_json(text)
-
-                if phi3_res:
-                    # Incident type from Phi3
-                    if not incident_types:
-                        itype = phi3_res.get("incident_type")
-                        if itype:
-                            if isinstance(itype, list):
-                                incident_types = [i for i in itype if i in VALID_INCIDENT_TYPES]
-                            elif isinstance(itype, str) and itype in VALID_INCIDENT_TYPES:
-                                incident_types = [itype]
-
-                    # Location from Phi3 (strict map validation)
-                    if not location:
-                        phi3_loc = phi3_res.get("location")
-                        loc_candidates = []
-
-                        if isinstance(phi3_loc, str):
-                            loc_candidates.append(phi3_loc)
-                        elif isinstance(phi3_loc, list):
-                            loc_candidates.extend([l for l in phi3_loc if isinstance(l, str)])
-                        elif isinstance(phi3_loc, dict):
-                            for key in ["city", "town", "location", "name"]:
-                                loc_val = phi3_loc.get(key)
-                                if isinstance(loc_val, str):
-                                    loc_candidates.append(loc_val)
-
-                        # Accept only if exists in map and text mentions it
-                        for loc in loc_candidates:
-                            loc_norm = normalize_arabic(loc)
-                            if loc_norm in ALL_LOCATIONS:
-                                text_norm = normalize_arabic(text)
-                                loc_words = loc_norm.split()
-                                text_words = text_norm.split()
-                                for i in range(len(text_words) - len(loc_words) + 1):
-                                    if text_words[i:i+len(loc_words)] == loc_words:
-                                        location = ALL_LOCATIONS[loc_norm]["original"]
-                                        coordinates = ALL_LOCATIONS[loc_norm]["coordinates"]
-                                        break
-                                if location:
-                                    break
-
-            # --- Skip if no valid incident type or location/coordinates
-            if not incident_types or not location or not coordinates:
-                print(f"[SKIP] {text[:50]}... (no valid incident/location)")
-                message_queue.task_done()
-                continue
-
-            # --- Extract numbers and casualties
-            numbers = IK.extract_numbers(text)
-            casualties = IK.extract_casualties(text)
-
-            # --- Clean summary
-            summary = clean_summary(text)
-            if len(summary) > 300:
-                summary = summary[:300] + "..."
-
-            # --- Create records for each incident type
-            for incident_type in incident_types:
-                if incident_type not in VALID_INCIDENT_TYPES:
-                    continue  # skip invalid Phi3 types
-
-                record = {
-                    "incident_type": incident_type,
-                    "location": location,
-                    "coordinates": coordinates,
-                    "channel": channel_name,
-                    "message_id": msg_id,
-                    "date": str(event.date),
-                    "threat_level": "yes",
-                    "details": {
-                        "numbers_found": numbers,
-                        "casualties": casualties,
-                        "summary": summary
-                    }
-                }
-
-                # --- Skip duplicates by message_id
-                if not any(m.get("message_id") == msg_id for m in matches):
-                    matches.append(record)
-                    print(f"[MATCH] {incident_type} @ {location} from {channel_name}")
-                    save_matches(matches)
-
-            existing_ids.add((channel_name, msg_id))
-
-        except Exception as e:
-            print(f"Error processing message: {e}")
+            await self._resolve(msg, analysis, cluster, None)
         finally:
-            if not message_queue.empty():
-                message_queue.task_done()
+            await self._replay_pending(cluster)
+
+    async def _replay_pending(self, cluster):
+        """Decide the reposts that arrived while the cluster's first message was processed."""
+        waiting, cluster.pending = cluster.pending, None
+        for msg, analysis in waiting:
+            try:
+                await self._process_member(msg, analysis, cluster, True)
+            except Exception as e:
+                MESSAGES.inc(outcome="error")
+                print(f"Error processing message: {e}")
+
+    async def _resolve(self, msg, analysis, cluster, resolved):
+        """Location, LLM fallback and records for a first message, or a repost that supersedes it."""
+        text = msg.text or ""
+        channel_name = msg.channel
+        msg_id = msg.id
+        incident_types = analysis["incident_types"]
+        details = analysis["details"]
+        if resolved:
+            location, coordinates = resolved["location"], resolved["coordinates"]
+            incident_types = resolved["incident_types"]
+            cluster_id = resolved["cluster_id"]
+        else:
+            location, coordinates = analysis["location"], analysis["coordinates"]
+            cluster_id = f"{channel_name}:{msg_id}"
+
+        # --- Fallback to Phi3 if keywords fail or location not found
+        phi3_res = None
+        if not resolved and (not incident_types or not location):
+            with STAGE_SECONDS.time(stage="llm"):
+                phi3_res = await LLM.extract(text)
+
+            if phi3_res:
+                # Incident type from Phi3
+                if not incident_types:
+                    itype = phi3_res.get("incident_type")
+                    if itype:
+                        if isinstance(itype, list):
+                            incident_types = [i for i in itype if i in VALID_INCIDENT_TYPES]
+                        elif isinstance(itype, str) and itype in VALID_INCIDENT_TYPES:
+                            incident_types = [itype]
+
+                # Location from Phi3 (strict map validation)
+                if not location:
+                    phi3_loc = phi3_res.get("location")
+                    loc_candidates = []
+
+                    if isinstance(phi3_loc, str):
+                        loc_candidates.append(phi3_loc)
+                    elif isinstance(phi3_loc, list):
+                        loc_candidates.extend([l for l in phi3_loc if isinstance(l, str)])
+                    elif isinstance(phi3_loc, dict):
+                        for key in ["city", "town", "location", "name"]:
+                            loc_val = phi3_loc.get(key)
+                            if isinstance(loc_val, str):
+                                loc_candidates.append(loc_val)
+
+                    # Accept only if exists in map and text mentions it
+                    for loc in loc_candidates:
+                        loc_norm = normalize_arabic(loc)
+                        if loc_norm in ALL_LOCATIONS:
+                            text_norm = normalize_arabic(text)
+                            loc_words = loc_norm.split()
+                            text_words = text_norm.split()
+                            for i in range(len(text_words) - len(loc_words) + 1):
+                                if text_words[i:i+len(loc_words)] == loc_words:
+                                    location = ALL_LOCATIONS[loc_norm]["original"]
+                                    coordinates = ALL_LOCATIONS[loc_norm]["coordinates"]
+                                    break
+                            if location:
+                                break
+
+        # --- Skip if no valid incident type or location/coordinates
+        if not incident_types or not location or not coordinates:
+            print(f"[SKIP] {text[:50]}... (no valid incident/location)")
+            MESSAGES.inc(outcome="skip")
+            if not resolved:
+                # Reposts of a message without an incident are dropped, not re-asked
+                cluster.resolved = False
+            return
+
+        # --- Admin regions of the location (coordinates are [lon, lat])
+        regions = REGIONS.lookup(coordinates[1], coordinates[0]) if REGIONS else None
+
+        # --- Create records for each incident type
+        for incident_type in incident_types:
+            if incident_type not in VALID_INCIDENT_TYPES:
+                continue  # skip invalid Phi3 types
+
+            record = {
+                "incident_type": incident_type,
+                "location": location,
+                "coordinates": coordinates,
+                "channel": channel_name,
+                "message_id": msg_id,
+                "date": str(msg.date),
+                "threat_level": "yes",
+                "cluster_id": cluster_id,
+                "details": details
+            }
+            if regions is not None:
+                record["regions"] = regions
+            print(f"[MATCH] {incident_type} @ {location} from {channel_name}")
+            await self.writes.put(record)
+
+        MESSAGES.inc(outcome="match")
+        if not resolved:
+            # First message of the cluster: later reposts reuse this result
+            cluster.candidates.append({"details": details})
+            cluster.resolved = {
+                "location": location,
+                "coordinates": coordinates,
+                "incident_types": incident_types,
+                "cluster_id": cluster_id,
+            }
+        self.existing_ids.add((channel_name, msg_id))
+
+    async def flush(self):
+        """Wait until every queued record is written and synced to disk."""
+        await self.writes.join()
+        await asyncio.get_running_loop().run_in_executor(self._io, STORE.sync)
+
+    async def join(self):
+        await self.queue.join()
+        await self.flush()
+
+    async def close(self):
+        """Stop the workers, then write out every record they already queued."""
+        workers, writers = self.tasks[:-1], self.tasks[-1:]
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if writers and not writers[0].done():
+            await self.flush()
+        for task in writers:
+            task.cancel()
+        await asyncio.gather(*writers, return_exceptions=True)
+        # A writer cancelled from outside leaves its queue behind
+        if not self.writes.empty():
+            loop = asyncio.get_running_loop()
+            while not self.writes.empty():
+                await loop.run_in_executor(self._io, save_match, self.writes.get_nowait())
+            await loop.run_in_executor(self._io, STORE.sync)
+        self.cpu.shutdown(wait=False, cancel_futures=True)
+        self._io.shutdown(wait=True)
 
 # -----------------------------
 # Telegram login
@@ -458,44 +629,127 @@ async def get_my_channels(client):
             out.append(d.entity)
     return out
 
+# -----------------------------
+# Metrics endpoint
+# -----------------------------
+async def start_metrics():
+    """Serve /metrics and /profile and keep METRICS_FILE current, as configured."""
+    server = writer = None
+    if METRICS_PORT:
+        try:
+            server = await metrics.serve_http(METRICS_HOST, METRICS_PORT)
+            print(f"[METRICS] http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"[METRICS] Could not listen on {METRICS_HOST}:{METRICS_PORT}: {e}")
+    if METRICS_FILE:
+        writer = asyncio.create_task(metrics.write_periodically(METRICS_FILE))
+    return server, writer
+
+async def stop_metrics(handles):
+    server, writer = handles
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    if writer is not None:
+        writer.cancel()
+        # Final numbers, e.g. for the end of a backfill
+        metrics.write_file(METRICS_FILE)
+
 # -----------------------------
 # Main async
 # -----------------------------
-async def main():
-    client = TelegramClient('session', api_id, api_hash)
-    await client.start()
-    await qr_login(client)
-    channels = await get_my_channels(client)
-    channel_ids = [c.id for c in channels]
-    print(f"Monitoring {len(channel_ids)} channels...")
+async def main(args):
+    client = None
+    if not (args.backfill and args.from_file):
+        client = TelegramClient('session', api_id, api_hash)
+        await client.start()
+        await qr_login(client)
 
     matches = load_existing_matches()
     existing_ids = {(m.get('channel'), m.get('message_id')) for m in matches}
 
-    # Start multiple workers for better performance
-    workers = []
-    for _ in range(3):  # Start 3 workers
-        workers.append(asyncio.create_task(phi3_worker(matches, existing_ids)))
+    # SIGTERM shuts down like Ctrl-C: cancel, then flush queued records in the finally blocks
+    main_task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    except NotImplementedError:   # no loop signal handlers on Windows
+        pass
+
+    metrics_handles = await start_metrics()
+    if args.backfill:
+        try:
+            await backfill_history(client, args, existing_ids)
+        finally:
+            await stop_metrics(metrics_handles)
+        return
+
+    channels = await get_my_channels(client)
+    channel_ids = [c.id for c in channels]
+    print(f"Monitoring {len(channel_ids)} channels...")
+
+    pipeline = Pipeline(existing_ids)
+    pipeline.start()
 
     @client.on(events.NewMessage(chats=channel_ids))
     async def handler(event):
-        await message_queue.put(event)
+        await pipeline.put(message_from_event(event))
 
     print("Started monitoring. Waiting for new messages...")
     try:
-        await asyncio.gather(*workers)
+        # wait(), not gather(): cancelling gather would cancel the writer with
+        # records still queued, before close() gets to flush them
+        done, _ = await asyncio.wait(pipeline.tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
     except asyncio.CancelledError:
         print("Shutting down...")
     finally:
-        # Cancel all worker tasks
-        for worker in workers:
-            worker.cancel()
-        # Wait for all tasks to complete
-        await asyncio.gather(*workers, return_exceptions=True)
+        await pipeline.close()
+        await LLM.close()
+        STORE.close()
+        await stop_metrics(metrics_handles)
         await client.disconnect()
 
+async def backfill_history(client, args, existing_ids):
+    if args.from_file:
+        source = backfill.FileSource(args.from_file)
+    else:
+        source = backfill.TelegramSource(client, await get_my_channels(client))
+    checkpoints = backfill.Checkpoints(args.checkpoints)
+    channels = args.channels.split(",") if args.channels else None
+    if args.reset:
+        checkpoints.reset(channels)
+    pipeline = Pipeline(existing_ids)
+    pipeline.start()
+    try:
+        done = await backfill.run_backfill(
+            source, pipeline.process, checkpoints, channels=channels,
+            page_size=args.page_size, concurrency=args.concurrency, flush=pipeline.flush,
+        )
+        print(f"[BACKFILL] {sum(done.values())} messages from {len(done)} channels")
+    finally:
+        await pipeline.close()
+        await LLM.close()
+        STORE.close()
+        if client is not None:
+            await client.disconnect()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true",
+                        help="process channel history after each checkpoint, then exit")
+    parser.add_argument("--from-file", help="JSONL message file to backfill from instead of Telegram")
+    parser.add_argument("--channels", help="comma-separated channels to backfill (default: all)")
+    parser.add_argument("--checkpoints", default=backfill.CHECKPOINT_FILE)
+    parser.add_argument("--page-size", type=int, default=backfill.PAGE_SIZE,
+                        help="messages between checkpoints")
+    parser.add_argument("--concurrency", type=int, default=backfill.CONCURRENCY,
+                        help="messages in the pipeline at once")
+    parser.add_argument("--reset", action="store_true", help="start the backfilled channels from the beginning")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("Interrupted by user")
\ No newline at end of file
+        asyncio.run(main(parse_args()))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("Interrupted")
@@ -0,0 +1,224 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+DEFAULT_LIMIT = 10
+MAX_EDIT = 2          # deletes precomputed per vocabulary word (SymSpell)
+SCAN_LIMIT = 500      # candidates collected per tier before ranking
+WORD_CACHE_SIZE = 4096  # query words whose fuzzy matches are remembered
+
+# Result tiers, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = range(5)
+
+
+def max_distance(word):
+    """Edits tolerated for a query word: none for very short words."""
+    if len(word) < 3:
+        return 0
+    if len(word) < 6:
+        return 1
+    return MAX_EDIT
+
+def _deletes(word, depth):
+    out = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        out |= frontier
+    return out
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it is exceeded.
+
+    Only the diagonal band |i - j| <= limit is filled; cells outside it can
+    never lead back under the limit.
+    """
+    la, lb = len(a), len(b)
+    if abs(la - lb) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    big = limit + 1
+    prev2 = None
+    prev = [j if j <= limit else big for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        cur = [big] * (lb + 1)
+        if i <= limit:
+            cur[0] = i
+        best = cur[0]
+        ai = a[i - 1]
+        for j in range(max(1, i - limit), min(lb, i + limit) + 1):
+            bj = b[j - 1]
+            d = prev[j - 1] + (ai != bj)
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if cur[j - 1] + 1 < d:
+                d = cur[j - 1] + 1
+            if i > 1 and j > 1 and ai == b[j - 2] and a[i - 2] == bj and prev2[j - 2] + 1 < d:
+                d = prev2[j - 2] + 1
+            cur[j] = d
+            if d < best:
+                best = d
+        if best > limit:
+            return big
+        prev2, prev = prev, cur
+    return prev[lb] if prev[lb] <= limit else big
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# -----------------------------
+# Search index
+# -----------------------------
+class SearchIndex:
+    """Ranked name search over the {normalized_name: {"original", "coordinates"}} map.
+
+    Built once at load time from four structures:
+      - names sorted for full-name prefix lookups (autocomplete),
+      - (word, id) pairs sorted for prefix lookups on any word,
+      - a trigram inverted index for substring matches,
+      - SymSpell delete variants of every word for typo tolerance.
+    Results rank by tier (exact, prefix, word prefix, substring, fuzzy),
+    then edit distance, then name length, then gazetteer order.
+    """
+
+    def __init__(self, locations):
+        self.locations = locations
+        self._names = list(locations)
+        self._sorted = sorted((name, i) for i, name in enumerate(self._names))
+        self._sorted_keys = [name for name, _ in self._sorted]
+
+        words = {}
+        trigrams = {}
+        for i, name in enumerate(self._names):
+            for word in set(name.split()):
+                words.setdefault(word, []).append(i)
+            for gram in _trigrams(name):
+                trigrams.setdefault(gram, []).append(i)
+        self._postings = words
+        self._trigrams = trigrams
+        self._word_pairs = sorted((w, i) for w, ids in words.items() for i in ids)
+        self._word_keys = [w for w, _ in self._word_pairs]
+
+        self._deletes = {}
+        for word in words:
+            # A query word within MAX_EDIT edits is long enough to allow that many
+            depth = 1 if len(word) <= 3 else MAX_EDIT
+            for variant in _deletes(word, depth):
+                self._deletes.setdefault(variant, []).append(word)
+        self._similar = OrderedDict()   # word -> {vocabulary word: distance}, LRU
+        self._similar_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    # --- Tiers
+    @staticmethod
+    def _prefix_range(keys, pairs, prefix):
+        pos = bisect_left(keys, prefix)
+        end = min(len(keys), pos + SCAN_LIMIT)
+        while pos < end and keys[pos].startswith(prefix):
+            yield pairs[pos][1]
+            pos += 1
+
+    def _prefix(self, q, found):
+        for i in self._prefix_range(self._sorted_keys, self._sorted, q):
+            found.setdefault(i, (EXACT if self._names[i] == q else PREFIX, 0))
+
+    def _word_prefix(self, q, found):
+        first = q.split()[0]
+        padded = " " + q
+        for i in self._prefix_range(self._word_keys, self._word_pairs, first):
+            if i not in found and padded in " " + self._names[i]:
+                found[i] = (WORD_PREFIX, 0)
+
+    def _substring(self, q, found):
+        grams = _trigrams(q)
+        if not grams:
+            return
+        postings = sorted((self._trigrams.get(g, ()) for g in grams), key=len)
+        if not postings[0]:
+            return
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates.intersection_update(ids)
+            if not candidates:
+                return
+        for i in sorted(candidates)[:SCAN_LIMIT]:
+            if i not in found and q in self._names[i]:
+                found[i] = (SUBSTRING, 0)
+
+    def similar_words(self, word):
+        """{vocabulary word: distance} within max_distance(word) edits."""
+        # Flask serves requests from several threads; the LRU must not change under a lookup
+        with self._similar_lock:
+            cached = self._similar.get(word)
+            if cached is not None:
+                self._similar.move_to_end(word)
+                return cached
+        limit = max_distance(word)
+        n = len(word)
+        out = {}
+        seen = set()
+        for variant in _deletes(word, limit):
+            for candidate in self._deletes.get(variant, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if abs(len(candidate) - n) > limit:
+                    continue
+                d = edit_distance(word, candidate, limit)
+                if d <= limit:
+                    out[candidate] = d
+        with self._similar_lock:
+            self._similar[word] = out
+            if len(self._similar) > WORD_CACHE_SIZE:
+                self._similar.popitem(last=False)
+        return out
+
+    def _fuzzy(self, q, found):
+        tokens = q.split()
+        scores = None
+        for n, token in enumerate(tokens):
+            dist = {}
+            for word, d in self.similar_words(token).items():
+                for i in self._postings[word]:
+                    if d < dist.get(i, d + 1):
+                        dist[i] = d
+            if n == len(tokens) - 1:
+                # The last word may still be being typed
+                for i in self._prefix_range(self._word_keys, self._word_pairs, token):
+                    dist[i] = 0
+            if scores is None:
+                scores = dist
+            else:
+                scores = {i: scores[i] + d for i, d in dist.items() if i in scores}
+            if not scores:
+                return
+        for i, d in scores.items():
+            if i not in found:
+                found[i] = (FUZZY, d)
+
+    # --- Query
+    def search(self, query_norm, limit=DEFAULT_LIMIT):
+        """Return up to `limit` (loc_norm, tier, distance) tuples, best first."""
+        q = " ".join(query_norm.split())
+        if not q or limit <= 0:
+            return []
+        found = {}
+        self._prefix(q, found)
+        self._word_prefix(q, found)
+        self._substring(q, found)
+        if len(found) < limit:
+            self._fuzzy(q, found)
+        names = self._names
+        best = heapq.nsmallest(
+            limit, found.items(),
+            key=lambda item: (item[1][0], item[1][1], len(names[item[0]]), item[0]),
+        )
+        return [(names[i], tier, d) for i, (tier, d) in best]
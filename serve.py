@@ -0,0 +1,158 @@
+"""Production server for app.py: pre-forked workers sharing one loaded app.
+
+The master imports app (gazetteer, search and place indexes, admin
+regions, tiles, the incident cache), warms it, freezes the GC and only then
+forks, so every worker shares those pages copy-on-write instead of loading
+its own copy. Each worker runs a threaded WSGI server on the same listening
+socket and the kernel spreads connections over them; a worker that dies is
+replaced. Without os.fork (Windows) or with --workers 1 the server runs in
+the master.
+
+With gunicorn installed, this file is also its config, with the same preload:
+
+    gunicorn -c serve.py app:app
+
+Each worker keeps its own metrics and profiler: /metrics shows the worker
+that answered the scrape.
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5000] [--workers N] [--no-preload-tiles] [--access-log]
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5000))
+WORKERS = int(os.environ.get("WEB_WORKERS", os.cpu_count() or 1))
+THREADS = int(os.environ.get("WEB_THREADS", 32))   # per gunicorn worker; every SSE stream holds one
+BACKLOG = 1024
+RESTART_DELAY = 1.0   # seconds before replacing a worker that exited
+PRELOAD_TILES = os.environ.get("PRELOAD_TILES", "1") == "1"
+
+# A lazy location load finishes in a background thread, which fork does not
+# copy: the master would end up with the full map and the workers without it
+os.environ["LOCATIONS_LAZY"] = "0"
+
+# -----------------------------
+# gunicorn settings (gunicorn -c serve.py app:app)
+# -----------------------------
+bind = f"{HOST}:{PORT}"
+workers = WORKERS
+worker_class = "gthread"
+threads = THREADS
+backlog = BACKLOG
+preload_app = True
+
+def when_ready(server):
+    # The app is preloaded by now and the workers are not forked yet
+    prepare()
+
+
+# -----------------------------
+# Shared state
+# -----------------------------
+def prepare(preload_tiles=PRELOAD_TILES):
+    """Load and warm what the workers share, then keep the GC off those pages."""
+    import app
+    start = time.perf_counter()
+    app.INCIDENT_CACHE.refresh()
+    if preload_tiles:
+        app.TILES.load()
+    # Frozen objects are never scanned, so the collector does not touch
+    # (and copy) the pages they live on in every worker
+    gc.collect()
+    gc.freeze()
+    print(f"[SERVE] {len(app.INCIDENT_CACHE.records)} incidents, {len(app.ALL_LOCATIONS)} locations, "
+          f"{gc.get_freeze_count()} objects frozen, warmed in {time.perf_counter() - start:.2f}s")
+    return app.app
+
+
+# -----------------------------
+# Pre-fork server (without gunicorn)
+# -----------------------------
+def make_server(wsgi_app, sock, access_log):
+    from werkzeug.serving import WSGIRequestHandler, make_server as werkzeug_server
+
+    handler = WSGIRequestHandler
+    if not access_log:
+        class handler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+    host, port = sock.getsockname()[:2]
+    return werkzeug_server(host, port, wsgi_app, threaded=True, request_handler=handler, fd=sock.fileno())
+
+def run_worker(server):
+    # Ctrl-C reaches the whole process group; the master stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+def serve(host=HOST, port=PORT, n_workers=WORKERS, preload_tiles=PRELOAD_TILES, access_log=False):
+    wsgi_app = prepare(preload_tiles)
+    sock = socket.create_server((host, port), backlog=BACKLOG)
+    server = make_server(wsgi_app, sock, access_log)
+    if n_workers <= 1 or not hasattr(os, "fork"):
+        print(f"[SERVE] http://{host}:{port} in one process")
+        server.serve_forever()
+        return
+
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(server)
+        children.add(pid)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    for _ in range(n_workers):
+        spawn()
+    print(f"[SERVE] http://{host}:{port} with {n_workers} workers")
+    try:
+        while True:
+            pid, status = os.wait()
+            children.discard(pid)
+            print(f"[SERVE] worker {pid} exited with status {status}; restarting")
+            time.sleep(RESTART_DELAY)
+            spawn()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--no-preload-tiles", action="store_true",
+                        help="load layer geometry in each worker on its first tile request instead")
+    parser.add_argument("--access-log", action="store_true", help="log every request (werkzeug format)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, not args.no_preload_tiles, args.access_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Response encoding for the API: fast JSON, gzip/brotli, cached encoded bodies.
+
+dumps() encodes with orjson when it is installed (falling back to the
+standard library for anything orjson refuses) and always emits compact
+UTF-8, so Arabic text costs two bytes a letter instead of a six-byte
+\\uXXXX escape. JSONProvider puts it behind Flask's jsonify.
+
+compress_response() negotiates Accept-Encoding (br when the brotli package
+is installed, then gzip) for JSON and text bodies. A response with an ETag
+is the same bytes for as long as the ETag holds, so its compressed body is
+kept in a BodyCache and an unchanged poll is answered without encoding or
+compressing anything again.
+"""
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider as _FlaskJSONProvider
+
+try:
+    import orjson
+except ImportError:   # the standard library encoder does the same job, slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:   # gzip only
+    brotli = None
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+COMPRESS_MIN_BYTES = 1024    # smaller bodies go out as they are
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5           # 10-11 compress a little better at many times the cost
+BODY_CACHE_BYTES = 64 * 1024 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "application/geo+json", "text/")
+
+ENCODINGS = (("br",) if brotli is not None else ()) + ("gzip",)   # in order of preference
+
+
+# -----------------------------
+# JSON
+# -----------------------------
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes for obj."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=ORJSON_OPTIONS)
+        except TypeError:   # orjson.JSONEncodeError: e.g. an int over 64 bits or an unknown type
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"),
+                      default=DefaultJSONProvider.default).encode("utf-8")
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class JSONProvider(_FlaskJSONProvider):
+    """Flask JSON provider on dumps(): app.json = JSONProvider(app)."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # The bytes go straight into the response, without a round trip through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype="application/json")
+
+
+# -----------------------------
+# Encoded body cache
+# -----------------------------
+class BodyCache:
+    """Byte-bounded LRU of encoded response bodies."""
+
+    def __init__(self, max_bytes=BODY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._bodies.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return body
+        with self._lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._bodies[key] = body
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, old = self._bodies.popitem(last=False)
+                self.bytes -= len(old)
+        return body
+
+    def fetch(self, key, build):
+        """The body cached under key, or build() stored under it."""
+        body = self.get(key)
+        return body if body is not None else self.put(key, build())
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._bodies), "bytes": self.bytes}
+
+
+# -----------------------------
+# Compression
+# -----------------------------
+def negotiate(accept_encodings):
+    """The encoding to use for a request's werkzeug Accept-Encoding, or None for identity."""
+    return accept_encodings.best_match(ENCODINGS)
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0: the same body always compresses to the same bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"unsupported encoding {encoding!r}")
+
+def compressible(response):
+    mimetype = response.mimetype or ""
+    return any(mimetype.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+def compress_response(response, accept_encodings, cache=None, key=None, min_bytes=COMPRESS_MIN_BYTES):
+    """Compress a finished response in place for the client's Accept-Encoding.
+
+    With a cache, bodies of responses that carry an ETag are stored under
+    (key, etag, encoding); key tells apart endpoints whose ETags could
+    collide. Streams, partial and already encoded responses are left alone.
+    """
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers or not compressible(response)):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    etag, _ = response.get_etag()
+    if cache is not None and etag:
+        data = cache.fetch((key, etag, encoding), lambda: compress(body, encoding))
+    else:
+        data = compress(body, encoding)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    return response
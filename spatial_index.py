@@ -0,0 +1,191 @@
+import heapq
+import math
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+CELL_DEGREES = 0.05    # ~5.5 km of latitude per grid cell
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def valid_point(lat, lon):
+    """Finite and on the globe; NaN fails every comparison, so it is rejected too."""
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+def parse_bbox(text):
+    """'min_lon,min_lat,max_lon,max_lat' (Leaflet's toBBoxString) -> tuple, or None."""
+    try:
+        west, south, east, north = (float(v) for v in text.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (valid_point(south, west) and valid_point(north, east)) or south > north or west > east:
+        return None
+    return west, south, east, north
+
+def parse_point(text):
+    """'lat,lon' -> (lat, lon), or None."""
+    try:
+        lat, lon = (float(v) for v in text.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not valid_point(lat, lon):
+        return None
+    return lat, lon
+
+
+# -----------------------------
+# Grid index
+# -----------------------------
+class GridIndex:
+    """Points bucketed into fixed lat/lon cells (a geohash-style grid).
+
+    A bbox or radius query only visits the cells it overlaps, so it costs
+    the number of cells plus the points found rather than a full scan.
+    Items are any hashable id; each id holds one point.
+    """
+
+    def __init__(self, cell=CELL_DEGREES):
+        self.cell = cell
+        self._cells = {}
+        self._points = {}
+        self._extent = None   # (min_row, min_col, max_row, max_col) ever occupied
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, item):
+        return item in self._points
+
+    def _key(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def insert(self, item, lat, lon):
+        if item in self._points:
+            self.remove(item)
+        self._points[item] = (lat, lon)
+        r, c = key = self._key(lat, lon)
+        self._cells.setdefault(key, []).append(item)
+        if self._extent is None:
+            self._extent = (r, c, r, c)
+        else:
+            r0, c0, r1, c1 = self._extent
+            self._extent = (min(r0, r), min(c0, c), max(r1, r), max(c1, c))
+
+    def remove(self, item):
+        point = self._points.pop(item, None)
+        if point is None:
+            return
+        key = self._key(*point)
+        bucket = self._cells[key]
+        bucket.remove(item)
+        if not bucket:
+            del self._cells[key]
+
+    def point(self, item):
+        return self._points.get(item)
+
+    def clear(self):
+        self._cells.clear()
+        self._points.clear()
+        self._extent = None
+
+    def _cell_range(self, south, west, north, east):
+        r0, c0 = self._key(south, west)
+        r1, c1 = self._key(north, east)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self._cells):
+            # Query larger than the occupied area: walk the occupied cells instead
+            for (r, c), bucket in self._cells.items():
+                if r0 <= r <= r1 and c0 <= c <= c1:
+                    yield bucket
+            return
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                bucket = self._cells.get((r, c))
+                if bucket:
+                    yield bucket
+
+    def query_bbox(self, west, south, east, north):
+        """Ids whose point lies inside the box, in no particular order."""
+        points = self._points
+        out = []
+        for bucket in self._cell_range(south, west, north, east):
+            for item in bucket:
+                lat, lon = points[item]
+                if south <= lat <= north and west <= lon <= east:
+                    out.append(item)
+        return out
+
+    def query_radius(self, lat, lon, radius_km):
+        """[(distance_km, id)] within radius_km, nearest first."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        points = self._points
+        out = []
+        for bucket in self._cell_range(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            for item in bucket:
+                d = haversine_km(lat, lon, *points[item])
+                if d <= radius_km:
+                    out.append((d, item))
+        out.sort(key=lambda pair: pair[0])
+        return out
+
+    def _ring_cells(self, r0, c0, ring):
+        """Cells exactly `ring` steps from (r0, c0), clipped to the occupied extent."""
+        min_r, min_c, max_r, max_c = self._extent
+        cols = range(max(c0 - ring, min_c), min(c0 + ring, max_c) + 1)
+        for r in {r0 - ring, r0 + ring}:
+            if min_r <= r <= max_r:
+                for c in cols:
+                    yield r, c
+        if ring:
+            rows = range(max(r0 - ring + 1, min_r), min(r0 + ring - 1, max_r) + 1)
+            for c in {c0 - ring, c0 + ring}:
+                if min_c <= c <= max_c:
+                    for r in rows:
+                        yield r, c
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """[(distance_km, id)] of the k nearest points, searching outwards ring by ring.
+
+        Only rings that overlap the occupied extent are visited, each along
+        its perimeter, so a point far outside the data costs no more than
+        one inside it.
+        """
+        if not self._points or k <= 0:
+            return []
+        r0, c0 = self._key(lat, lon)
+        min_r, min_c, max_r, max_c = self._extent
+        # Rings before first_ring miss the extent; rings after max_ring hold nothing
+        first_ring = max(min_r - r0, r0 - max_r, min_c - c0, c0 - max_c, 0)
+        max_ring = max(abs(r0 - min_r), abs(r0 - max_r), abs(c0 - min_c), abs(c0 - max_c))
+        lat_step = self.cell * KM_PER_DEGREE
+        points = self._points
+        best = []   # max-heap of (-distance, id)
+        for ring in range(first_ring, max_ring + 1):
+            for key in self._ring_cells(r0, c0, ring):
+                for item in self._cells.get(key, ()):
+                    d = haversine_km(lat, lon, *points[item])
+                    if max_km is not None and d > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, item))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, item))
+            # Anything in the next ring is at least `ring` full cells away;
+            # cells narrow towards the poles, so use the narrowest one reached
+            widest_lat = min(abs(lat) + (ring + 1) * self.cell, 90)
+            lon_step = lat_step * math.cos(math.radians(widest_lat))
+            reach = ring * min(lat_step, lon_step)
+            if len(best) == k and -best[0][0] <= reach:
+                break
+            if max_km is not None and reach > max_km:
+                break
+        return sorted(((-d, item) for d, item in best), key=lambda pair: pair[0])
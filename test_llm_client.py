@@ -0,0 +1,174 @@
+"""OllamaClient against ollama_stub: pooling, concurrency cap, batching, timeouts.
+
+Run with: python -m pytest -q test_llm_client.py
+"""
+import asyncio
+
+import pytest
+
+import llm_client
+from llm_client import OllamaClient
+from ollama_stub import start_stub
+
+MESSAGES = ["حريق في مستودع", "غارة على بلدة", "حادث سير على الأوتوستراد", "انفجار قرب المرفأ"]
+TYPES = ["fire", "airstrike", "vehicle_accident", "explosion"]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(delay=0.0):
+        server = start_stub(delay=delay)
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+def types(results):
+    # The client normalizes incident_type to a list
+    return [r["incident_type"] for r in results]
+
+def expected(kinds):
+    return [[t] for t in kinds]
+
+
+def test_sequential_requests_reuse_one_connection(stub):
+    server, url = stub()
+
+    async def main():
+        client = OllamaClient(base_url=url)
+        try:
+            return [await client.extract(m) for m in MESSAGES * 3]
+        finally:
+            await client.close()
+
+    results = run(main())
+    assert types(results) == expected(TYPES * 3)
+    assert server.calls == 12
+    assert server.connections == 1
+
+
+def test_concurrency_caps_open_connections(stub):
+    server, url = stub(delay=0.05)
+
+    async def main():
+        client = OllamaClient(base_url=url, concurrency=2)
+        try:
+            return await asyncio.gather(*(client.extract(m) for m in MESSAGES * 2))
+        finally:
+            await client.close()
+
+    results = run(main())
+    assert types(results) == expected(TYPES * 2)
+    assert server.calls == 8
+    assert server.connections <= 2
+
+
+def test_full_batches_go_out_as_one_prompt(stub):
+    server, url = stub()
+
+    async def main():
+        client = OllamaClient(base_url=url, batch_size=4, batch_wait=5.0)
+        try:
+            return await asyncio.gather(*(client.extract(m) for m in MESSAGES * 2))
+        finally:
+            await client.close()
+
+    results = run(main())
+    # Answers come back to the message that asked, in order
+    assert types(results) == expected(TYPES * 2)
+    assert server.calls == 2
+
+
+def test_partial_batch_is_sent_after_batch_wait(stub):
+    server, url = stub()
+
+    async def main():
+        client = OllamaClient(base_url=url, batch_size=8, batch_wait=0.05)
+        try:
+            return await asyncio.wait_for(asyncio.gather(*(client.extract(m) for m in MESSAGES[:3])), 5)
+        finally:
+            await client.close()
+
+    results = run(main())
+    assert types(results) == expected(TYPES[:3])
+    assert server.calls == 1
+
+
+def test_running_batches_are_referenced_until_done(stub):
+    server, url = stub(delay=0.1)
+
+    async def main():
+        client = OllamaClient(base_url=url, batch_size=2, batch_wait=5.0)
+        try:
+            pending = asyncio.gather(*(client.extract(m) for m in MESSAGES[:2]))
+            await asyncio.sleep(0.02)
+            in_flight = len(client._batches)
+            results = await pending
+            return in_flight, len(client._batches), results
+        finally:
+            await client.close()
+
+    in_flight, after, results = run(main())
+    assert in_flight == 1
+    assert after == 0
+    assert types(results) == expected(TYPES[:2])
+
+
+def test_close_sends_and_waits_for_a_waiting_batch(stub):
+    server, url = stub()
+
+    async def main():
+        client = OllamaClient(base_url=url, batch_size=8, batch_wait=60.0)
+        task = asyncio.ensure_future(client.extract(MESSAGES[0]))
+        await asyncio.sleep(0.01)
+        await client.close()
+        return task.done() and task.result()
+
+    result = run(main())
+    assert result["incident_type"] == ["fire"]
+    assert server.calls == 1
+
+
+def test_timeout_returns_none_and_is_counted(stub):
+    server, url = stub(delay=0.5)
+    before = llm_client.LLM_CALLS.value(outcome="timeout")
+
+    async def main():
+        client = OllamaClient(base_url=url, timeout=0.1)
+        try:
+            return await client.extract(MESSAGES[0])
+        finally:
+            await client.close()
+
+    assert run(main()) is None
+    assert llm_client.LLM_CALLS.value(outcome="timeout") == before + 1
+
+
+def test_connection_closed_by_server_is_replaced(stub):
+    server, url = stub()
+
+    async def main():
+        client = OllamaClient(base_url=url)
+        try:
+            first = await client.extract(MESSAGES[0])
+            # As if the server had dropped the idle keep-alive connection
+            reader, writer = client._idle[0]
+            writer.transport.abort()
+            second = await client.extract(MESSAGES[1])
+            return first, second
+        finally:
+            await client.close()
+
+    first, second = run(main())
+    assert types([first, second]) == expected(TYPES[:2])
+    assert server.calls == 2
+    assert server.connections == 2
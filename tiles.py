@@ -0,0 +1,302 @@
+"""Simplified, quantized per-tile GeoJSON for the geojson_output layers.
+
+Each layer is loaded once into geometry.GeometryLayer arrays. A tile
+request picks the features whose bbox overlaps the tile, simplifies them
+with Douglas-Peucker at that zoom's pixel size (memoized per zoom), rounds
+coordinates to the pixel grid and caches the encoded body in a byte-bounded
+LRU.
+
+Usage:
+    python tiles.py Z X Y [--geojson geojson_output] [--layers buildings_a,waterways]
+"""
+import argparse
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from geometry import GeometryLayer, POINT, LINE, POLYGON
+from location_index import iter_features, list_sources
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+TILE_SIZE = 256              # pixels
+SIMPLIFY_PX = 1.0            # Douglas-Peucker tolerance in pixels
+MIN_FEATURE_PX = 1.0         # lines / polygons smaller than this are left out
+TILE_BUFFER_PX = 8           # features just outside the tile edge still count
+MAX_ZOOM = 18
+TILE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Lowest zoom a layer shows up at, matched on the layer name; dense layers
+# wait until their features are a few pixels across
+LAYER_MIN_ZOOM = [
+    ("buildings", 15),
+    ("pois", 14),
+    ("pofw", 14),
+    ("traffic", 14),
+    ("transport", 13),
+    ("landuse", 11),
+    ("natural", 11),
+    ("places", 9),
+    ("waterways", 8),
+    ("water", 8),
+]
+DEFAULT_MIN_ZOOM = 12
+MAX_LAT = 85.05112878
+
+
+def layer_name(file_name):
+    """gis_osm_buildings_a_free_1.json -> buildings_a"""
+    name = os.path.splitext(file_name)[0]
+    if name.startswith("gis_osm_"):
+        name = name[len("gis_osm_"):]
+    if name.endswith("_free_1"):
+        name = name[:-len("_free_1")]
+    return name
+
+def layer_min_zoom(name):
+    for key, zoom in LAYER_MIN_ZOOM:
+        if key in name:
+            return zoom
+    return DEFAULT_MIN_ZOOM
+
+def to_mercator(coords):
+    """(N, 2) lon/lat -> (N, 2) Web Mercator x, y in [0, 1], y growing southwards."""
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MAX_LAT, MAX_LAT)
+    s = np.sin(np.radians(lat))
+    return np.column_stack((lon / 360.0 + 0.5, 0.5 - 0.25 * np.log((1 + s) / (1 - s)) / np.pi))
+
+def douglas_peucker(points, tolerance):
+    """Indices of the vertices kept when simplifying a polyline (or closed ring)."""
+    n = len(points)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, b = points[i], points[j]
+        inner = points[i + 1:j] - a
+        d = b - a
+        length = math.hypot(d[0], d[1])
+        if length == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(d[0] * inner[:, 1] - d[1] * inner[:, 0]) / length
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            m = i + 1 + k
+            keep[m] = True
+            stack.append((i, m))
+            stack.append((m, j))
+    return np.nonzero(keep)[0]
+
+def tile_decimals(z):
+    """Decimal places that resolve one pixel at zoom z."""
+    return max(0, math.ceil(-math.log10(360.0 / (TILE_SIZE * (1 << z)))))
+
+
+# -----------------------------
+# One layer
+# -----------------------------
+class LayerTiles:
+    def __init__(self, name, layer, min_zoom=None):
+        self.name = name
+        self.layer = layer
+        self.min_zoom = layer_min_zoom(name) if min_zoom is None else min_zoom
+        self.merc = to_mercator(layer.coords) if len(layer.coords) else np.zeros((0, 2))
+        n_feat = len(layer)
+        self.bbox = np.full((n_feat, 4), np.nan)   # min_x, min_y, max_x, max_y (mercator)
+        if len(layer.part_feature):
+            starts = layer.part_start[:-1]
+            lo = np.minimum.reduceat(self.merc, starts, axis=0)
+            hi = np.maximum.reduceat(self.merc, starts, axis=0)
+            fmin = np.full((n_feat, 2), np.inf)
+            fmax = np.full((n_feat, 2), -np.inf)
+            np.minimum.at(fmin, layer.part_feature, lo)
+            np.maximum.at(fmax, layer.part_feature, hi)
+            self.bbox = np.hstack((fmin, fmax))
+        # Parts of each feature, in order
+        self._parts = [[] for _ in range(n_feat)]
+        for part, fid in enumerate(layer.part_feature.tolist()):
+            self._parts[fid].append(part)
+        self._simplified = {}   # (zoom, part) -> kept vertex indices (absolute)
+
+    def features_in(self, z, x0, y0, x1, y1):
+        b = self.bbox
+        with np.errstate(invalid="ignore"):
+            hit = (b[:, 2] >= x0) & (b[:, 0] <= x1) & (b[:, 3] >= y0) & (b[:, 1] <= y1)
+            pixel = 1.0 / (TILE_SIZE * (1 << z))
+            big = np.maximum(b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]) >= MIN_FEATURE_PX * pixel
+        return np.nonzero(hit & (big | (self.layer.kinds == POINT)))[0]
+
+    def _part_indices(self, z, part):
+        key = (z, part)
+        kept = self._simplified.get(key)
+        if kept is None:
+            start, end = self.layer.part_start[part], self.layer.part_start[part + 1]
+            tolerance = SIMPLIFY_PX / (TILE_SIZE * (1 << z))
+            kept = start + douglas_peucker(self.merc[start:end], tolerance)
+            self._simplified[key] = kept
+        return kept
+
+    def _ring(self, z, part, decimals, closed):
+        coords = np.round(self.layer.coords[self._part_indices(z, part)], decimals)
+        # Rounding can make neighbours identical; drop the repeats
+        if len(coords) > 1:
+            step = np.any(coords[1:] != coords[:-1], axis=1)
+            coords = coords[np.concatenate(([True], step))]
+        if closed and len(coords) < 4:
+            return None
+        if not closed and len(coords) < 2:
+            return None
+        return coords.tolist()
+
+    def feature(self, fid, z, decimals):
+        kind = self.layer.kinds[fid]
+        parts = self._parts[fid]
+        if not parts:
+            return None
+        if kind == POINT:
+            geometry = {"type": "Point",
+                        "coordinates": np.round(self.layer.coords[self.layer.part_start[parts[0]]], decimals).tolist()}
+        elif kind == LINE:
+            lines = [r for r in (self._ring(z, p, decimals, False) for p in parts) if r]
+            if not lines:
+                return None
+            geometry = ({"type": "LineString", "coordinates": lines[0]} if len(lines) == 1
+                        else {"type": "MultiLineString", "coordinates": lines})
+        elif kind == POLYGON:
+            polygons = []
+            for p in parts:
+                ring = self._ring(z, p, decimals, True)
+                if not self.layer.part_hole[p]:
+                    polygons.append([ring] if ring else None)
+                elif ring and polygons and polygons[-1] is not None:
+                    polygons[-1].append(ring)
+            polygons = [poly for poly in polygons if poly]
+            if not polygons:
+                return None
+            geometry = ({"type": "Polygon", "coordinates": polygons[0]} if len(polygons) == 1
+                        else {"type": "MultiPolygon", "coordinates": polygons})
+        else:
+            return None
+        return {
+            "type": "Feature",
+            "id": f"{self.name}:{fid}",
+            "properties": {"name": self.layer.names[fid], "layer": self.name},
+            "geometry": geometry,
+        }
+
+
+# -----------------------------
+# Tile set with a byte-bounded cache
+# -----------------------------
+class TileSet:
+    """All layers of a geojson_output folder, loaded on first use."""
+
+    def __init__(self, folder_path, cache_bytes=TILE_CACHE_BYTES):
+        self.folder_path = folder_path
+        self.cache_bytes = cache_bytes
+        self.layers = None
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._load_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+
+    def load(self):
+        with self._load_lock:
+            if self.layers is not None:
+                return self.layers
+            layers = OrderedDict()
+            for file_name in list_sources(self.folder_path):
+                try:
+                    geo = GeometryLayer.from_features(iter_features(os.path.join(self.folder_path, file_name)))
+                except Exception as e:
+                    print(f"Error loading {file_name}: {e}")
+                    continue
+                name = layer_name(file_name)
+                layers[name] = LayerTiles(name, geo)
+            self.layers = layers
+            return layers
+
+    def _remember(self, key, body):
+        with self._cache_lock:
+            if key in self._cache:
+                return
+            self._cache[key] = body
+            self.cached_bytes += len(body)
+            while self.cached_bytes > self.cache_bytes and self._cache:
+                _, old = self._cache.popitem(last=False)
+                self.cached_bytes -= len(old)
+
+    def tile(self, z, x, y, layers=None):
+        """Encoded GeoJSON FeatureCollection for tile z/x/y, or None if out of range."""
+        n = 1 << z if 0 <= z <= MAX_ZOOM else 0
+        if not (0 <= x < n and 0 <= y < n):
+            return None
+        all_layers = self.load()
+        names = tuple(sorted(all_layers if layers is None else set(layers) & set(all_layers)))
+        key = (z, x, y, names)
+        with self._cache_lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+
+        buffer = TILE_BUFFER_PX / TILE_SIZE
+        x0, x1 = (x - buffer) / n, (x + 1 + buffer) / n
+        y0, y1 = (y - buffer) / n, (y + 1 + buffer) / n
+        decimals = tile_decimals(z)
+        features = []
+        for name in names:
+            lt = all_layers[name]
+            if z < lt.min_zoom:
+                continue
+            for fid in lt.features_in(z, x0, y0, x1, y1).tolist():
+                feat = lt.feature(fid, z, decimals)
+                if feat is not None:
+                    features.append(feat)
+        body = json.dumps(
+            {"type": "FeatureCollection", "features": features},
+            ensure_ascii=False, separators=(",", ":"),
+        ).encode("utf-8")
+        self._remember(key, body)
+        return body
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._cache), "bytes": self.cached_bytes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("z", type=int)
+    parser.add_argument("x", type=int)
+    parser.add_argument("y", type=int)
+    parser.add_argument("--geojson", default="geojson_output")
+    parser.add_argument("--layers", default=None, help="comma-separated layer names")
+    args = parser.parse_args()
+    tiles = TileSet(args.geojson)
+    layers = args.layers.split(",") if args.layers else None
+    body = tiles.tile(args.z, args.x, args.y, layers)
+    if body is None:
+        parser.error("tile out of range")
+    data = json.loads(body)
+    print(f"{len(data['features'])} features, {len(body)} bytes")
+
+
+if __name__ == "__main__":
+    main()